@@ -0,0 +1,56 @@
+""" Microbenchmark of EventManager.fire against the uncompiled dispatch it replaced.
+
+Usage: python benchmarks/fire.py [plugins] [fires] """
+
+import os, sys
+import logging
+import timeit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+class Handler(core.Plugin):
+    def __init__(self, number):
+        core.Plugin.__init__(self)
+        self.name = "Handler %d" % number
+        self.uniquename = "handler-%d" % number
+
+    def handle(self, args):
+        return True
+
+def uncompiledFire(events, eventname, signalAll=False, **kwargs):
+    """ EventManager.fire as it was before dispatch tables, kept for comparison. """
+    if eventname in events._events:
+        kwargs["event"] = eventname
+        events._logger.info("Firing event %s. signalAll: %d" % (eventname, int(signalAll)))
+        returnStatus = [True, {}]
+        for plugin, functionname in events._events[eventname].values():
+            if events.system.plugins.isInactive(plugin.uniquename):
+                continue
+
+            func = getattr(plugin, functionname)
+            status = func(kwargs)
+            returnStatus[1][plugin.uniquename] = status
+            if not status:
+                returnStatus[0] = False
+        events._logger.info("%s status: %s" % (eventname, str(returnStatus)))
+        return returnStatus
+    return False
+
+def main(plugins=10, fires=100000):
+    logging.disable(logging.INFO)
+    system = core.System(autoStart=False)
+    system.events.registerEvent("Bench")
+    for number in range(plugins):
+        handler = Handler(number)
+        system.plugins.loadPlugin(handler)
+        system.events.registerPluginToEvent(handler, "Bench", "handle")
+
+    print("%d handlers, %d fires" % (plugins, fires))
+    for label, func in (("uncompiled fire", lambda: uncompiledFire(system.events, "Bench")),
+                        ("fire", lambda: system.events.fire("Bench")),
+                        ("fireFast", lambda: system.events.fireFast("Bench"))):
+        seconds = min(timeit.repeat(func, number=fires, repeat=3))
+        print("%-16s %8.3fs %10.0f fires/s" % (label, seconds, fires / seconds))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,100 @@
+""" Memory benchmark of signals, plugin nodes and fire results, against the dict based
+structures they replaced.
+
+Measures the bytes held by count live instances of each, with tracemalloc where it
+exists (Python 3.4+) and sys.getsizeof of the objects and their __dict__ otherwise.
+
+Usage: python benchmarks/memory.py [count] """
+
+import os, sys
+import gc
+import logging
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+try:
+    import tracemalloc
+except ImportError: # Python 2
+    tracemalloc = None
+
+class DictPluginNode:
+    """ PluginNode as it was before __slots__, kept for comparison. """
+    def __init__(self, plugin, dependency=[[]]):
+        self.plugin = plugin
+        self.dependency = dependency
+        self.state = core.PRELOADED
+        self.source = None
+
+class Handler(core.Plugin):
+    def __init__(self, number):
+        core.Plugin.__init__(self)
+        self.name = "Handler %d" % number
+        self.uniquename = "handler-%d" % number
+
+    def handle(self, args):
+        return True
+
+def dictFireResult(table, kwargs):
+    """ The result fire() built before FireResult, kept for comparison. """
+    succeeded = True
+    statuses = {}
+    for uniquename, func in table:
+        status = func(kwargs)
+        statuses[uniquename] = status
+        if not status:
+            succeeded = False
+    return [succeeded, statuses]
+
+def shallowSize(obj):
+    """ sys.getsizeof of an object, its __dict__, and the lists and dicts it holds, recursively """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        members = list(obj.values())
+    elif isinstance(obj, list):
+        members = obj
+    else:
+        members = [getattr(obj, name, None) for name in getattr(obj, "__slots__", ())]
+        if hasattr(obj, "__dict__"):
+            size += sys.getsizeof(obj.__dict__)
+            members += list(obj.__dict__.values())
+    return size + sum([shallowSize(member) for member in members if isinstance(member, (dict, list))])
+
+def measure(build, count):
+    """ Returns the bytes held by count objects made by build(number), per object """
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [build(number) for number in range(count)]
+        held = tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(objects)
+        tracemalloc.stop()
+    else:
+        objects = [build(number) for number in range(count)]
+        held = sum([shallowSize(obj) for obj in objects])
+    return held / float(count)
+
+def main(count=10000):
+    logging.disable(logging.INFO)
+    system = core.System(autoStart=False)
+    system.events.registerEvent("Bench")
+    for number in range(10):
+        handler = Handler(number)
+        system.plugins.loadPlugin(handler)
+        system.events.registerPluginToEvent(handler, "Bench", "handle")
+    table = system.events._getDispatch("Bench")
+    kwargs = {"event" : "Bench"}
+    plugin = Handler(0)
+
+    print("%d live instances, %s" % (count, "tracemalloc" if tracemalloc is not None else "sys.getsizeof"))
+    cases = (("signal", lambda number: core.constructSignalArguments(loaded=number),
+                        lambda number: core.Signal(loaded=number)),
+             ("plugin node", lambda number: DictPluginNode(plugin, [[]]),
+                             lambda number: core.PluginNode(plugin, [[]])),
+             ("fire result", lambda number: dictFireResult(table, kwargs),
+                             lambda number: system.events.fire("Bench")))
+    for label, before, after in cases:
+        old = measure(before, count)
+        new = measure(after, count)
+        print("%-12s %8.1f bytes -> %8.1f bytes each (%.0f%% less)" % (label, old, new, 100 * (1 - new / old)))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
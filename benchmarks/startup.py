@@ -0,0 +1,59 @@
+""" Startup analysis of plugin directories.
+
+Starts a System on the given directories with profiling on, then prints the
+critical path of the dependency graph weighed with the measured load() and
+prepare() times, the best parallel startup time against the serial and the
+parallelLoad ones, and the plugins to optimize first.
+
+Usage:
+    python benchmarks/startup.py [--byFile] [--dot graph.dot] [--json report.json] plugindir [plugindir ...] """
+
+import os, sys
+import logging
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+def write(path, text):
+    f = open(path, "w")
+    try:
+        f.write(text)
+    finally:
+        f.close()
+
+def main(arguments):
+    options = {"--dot" : None, "--json" : None}
+    byFile = False
+    plugindirs = []
+    while arguments:
+        argument = arguments.pop(0)
+        if argument == "--byFile":
+            byFile = True
+        elif argument in options:
+            options[argument] = arguments.pop(0)
+        else:
+            plugindirs.append(argument)
+    if not plugindirs:
+        raise SystemExit(__doc__)
+
+    logging.disable(logging.CRITICAL)
+    system = core.System(plugindirs, byFile=byFile, profile=True)
+    analysis = system.plugins.analyzeStartup()
+
+    print("%d plugins resolved, %d unresolved" % (len(analysis.order), len(analysis.errors)))
+    print("serial   %10.6fs" % analysis.serialTime)
+    print("waves    %10.6fs" % analysis.waveTime)
+    print("parallel %10.6fs (best possible)" % analysis.parallelTime)
+    print("critical path:")
+    for name in analysis.criticalPath():
+        print("    %-30s %10.6fs" % (name, analysis.costs[name]))
+    print("optimize first:")
+    for entry in analysis.serializing():
+        print("    %-30s %10.6fs  saves %10.6fs  (%s)" % (entry["uniquename"], entry["cost"], entry["gain"], entry["reason"]))
+
+    if options["--dot"]:
+        write(options["--dot"], analysis.toDOT())
+    if options["--json"]:
+        write(options["--json"], analysis.toJSON(indent=1))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
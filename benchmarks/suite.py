@@ -0,0 +1,228 @@
+""" Benchmark suite of system start, dependency resolution, imports and dispatch.
+
+Generates synthetic plugin trees on disk and times, for each tree:
+    start            System.start on the tree, imports included
+    importPlugins    PluginManager.importPlugins of the tree into a fresh system
+    buildLoadOrder   a full resolve of the dependency graph of the imported tree
+    fire             EventManager.fire of an event every plugin handles
+    signalAll        PluginManager.signalAll to every plugin
+    importAll        PluggableImports.importAll of one imports_ file per plugin
+    importAllLazy    the same with PluggableImports(lazy=True)
+    discoveryCold    System(lazyLoad=True) on the tree with a DiscoveryCache, no manifest yet
+    discoveryWarm    the same again, with the manifest the cold start wrote
+
+Shapes of the trees:
+    wide         every plugin depends on the first one
+    deep         every plugin depends on the one before it
+    diamond      layers of 8, every plugin depends on two plugins of the layer before
+    alternative  every plugin first asks for a missing plugin, then falls back on the one before it
+
+Every measurement that imports runs in a fresh interpreter, so modules are never
+served from an earlier case. Results are written as JSON, one record per
+measurement, with the commit they were taken at.
+
+Usage:
+    python benchmarks/suite.py [--sizes 10,100,1000] [--shapes wide,deep] [--output results.json]
+    python benchmarks/suite.py --compare old.json new.json """
+
+import os, sys
+import json
+import logging
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import timeit
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+SHAPES = ("wide", "deep", "diamond", "alternative")
+SIZES = (10, 100, 1000, 10000)
+DIAMOND_WIDTH = 8
+
+PLUGIN_TEMPLATE = '''class Plugin:
+    def __init__(self):
+        self.name = "Benchmark plugin %(number)d"
+        self.uniquename = "%(uniquename)s"
+        self.dependency = %(dependency)r
+
+    def load(self, system):
+        return True
+
+    def unload(self, system):
+        return True
+
+    def prepare(self, system):
+        return system.events.registerPluginToEvent(self, "Bench", "handle")
+
+    def handle(self, args):
+        return True
+
+    def signal(self, args):
+        pass
+
+plugins = (Plugin(), )
+
+lazyPlugins = [{"uniquename" : "%(uniquename)s", "dependency" : %(dependency)r, "events" : {"Bench" : "handle"}}]
+'''
+
+IMPORTS_TEMPLATE = '''class Class%(number)d:
+    pass
+
+def function%(number)d():
+    return %(number)d
+
+flags = {"listBased" : True, "prefix" : "bench.%(number)d."}
+
+imports = [Class%(number)d, function%(number)d]
+'''
+
+def dependencies(shape, number, tag):
+    """ Returns the dependency list of plugin number in a tree of the given shape """
+    name = lambda other: "%s-%d" % (tag, other)
+    if number == 0:
+        return [[]]
+    if shape == "wide":
+        return [[name(0)]]
+    elif shape == "deep":
+        return [[name(number - 1)]]
+    elif shape == "diamond":
+        if number < DIAMOND_WIDTH:
+            return [[]]
+        layer = number - number % DIAMOND_WIDTH - DIAMOND_WIDTH
+        return [[name(layer + number % DIAMOND_WIDTH), name(layer + (number + 1) % DIAMOND_WIDTH)]]
+    elif shape == "alternative":
+        return [["%s-missing-%d" % (tag, number)], [name(number - 1)]]
+    raise ValueError("Unknown shape %s" % shape)
+
+def generateTree(directory, shape, size):
+    """ Writes a tree of size plugins (plugin_*.py files) and as many imports_*.py files to directory.
+    Module and plugin names carry the shape and size, so trees never collide in sys.modules. """
+    tag = "%s%d" % (shape, size)
+    for number in range(size):
+        f = open(os.path.join(directory, "plugin_%s_%d.py" % (tag, number)), "w")
+        f.write(PLUGIN_TEMPLATE % {"number" : number, "uniquename" : "%s-%d" % (tag, number), "dependency" : dependencies(shape, number, tag)})
+        f.close()
+        f = open(os.path.join(directory, "imports_%s_%d.py" % (tag, number)), "w")
+        f.write(IMPORTS_TEMPLATE % {"number" : number})
+        f.close()
+
+def best(func, repeat, number=1):
+    """ Returns the best time of func over repeat runs of number calls, per call """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+def measure(kind, directory, size):
+    """ Runs one kind of measurement of the tree in directory. Called in a fresh interpreter. """
+    import core
+    logging.disable(logging.CRITICAL)
+    results = {}
+    if kind == "start":
+        began = timeit.default_timer()
+        core.System([directory], byFile=True)
+        results["start"] = timeit.default_timer() - began
+    elif kind == "plugins":
+        system = core.System(autoStart=False)
+        system.events.registerEvent("Bench")
+        system.plugins.loadPlugin(system)
+        began = timeit.default_timer()
+        system.plugins.importPlugins(directory, byFile=True)
+        results["importPlugins"] = timeit.default_timer() - began
+
+        repeat = max(3, min(100, 10000 // size))
+        # buildOptimalLoadOrder only catches up with changes once the graph is resolved, so time a fresh graph.
+        results["buildLoadOrder"] = best(lambda: core.DependencyGraph(system.plugins._preloadedPlugins).resolve(), repeat)
+        results["fire"] = best(lambda: system.events.fire("Bench"), repeat, number=10)
+        results["signalAll"] = best(lambda: system.plugins.signalAll(event="Bench"), repeat, number=10)
+        results["active"] = len([state for state in system.plugins.getPluginStates().values() if state == core.ACTIVE])
+    elif kind in ("importAll", "importAllLazy"):
+        began = timeit.default_timer()
+        core.PluggableImports([directory], lazy=(kind == "importAllLazy"))
+        results[kind] = timeit.default_timer() - began
+    elif kind in ("discoveryCold", "discoveryWarm"):
+        # Kept out of the tree, writing it there would change the directory's mtime.
+        manifest = directory + ".manifest.json"
+        if kind == "discoveryCold" and os.path.exists(manifest):
+            os.remove(manifest)
+        began = timeit.default_timer()
+        core.System([directory], byFile=True, lazyLoad=True, discoveryCache=manifest)
+        results[kind] = timeit.default_timer() - began
+    return results
+
+def runMeasurement(kind, directory, size):
+    """ Runs measure() in a fresh interpreter and returns its results """
+    output = subprocess.check_output([sys.executable, os.path.realpath(__file__), "--measure", kind, directory, str(size)])
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+def currentCommit():
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.STDOUT)
+        return output.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(shapes, sizes):
+    """ Benchmarks every shape at every size. Returns the result document. """
+    records = []
+    for shape in shapes:
+        for size in sizes:
+            directory = tempfile.mkdtemp(prefix="plugincore-bench-")
+            try:
+                generateTree(directory, shape, size)
+                for kind in ("start", "plugins", "importAll", "importAllLazy", "discoveryCold", "discoveryWarm"):
+                    results = runMeasurement(kind, directory, size)
+                    active = results.pop("active", None)
+                    for metric, seconds in sorted(results.items()):
+                        record = {"shape" : shape, "plugins" : size, "metric" : metric, "seconds" : seconds}
+                        if active is not None:
+                            record["active"] = active
+                        records.append(record)
+                        print("%-12s %6d %-15s %12.6fs" % (shape, size, metric, seconds))
+            finally:
+                shutil.rmtree(directory)
+                if os.path.exists(directory + ".manifest.json"):
+                    os.remove(directory + ".manifest.json")
+    return {"commit" : currentCommit(), "time" : time.time(), "python" : platform.python_version(),
+            "platform" : platform.platform(), "results" : records}
+
+def compare(oldPath, newPath):
+    """ Prints the ratio new / old of every measurement found in both result files """
+    def load(path):
+        f = open(path)
+        try:
+            document = json.load(f)
+        finally:
+            f.close()
+        return document, dict(((record["shape"], record["plugins"], record["metric"]), record["seconds"]) for record in document["results"])
+
+    oldDocument, old = load(oldPath)
+    newDocument, new = load(newPath)
+    print("%s -> %s" % (oldDocument.get("commit"), newDocument.get("commit")))
+    for key in sorted(set(old) & set(new)):
+        ratio = new[key] / old[key] if old[key] else float("inf")
+        print("%-12s %6d %-15s %12.6fs %12.6fs %7.2fx" % (key + (old[key], new[key], ratio)))
+
+def main(arguments):
+    if arguments[:1] == ["--measure"]:
+        print(json.dumps(measure(arguments[1], arguments[2], int(arguments[3]))))
+        return
+    if arguments[:1] == ["--compare"]:
+        compare(arguments[1], arguments[2])
+        return
+
+    options = {"--shapes" : ",".join(SHAPES), "--sizes" : ",".join([str(size) for size in SIZES]), "--output" : "benchmark-results.json"}
+    for option, value in zip(arguments[::2], arguments[1::2]):
+        if option not in options:
+            raise SystemExit("Unknown option %s" % option)
+        options[option] = value
+
+    document = run(options["--shapes"].split(","), [int(size) for size in options["--sizes"].split(",")])
+    f = open(options["--output"], "w")
+    try:
+        json.dump(document, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+    print("Results written to %s" % options["--output"])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -8,18 +8,61 @@ __email__ = "admin@thekks.net"
 __status__ = "Development"
 
 # importing some essential modules.
+# Modules only some features need (asyncio, ast, hashlib, json, multiprocessing) are imported
+# where they are used, so importing the core stays cheap.
 import os, sys
+import bisect
+import gc
+import itertools
 import logging
+import threading
+import time
+import traceback
+import types
+from collections import deque, OrderedDict
+try:
+    from importlib import reload as reloadModule
+except ImportError: # Python 2
+    reloadModule = reload
+try:
+    from _imp import lock_held as importLockHeld
+except ImportError: # Python 2
+    from imp import lock_held as importLockHeld
 logger = logging.getLogger("core")
-# Set logging basic formats
-logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.DEBUG)
+# The core leaves configuring logging to the application, see helloworldprogram.py.
 
-# Just an exception with a different name
-class DependencyNotSatisfiedError(Exception): pass
+class DependencyNotSatisfiedError(Exception):
+    """ Raised when a plugin's dependencies cannot be satisfied.
+        plugin - uniquename of the plugin that cannot be loaded
+        missing - uniquenames it depends on that were never preloaded
+        blocking - preloaded uniquenames it depends on that could not be resolved either """
+    def __init__(self, message, plugin=None, missing=(), blocking=()):
+        Exception.__init__(self, message)
+        self.plugin = plugin
+        self.missing = tuple(missing)
+        self.blocking = tuple(blocking)
+
+class DependencyCycleError(DependencyNotSatisfiedError):
+    """ Raised when a plugin can only be satisfied through a dependency cycle.
+        cycle - uniquenames of the plugins forming the cycle """
+    def __init__(self, message, plugin=None, missing=(), blocking=(), cycle=()):
+        DependencyNotSatisfiedError.__init__(self, message, plugin, missing, blocking)
+        self.cycle = tuple(cycle)
 
 class PlaceHolder: pass
 placeholder = PlaceHolder()
 
+CO_COROUTINE = 0x80 # inspect.CO_COROUTINE
+
+def isCoroutineFunction(func):
+    """ asyncio.iscoroutinefunction without importing asyncio: func is an async def, or was
+    marked as a coroutine by asyncio, which then was imported already. """
+    code = getattr(func, "__code__", None)
+    if code is not None and code.co_flags & CO_COROUTINE:
+        return True
+    asyncio = sys.modules.get("asyncio")
+    return asyncio is not None and asyncio.iscoroutinefunction(func)
+
 def constructSignalArguments(**kwargs):
     """ Construct a dictionary with required arguments there. 
         Prevents issue with KeyErrors.
@@ -39,13 +82,829 @@ def constructSignalArguments(**kwargs):
     
     return signal
 
-class PluginNode:
+class Signal(object):
+    """ The arguments a plugin's signal() receives. Immutable, and compatible with the dict
+    constructSignalArguments builds: it indexes, iterates, compares and converts like one.
+    The five standard fields live in slots; any other argument goes into a dict that is
+    only allocated when there is one. signalAll hands the same instance to every plugin. """
+    __slots__ = ("loaded", "unloaded", "event", "signaller", "system", "_extra")
+    FIELDS = ("loaded", "unloaded", "event", "signaller", "system")
+    
+    def __init__(self, loaded=None, unloaded=None, event=None, signaller=None, system=None, **extra):
+        initialize = object.__setattr__
+        initialize(self, "loaded", loaded)
+        initialize(self, "unloaded", unloaded)
+        initialize(self, "event", event)
+        initialize(self, "signaller", signaller)
+        initialize(self, "system", system)
+        initialize(self, "_extra", extra or None)
+    
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError("Signals are shared between plugins and cannot be modified.")
+    
+    __setattr__ = __delattr__ = __setitem__ = __delitem__ = _readOnly
+    clear = pop = popitem = setdefault = update = _readOnly
+    
+    def __getitem__(self, key):
+        if key in Signal.FIELDS:
+            return getattr(self, key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __contains__(self, key):
+        return key in Signal.FIELDS or (self._extra is not None and key in self._extra)
+    
+    has_key = __contains__
+    
+    def keys(self):
+        if self._extra is None:
+            return list(Signal.FIELDS)
+        return list(Signal.FIELDS) + list(self._extra)
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(Signal.FIELDS) + len(self._extra or ())
+    
+    def values(self):
+        return [self[key] for key in self.keys()]
+    
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+    
+    def copy(self):
+        """ Returns a plain, modifiable dict of the signal """
+        return dict(self.items())
+    
+    def __eq__(self, other):
+        if isinstance(other, (Signal, dict)):
+            return self.copy() == dict(other.items())
+        return NotImplemented
+    
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return "Signal(%s)" % ", ".join(["%s=%r" % item for item in self.items()])
+    
+    def __reduce__(self):
+        return (_rebuildSignal, (self.copy(), ))
+
+def _rebuildSignal(arguments):
+    return Signal(**arguments)
+
+class FireResult(list):
+    """ What EventManager.fire returns: the [allSucceeded, {uniquename: status}] list it always was,
+    a list in every respect (json.dumps, pickling, mutation), its items also reachable as the
+    succeeded and statuses attributes. FIRE_FIRST_TRUTHY results carry the uniquename that
+    answered as a third item, answered. """
+    __slots__ = ()
+    
+    @property
+    def succeeded(self):
+        return self[0]
+    
+    @property
+    def statuses(self):
+        """ The dict of uniquename -> status of the handlers called """
+        return self[1]
+    
+    @property
+    def answered(self):
+        return self[2] if len(self) > 2 else None
+
+def _statusesOf(table, values):
+    """ The dict of uniquename -> status out of the statuses values lined up with a dispatch table """
+    return dict(zip([entry[0] for entry in table], values))
+
+try:
+    stringTypes = basestring
+except NameError: # Python 3
+    stringTypes = str
+
+# Modes of EventManager.fire
+FIRE_ALL = "all"
+FIRE_FIRST_TRUTHY = "firstTruthy"
+FIRE_UNTIL_FAILURE = "untilFailure"
+
+# States of a plugin in the PluginRegistry
+PRELOADED = "preloaded"
+ACTIVE = "active"
+INACTIVE = "inactive"
+
+# Layout of the dict System.snapshot() returns, bumped whenever it changes
+SNAPSHOT_VERSION = 1
+
+class PluginNode(object):
     """ A node for a plugin in a dependency of plugins """
     # TODO: Add support for parents, not just child.
+    __slots__ = ("plugin", "dependency", "state", "source")
+    
     def __init__(self, plugin, dependency=[[]]):
         self.plugin = plugin
         self.dependency = dependency
+        self.state = PRELOADED
+        self.source = None # (modulename, attribute name) the plugin was imported from
+
+class PluginRegistry:
+    """ Every plugin the PluginManager knows of, indexed by uniquename and by identity.
+    The state of a plugin is held on its PluginNode; the preloaded, active and
+    inactive dicts are kept in step with it, so every lookup and state
+    transition is O(1). Only the registry should modify them. """
+    def __init__(self):
+        self.nodes = {} # uniquename -> PluginNode
+        self.identities = {} # id(plugin) -> PluginNode
+        self.preloaded = {} # uniquename -> PluginNode of every preloaded plugin
+        self.active = {} # uniquename -> plugin
+        self.inactive = {} # uniquename -> plugin
+        self.modules = {} # modulename -> set of uniquenames imported from it
+    
+    def find(self, plugin):
+        """ Returns the PluginNode of a uniquename or plugin instance, or None """
+        if isinstance(plugin, stringTypes):
+            return self.nodes.get(plugin)
+        node = self.identities.get(id(plugin))
+        if node is not None and node.plugin is plugin:
+            return node
+        return None
+    
+    def _nodeFor(self, plugin):
+        """ Returns the node of plugin, creating it, or moving the uniquename over to this instance. """
+        node = self.nodes.get(plugin.uniquename)
+        if node is None:
+            node = PluginNode(plugin, getattr(plugin, "dependency", [[]]))
+            self.nodes[plugin.uniquename] = node
+        elif node.plugin is not plugin:
+            self.identities.pop(id(node.plugin), None)
+            node.plugin = plugin
+            node.dependency = getattr(plugin, "dependency", node.dependency)
+            if node.state != PRELOADED:
+                self.setState(node, PRELOADED)
+        self.identities[id(plugin)] = node
+        return node
+    
+    def preload(self, plugin, source=None):
+        """ Registers plugin as preloaded and returns its node.
+        source is the (modulename, attribute name) it came from, if known. """
+        node = self._nodeFor(plugin)
+        self.preloaded[plugin.uniquename] = node
+        if source is not None:
+            node.source = source
+            self.modules.setdefault(source[0], set()).add(plugin.uniquename)
+        return node
+    
+    def setState(self, plugin, state):
+        """ Moves a plugin (instance or node) to PRELOADED, ACTIVE or INACTIVE """
+        node = plugin if isinstance(plugin, PluginNode) else self._nodeFor(plugin)
+        name = node.plugin.uniquename
+        if node.state == ACTIVE:
+            del self.active[name]
+        elif node.state == INACTIVE:
+            del self.inactive[name]
+        
+        node.state = state
+        if state == ACTIVE:
+            self.active[name] = node.plugin
+        elif state == INACTIVE:
+            self.inactive[name] = node.plugin
+        return node
+    
+    def release(self, node):
+        """ Takes a plugin out of the active and inactive lists.
+        It stays registered as PRELOADED if it was preloaded, otherwise it is forgotten. """
+        self.setState(node, PRELOADED)
+        name = node.plugin.uniquename
+        if name not in self.preloaded:
+            del self.nodes[name]
+            self.identities.pop(id(node.plugin), None)
+    
+    def forget(self, node):
+        """ Takes a plugin out of the registry altogether, preloaded or not. """
+        self.setState(node, PRELOADED)
+        name = node.plugin.uniquename
+        self.preloaded.pop(name, None)
+        self.nodes.pop(name, None)
+        self.identities.pop(id(node.plugin), None)
+        if node.source is not None and node.source[0] in self.modules:
+            self.modules[node.source[0]].discard(name)
+            if not self.modules[node.source[0]]:
+                del self.modules[node.source[0]]
+
+class DependencyGraph:
+    """ An indexed graph of preloaded plugins.
+    resolve() orders it with a Kahn-style topological sort generalized to the
+    alternative dependency sets. A plugin takes the first alternative it lists
+    that can be satisfied: once every name of an alternative is ready, the
+    plugin is ready unless an earlier alternative of it only names preloaded
+    plugins, in which case it waits on that one too. Only when the sort stalls
+    does a plugin left waiting give up on the alternative it waits on, one
+    alternative at a time, picked so the outcome doesn't depend on the order
+    plugins came in. Runs in O(V+E) without recursion, bar those stalls.
+    The counts the sort runs on are kept afterwards, so add(), invalidate() and
+    update() maintain the order as plugins come and go, only touching the
+    plugins involved and those depending on them, and end up where a full
+    resolve would. Once a stall is involved they resolve everything again. """
+    def __init__(self, nodes):
+        self.nodes = nodes # uniquename -> PluginNode
+        self.order = [] # uniquenames in load order
+        self.chosen = {} # uniquename -> the alternative that satisfied it
+        self.levels = {} # uniquename -> longest chain of dependencies below it
+        self.dependents = {} # uniquename -> set of uniquenames that chose it
+        self.errors = {} # uniquename -> DependencyNotSatisfiedError
+        self.known = set() # uniquenames of the nodes accounted for, resolved or not
+        self.unresolved = set()
+        self.resolved = False # whether resolve() ran
+        # For every dependency name, the (plugin, alternative) pairs waiting on it.
+        self._waiting = {}
+        # How many names of an alternative are still not ready.
+        self._remaining = {}
+        # For every dependency name, the plugins of the order listing it in an alternative before the one they chose.
+        self._earlier = {}
+        # The (plugin, alternative) pairs given up on when the sort stalled, and those plugins.
+        self._abandoned = set()
+        self._fellBack = set()
+    
+    def resolve(self):
+        """ Builds the load order. Unresolvable plugins end up in self.errors. """
+        self.order = []
+        self.chosen = {}
+        self.levels = {}
+        self.dependents = {}
+        self.known = set(self.nodes)
+        self.unresolved = set()
+        self._waiting = {}
+        self._remaining = {}
+        self._earlier = {}
+        self._abandoned = set()
+        self._fellBack = set()
+        self.resolved = True
+        
+        self._resolveNames(list(self.nodes))
+        return self.order
+    
+    def restore(self, order, chosen, unresolved=()):
+        """ Takes the order resolved earlier over the same nodes, as System.snapshot() saved it,
+        instead of resolving. chosen is the alternative each plugin of the order chose. """
+        self.order = []
+        self.chosen = {}
+        self.levels = {}
+        self.dependents = {}
+        self.known = set(self.nodes)
+        self.unresolved = set()
+        self._waiting = {}
+        self._remaining = {}
+        self._earlier = {}
+        self._abandoned = set()
+        self._fellBack = set()
+        self.resolved = True
+        
+        for name in order:
+            self._satisfy(name, chosen[name])
+            self.order.append(name)
+            for alternative in self.nodes[name].dependency or [[]]:
+                if set(alternative) == set(chosen[name]):
+                    break
+                if not [dep for dep in alternative if dep not in self.nodes]:
+                    # An earlier alternative only names preloaded plugins, so the plugin fell back on a stall.
+                    self._fellBack.add(name)
+                    break
+        # Brings back the errors, and the counts add() needs should one of them be completed later.
+        self._resolveNames(list(unresolved))
+        return self.order
+    
+    def add(self, names):
+        """ Resolves plugins just added to the nodes against the current order, along with the
+        unresolved plugins they complete. Plugins of the order that now have an earlier
+        alternative satisfied are taken out of it, with their dependents, and resolved again,
+        so they take that alternative as a full resolve would.
+        Returns the uniquenames appended to the order, those resolved again included. """
+        return self._add(names)[1]
+    
+    def _add(self, names):
+        """ add(), returning (uniquenames taken out of the order, uniquenames appended to it) """
+        names = [name for name in names if name in self.nodes and name not in self.known]
+        self.known.update(names)
+        return self._incremental(lambda: self._moveEarlier([], self._resolveNames(names)))
+    
+    def invalidate(self, names):
+        """ Takes names and every plugin that chose them, transitively, out of the order, forgets
+        those no longer in the nodes and resolves the others again against what is left, for
+        when plugins were removed or their dependencies changed. Like add(), moves the plugins
+        of the order an earlier alternative of which the plugins resolved again satisfy.
+        Returns (uniquenames taken out of the order, uniquenames appended to it). """
+        def update():
+            removed, appended = self._invalidate(names)
+            return self._moveEarlier(removed, appended)
+        return self._incremental(update)
+    
+    def _incremental(self, update):
+        """ Runs update, which resolves part of the graph and returns (removed, appended).
+        Which plugin falls back when the sort stalls depends on the whole set of plugins left
+        waiting, so once a stall is involved, the graph is resolved again as a whole instead:
+        the plugins whose choice changed, along with their dependents, are then reported as
+        taken out of the order and appended to it. """
+        if not self._fellBack:
+            order, chosen = list(self.order), dict(self.chosen)
+            result = update()
+            if not self._fellBack:
+                return result
+        else:
+            order, chosen = self.order, self.chosen
+        self.resolve()
+        
+        changed = set([name for name in chosen if chosen[name] != self.chosen.get(name)])
+        changed.update([name for name in self.chosen if name not in chosen])
+        pending = list(changed)
+        while pending:
+            for dependent in self.dependents.get(pending.pop(), ()):
+                if dependent not in changed:
+                    changed.add(dependent)
+                    pending.append(dependent)
+        return [name for name in order if name in changed], [name for name in self.order if name in changed]
+    
+    def _invalidate(self, names):
+        """ invalidate() without moving plugins to earlier alternatives """
+        affected = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in affected:
+                affected.add(name)
+                pending.extend(self.dependents.get(name, ()))
+        
+        removed = [name for name in self.order if name in affected]
+        if removed:
+            self.order = [name for name in self.order if name not in affected]
+        for name in affected:
+            for dep in self.chosen.pop(name, ()):
+                if dep in self.dependents:
+                    self.dependents[dep].discard(name)
+            self.levels.pop(name, None)
+            if name not in self.nodes:
+                self.known.discard(name)
+                self.unresolved.discard(name)
+                self.dependents.pop(name, None)
+        
+        # The counts of the unresolved plugins may be off now, so they are taken again.
+        again = [name for name in removed if name in self.nodes]
+        again.extend([name for name in affected if name in self.known and name not in again])
+        again.extend([name for name in self.unresolved if name not in affected])
+        self._waiting = {}
+        self._remaining = {}
+        return removed, self._resolveNames(again)
+    
+    def update(self):
+        """ Catches up with plugins added to or removed from the nodes since the last call.
+        Returns (uniquenames taken out of the order, uniquenames appended to it). """
+        gone = [name for name in self.known if name not in self.nodes]
+        removed, appended = self.invalidate(gone) if gone else ([], [])
+        out, fresh = self._add([name for name in self.nodes if name not in self.known])
+        removed = removed + [name for name in out if name not in removed]
+        appended = [name for name in appended if name not in out] + fresh
+        return removed, appended
+    
+    def _resolveNames(self, names):
+        """ Sorts names in behind the current order, as far as their dependencies allow. """
+        start = len(self.order)
+        ready = deque()
+        # Plugins with a ready alternative behind an earlier one that may still be satisfied.
+        deferred = []
+        for name in names:
+            self._wait(name)
+            self._offer(name, ready, deferred)
+        
+        while True:
+            while ready:
+                name = ready.popleft()
+                self.order.append(name)
+                for pluginname, i in self._waiting.pop(name, ()):
+                    key = (pluginname, i)
+                    if pluginname in self.chosen or key not in self._remaining:
+                        continue
+                    self._remaining[key] -= 1
+                    if not self._remaining[key]:
+                        self._offer(pluginname, ready, deferred)
+            
+            # Stalled: a deferred plugin has to give up on the alternative it waits on.
+            deferred = [name for name in deferred if name not in self.chosen]
+            if not deferred:
+                break
+            name, given = self._fallback(deferred)
+            deferred = [other for other in deferred if other != name]
+            for i in given:
+                self._abandoned.add((name, i))
+            self._fellBack.add(name)
+            self._offer(name, ready, deferred)
+        
+        self.errors = {}
+        if self.unresolved:
+            self._collectErrors()
+        return self.order[start:]
+    
+    def _moveEarlier(self, removed, appended):
+        """ Takes the plugins that have an earlier alternative satisfied by those just appended
+        out of the order, with their dependents, and resolves them again, until none is left.
+        removed and appended are what was taken out of and appended to the order so far;
+        returns them, updated. """
+        fresh = appended
+        moved = set()
+        while fresh:
+            stale = [name for name in self._satisfiedEarlier(fresh) if name not in moved]
+            if not stale:
+                break
+            # A plugin moves once, it would otherwise go round a cycle through its own dependents.
+            moved.update(stale)
+            out, fresh = self._invalidate(stale)
+            removed = removed + [name for name in out if name not in removed]
+            appended = [name for name in appended if name not in out] + fresh
+        return removed, appended
+    
+    def _fallback(self, deferred):
+        """ Picks the alternatives a plugin gives up on when the sort stalls. A deferred plugin
+        whose earlier alternatives cannot be satisfied at all gives them up. Otherwise every
+        unresolved plugin waits on the first alternative it could still be satisfied by, and a
+        plugin of a cycle of such waits that waits on nothing else gives its alternative up:
+        one that stays as easy to satisfy without it first, so no plugin that could be
+        resolved is left out, then one with a ready alternative. Ties go to the first by
+        uniquename, so the outcome doesn't depend on the order plugins came in.
+        Returns (uniquename, indices of the alternatives it gives up). """
+        ranks = self._ranks()
+        deferred = set(deferred)
+        edges = {}
+        wanted = {}
+        safe = set() # plugins satisfied as early by another alternative than the one they wait on
+        hopeless = {}
+        for name in self.unresolved:
+            edges[name] = []
+            alternatives = self.nodes[name].dependency or [[]]
+            usable = [i for i, alternative in enumerate(alternatives) if (name, i) not in self._abandoned
+                      and not [dep for dep in alternative if dep not in self.chosen and dep not in ranks]]
+            if not usable:
+                continue
+            if self._remaining.get((name, usable[0])) == 0:
+                if name in deferred:
+                    hopeless[name] = [i for i in range(usable[0]) if (name, i) not in self._abandoned]
+                continue
+            wanted[name] = usable[0]
+            edges[name] = [dep for dep in alternatives[usable[0]] if dep in self.unresolved]
+            for i in usable[1:]:
+                if max([ranks[dep] for dep in alternatives[i] if dep not in self.chosen] or [-1]) < ranks[name]:
+                    safe.add(name)
+                    break
+        if hopeless:
+            name = min(hopeless)
+            return name, hopeless[name]
+        
+        sinks = []
+        components = dict((id(component), component) for component in self._findCycles(self.unresolved, edges).values())
+        for component in components.values():
+            members = set(component)
+            if not [dep for member in component for dep in edges[member] if dep not in members]:
+                sinks.extend(component)
+        if sinks:
+            name = min(sinks, key=lambda name: (name not in safe, name not in deferred, name))
+            return name, [wanted[name]]
+        name = min(deferred)
+        return name, [self._waitedOn(name)]
     
+    def _ranks(self):
+        """ The unresolved plugins one of whose alternatives could be satisfied, mapped to how
+        many plugins deep the shortest way to satisfy them goes, 0 when an alternative is ready. """
+        remaining = {}
+        waiting = {}
+        found = deque()
+        for name in self.unresolved:
+            for i, alternative in enumerate(self.nodes[name].dependency or [[]]):
+                if (name, i) in self._abandoned:
+                    continue
+                missing = set([dep for dep in alternative if dep not in self.chosen])
+                remaining[(name, i)] = len(missing)
+                for dep in missing:
+                    waiting.setdefault(dep, []).append((name, i))
+                if not missing:
+                    found.append((name, 0))
+        
+        # Breadth first, so plugins are reached by their shortest way first.
+        ranks = {}
+        while found:
+            name, rank = found.popleft()
+            if name in ranks:
+                continue
+            ranks[name] = rank
+            for key in waiting.get(name, ()):
+                remaining[key] -= 1
+                if not remaining[key]:
+                    found.append((key[0], rank + 1))
+        return ranks
+    
+    def _satisfiedEarlier(self, names):
+        """ Plugins of the order with an alternative listing one of names, before the one they
+        chose, that has all its names in the order. Plugins among names were just resolved
+        and are left be. """
+        fresh = set(names)
+        stale = []
+        for name in names:
+            for pluginname in self._earlier.get(name, ()):
+                chosen = self.chosen.get(pluginname)
+                if chosen is None or pluginname in fresh or pluginname in stale:
+                    continue
+                for alternative in self.nodes[pluginname].dependency or [[]]:
+                    if set(alternative) == set(chosen):
+                        break
+                    if name in alternative and not [dep for dep in alternative if dep not in self.chosen]:
+                        stale.append(pluginname)
+                        break
+        return stale
+    
+    def _wait(self, name):
+        """ Records how many names of each alternative of a plugin are not resolved yet, and
+        what they wait on. An empty alternative needs nothing. """
+        alternatives = self.nodes[name].dependency or [[]]
+        for i, alternative in enumerate(alternatives):
+            self._abandoned.discard((name, i))
+            missing = set([dep for dep in alternative if dep not in self.chosen])
+            self._remaining[(name, i)] = len(missing)
+            for dep in missing:
+                self._waiting.setdefault(dep, set()).add((name, i))
+        self.unresolved.add(name)
+    
+    def _offer(self, name, ready, deferred):
+        """ Satisfies a plugin with its first ready alternative, unless an alternative listed
+        before it only names preloaded plugins, in which case the plugin is deferred if it has
+        a ready alternative. Alternatives given up on are passed over. """
+        alternatives = self.nodes[name].dependency or [[]]
+        for i, alternative in enumerate(alternatives):
+            if (name, i) in self._abandoned:
+                continue
+            if self._remaining.get((name, i)) == 0:
+                self._satisfy(name, alternative)
+                ready.append(name)
+                return
+            if not [dep for dep in alternative if dep not in self.nodes]:
+                if [j for j in range(i + 1, len(alternatives)) if self._remaining.get((name, j)) == 0]:
+                    deferred.append(name)
+                return
+    
+    def _waitedOn(self, name):
+        """ The index of the alternative a deferred plugin waits on """
+        for i, alternative in enumerate(self.nodes[name].dependency or [[]]):
+            if (name, i) not in self._abandoned and not [dep for dep in alternative if dep not in self.nodes]:
+                return i
+    
+    def _satisfy(self, name, alternative):
+        chosen = []
+        for dep in alternative:
+            if dep not in chosen:
+                chosen.append(dep)
+        self.chosen[name] = tuple(chosen)
+        for listed in self.nodes[name].dependency or [[]]:
+            if set(listed) == set(chosen):
+                break
+            for dep in listed:
+                self._earlier.setdefault(dep, set()).add(name)
+        self.unresolved.discard(name)
+        self.levels[name] = max([self.levels[dep] + 1 for dep in chosen] or [0])
+        for dep in chosen:
+            self.dependents.setdefault(dep, set()).add(name)
+    
+    def _collectErrors(self):
+        unresolved = self.unresolved
+        cycles = self._findCycles(unresolved)
+        
+        for name in unresolved:
+            missing = []
+            blocking = []
+            for alternative in self.nodes[name].dependency:
+                for dep in alternative:
+                    if dep not in self.nodes:
+                        if dep not in missing:
+                            missing.append(dep)
+                    elif dep in unresolved and dep not in blocking:
+                        blocking.append(dep)
+            
+            if name in cycles:
+                self.errors[name] = DependencyCycleError("%s is part of a dependency cycle: %s" % (name, " -> ".join(cycles[name])),
+                                                         name, missing, blocking, cycles[name])
+            else:
+                self.errors[name] = DependencyNotSatisfiedError("%s cannot be loaded. Missing plugins: %s. Unresolved dependencies: %s" % (name, missing, blocking),
+                                                                name, missing, blocking)
+    
+    def _findCycles(self, unresolved, edges=None):
+        """ Tarjan's strongly connected components over the unresolved plugins, done iteratively.
+        edges is uniquename -> the unresolved plugins it depends on, through any alternative by default.
+        Returns a dict of uniquename -> tuple of the members of its cycle. """
+        if edges is None:
+            edges = {}
+            for name in unresolved:
+                edges[name] = [dep for alternative in self.nodes[name].dependency for dep in alternative if dep in unresolved]
+        
+        index = {}
+        low = {}
+        stack = []
+        onStack = set()
+        cycles = {}
+        counter = 0
+        for root in unresolved:
+            if root in index:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            onStack.add(root)
+            work = [(root, iter(edges[root]))]
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index:
+                        index[child] = low[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        onStack.add(child)
+                        work.append((child, iter(edges[child])))
+                        break
+                    elif child in onStack:
+                        low[node] = min(low[node], index[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            onStack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in edges[node]:
+                            component.reverse()
+                            component = tuple(component)
+                            for member in component:
+                                cycles[member] = component
+        return cycles
+    
+# Clock of the durations the core measures, and the Profiler and Tracer with it.
+wallClock = getattr(time, "perf_counter", time.time)
+
+def isEventPattern(eventname):
+    """ Whether an event name is a wildcard pattern: one with a "*" or "#" segment """
+    segments = eventname.split(".")
+    return "*" in segments or "#" in segments
+
+class EventPatternTrie:
+    """ The wildcard patterns events are subscribed with, in a trie of their dot separated
+    segments. "*" matches exactly one segment and "#" matches any number of them, none
+    included, so "request.#" matches "request", "request.get" and "request.http.get". """
+    def __init__(self):
+        # segment -> child node; the None key holds the pattern ending at a node.
+        self.root = {}
+        # pattern -> order it was added in, to merge handlers of several patterns in a stable order.
+        self.patterns = {}
+        self._added = 0
+    
+    def __len__(self):
+        return len(self.patterns)
+    
+    def add(self, pattern):
+        if pattern in self.patterns:
+            return
+        node = self.root
+        for segment in pattern.split("."):
+            node = node.setdefault(segment, {})
+        node[None] = pattern
+        self.patterns[pattern] = self._added
+        self._added += 1
+    
+    def remove(self, pattern):
+        if self.patterns.pop(pattern, None) is None:
+            return
+        path = [self.root]
+        for segment in pattern.split("."):
+            path.append(path[-1][segment])
+        del path[-1][None]
+        # Prune the nodes left empty, deepest first.
+        for parent, segment, node in reversed(list(zip(path, pattern.split("."), path[1:]))):
+            if node:
+                break
+            del parent[segment]
+    
+    def match(self, eventname):
+        """ Returns the patterns matching an event name, in the order they were added """
+        segments = eventname.split(".")
+        count = len(segments)
+        found = set()
+        # (node, segments consumed, whether node was reached through "#" and may consume more)
+        stack = [(self.root, 0, False)]
+        seen = set()
+        while stack:
+            state = stack.pop()
+            node, index, hashed = state
+            if (id(node), index, hashed) in seen:
+                continue
+            seen.add((id(node), index, hashed))
+            
+            if "#" in node:
+                stack.append((node["#"], index, True))
+            if index == count:
+                if None in node:
+                    found.add(node[None])
+                continue
+            if hashed:
+                stack.append((node, index + 1, True))
+            if segments[index] in node:
+                stack.append((node[segments[index]], index + 1, False))
+            if "*" in node:
+                stack.append((node["*"], index + 1, False))
+        return sorted(found, key=self.patterns.get)
+
+def signalKey(args):
+    """ The default cache key of a cacheable handler: every argument it is fired with """
+    return tuple(sorted(args.items()))
+
+def cacheable(key=signalKey, maxsize=128, ttl=None):
+    """ Decorates an event handler whose status only depends on its arguments, so fire() serves
+    it from a HandlerCache instead of calling it again.
+    key maps the arguments of a fire to a hashable key; arguments it fails on (TypeError) are
+    not cached. maxsize bounds the cache, least recently used entries going first, and ttl,
+    in seconds, expires entries. Each event the handler is registered to has its own cache,
+    dropped with EventManager.invalidateCache and whenever the plugin is unloaded, reloaded
+    or put to inactive. Coroutine handlers are never cached. """
+    def decorate(func):
+        func.cacheOptions = (key, maxsize, ttl)
+        return func
+    return decorate
+
+class HandlerCache:
+    """ A bounded LRU cache of the statuses of one cacheable handler on one event, with
+    optional expiry. Counts hits and misses. Thread safe, as handlers can be fired from
+    the workers of an EventQueue. """
+    def __init__(self, key=signalKey, maxsize=128, ttl=None):
+        self.key = key
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (status, expiry time or None), least recently used first.
+        self._entries = OrderedDict()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get(self, key):
+        """ Returns (True, status) if key is cached and fresh, (False, None) otherwise """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and (entry[1] is None or entry[1] > wallClock()):
+                self._entries[key] = entry
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+    
+    def put(self, key, status):
+        expiry = wallClock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (status, expiry)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        return {"hits" : self.hits, "misses" : self.misses, "size" : len(self._entries)}
+    
+    def wrap(self, func):
+        """ Returns func serving its statuses from this cache """
+        keyOf = self.key
+        def cached(kwargs):
+            try:
+                key = keyOf(kwargs)
+                hash(key)
+            except TypeError: # Unhashable arguments, not cacheable.
+                return func(kwargs)
+            found, status = self.get(key)
+            if not found:
+                status = func(kwargs)
+                self.put(key, status)
+            return status
+        return cached
+
 class EventManager:
     """ The event manager. It managers all the events"""
     
@@ -53,218 +912,1210 @@ class EventManager:
         self.system = system
         self._logger = logging.getLogger("core.EventManager")
             
+        # eventname -> OrderedDict of (id(plugin), functionname) -> (plugin, functionname), in registration order.
         self._events = {}
+        # eventname -> {(id(plugin), functionname): (-priority, sequence, key)}, the rank of every handler,
+        # and eventname -> sorted list of those ranks, the dispatch order. The sequence keeps equal
+        # priorities in registration order.
+        self._ranks = {}
+        self._orders = {}
+        self._sequence = itertools.count()
+        # id(plugin) -> {eventname: [functionname, ...]}, the reverse index of self._events.
+        self._subscriptions = {}
+        # eventname -> tuple of (uniquename, bound method), compiled from self._events on demand.
+        self._dispatch = {}
+        # The same for names no event is registered under, only wildcard patterns, least recently
+        # fired first. None stands for a table to compile again. Only the last dispatchCacheSize
+        # names are kept; evicting one forgets its handler caches and trace count too.
+        self._derived = OrderedDict()
+        self.dispatchCacheSize = 1024
+        # The wildcard patterns among self._events, matched against the names fired.
+        self._patterns = EventPatternTrie()
+        # Guards the registration tables against load() running on several threads under parallelLoad.
+        self._lock = threading.RLock()
+        # Events whose dispatch table calls into isolated plugins.
+        self._isolatedEvents = set()
+        # Events whose dispatch table has coroutine handlers, which only fireAsync awaits.
+        self._coroutineEvents = set()
+        # eventname -> {(uniquename, functionname): HandlerCache} of the cacheable handlers fired.
+        self._caches = {}
+        # A Profiler timing every handler, if profiling is enabled.
+        self.profiler = None
+        # A Tracer recording spans of fires and handlers, if tracing is enabled.
+        self.tracer = None
+        # One in every traceEvery fires of each event is traced to the "core.trace" logger, 0 traces none.
+        self.traceEvery = 0
+        self._traceLogger = logging.getLogger("core.trace")
+        self._traceCounts = {}
+        # The EventQueue behind post(), started on first use with these settings.
+        self.queue = None
+        self.queueWorkers = 4
+        self.queueSize = 1024
+        self.queueBackpressure = BLOCK
     
     def registerEvent(self, eventname):
-        """ Registers a new event in memory. """ 
-        if eventname not in self._events:
-            self._events[eventname] = []
-            self._logger.info("%s event has successfully registered." % eventname)
-            return True
-        else:
-            return False
+        """ Registers a new event in memory.
+        eventname can be a wildcard pattern, see EventPatternTrie, though registerPluginToEvent
+        registers those by itself, and they go away with their last handler.
+        Concrete names a pattern matches need no registering to be fired. """ 
+        with self._lock:
+            if eventname not in self._events:
+                self._events[eventname] = OrderedDict()
+                self._ranks[eventname] = {}
+                self._orders[eventname] = []
+                if isEventPattern(eventname):
+                    self._patterns.add(eventname)
+                    self.invalidateDispatch(eventname)
+                self._logger.info("%s event has successfully registered.", eventname)
+                return True
+            else:
+                return False
         
     def unregisterEvent(self, eventname):
         """ Unregister an event from memory. """
-        if eventname in self._events:
-            del self._events[eventname]
-            self._logger.info("%s event has successfully unregistered." % eventname)
-            return True
-        else:
-            return False
+        with self._lock:
+            if eventname in self._events:
+                for plugin, functionname in self._events.pop(eventname).values():
+                    self._forgetSubscription(plugin, eventname)
+                del self._ranks[eventname]
+                del self._orders[eventname]
+                self.invalidateDispatch(eventname)
+                self._patterns.remove(eventname)
+                self._logger.info("%s event has successfully unregistered.", eventname)
+                return True
+            else:
+                return False
 
-    def registerPluginToEvent(self, plugin, eventname, functionname):
+    def registerPluginToEvent(self, plugin, eventname, functionname, priority=0):
         """ registers a plugin to an event. 
         plugin is a plugin instance or a plugin name
         eventname is a name of an event
-        functionname is the name of the function under the plugin object that will be called when the event is fired"""
-        plugin = self.system.plugins.getPlugin(plugin)
-        if plugin and eventname in self._events:
-            if plugin in self._events[eventname]:
-                self._logger.warning("%s is already associated with %s." % (plugin.name, eventname))
-                return True            
-            self._events[eventname].append((plugin, functionname))
-            self._logger.info("%s.%s() has successfully registered to %s" % (plugin.uniquename, functionname, eventname))
-            return True
-        self._logger.warning("%s failed to register to %s." % (plugin.uniquename, eventname))
-        return False
+        functionname is the name of the function under the plugin object that will be called when the event is fired
+        priority orders the handlers of the event: higher priorities are called first, equal ones in registration order
+        eventname can also be a wildcard pattern such as "request.*" or "request.#", see EventPatternTrie"""
+        with self._lock:
+            instance = self.system.plugins.getPlugin(plugin)
+            if instance and eventname not in self._events and isEventPattern(eventname):
+                self.registerEvent(eventname)
+            if instance and eventname in self._events:
+                handlers = self._events[eventname]
+                key = (id(instance), functionname)
+                if key in handlers:
+                    self._logger.warning("%s is already associated with %s.", instance.name, eventname)
+                    return True
+                handlers[key] = (instance, functionname)
+                rank = (-priority, next(self._sequence), key)
+                self._ranks[eventname][key] = rank
+                bisect.insort(self._orders[eventname], rank)
+                self._subscriptions.setdefault(id(instance), {}).setdefault(eventname, []).append(functionname)
+                self.invalidateDispatch(eventname)
+                if self._logger.isEnabledFor(logging.INFO):
+                    self._logger.info("%s.%s() has successfully registered to %s", instance.uniquename, functionname, eventname)
+                return True
+            self._logger.warning("%s failed to register to %s.", getattr(instance, "uniquename", plugin), eventname)
+            return False
     
     def unregisterPluginFromEvent(self, plugin, eventname):
         """ unregister a plugin from an event.
         plugin is a Plugin instance or a plugin name"""
-        plugin = self.system.plugins.getPlugin(plugin)
-        if plugin and eventname in self._events:
-            if plugin not in self._events[eventname]:
-                self.logger.warning("%s is not associated with %s in the first place." % (plugin.name, eventname))
+        with self._lock:
+            instance = self._findSubscriber(plugin)
+            if instance and eventname in self._events:
+                functionnames = self._forgetSubscription(instance, eventname)
+                if not functionnames:
+                    self._logger.warning("%s is not associated with %s in the first place.", instance.name, eventname)
+                    return True
+            
+                handlers = self._events[eventname]
+                for functionname in functionnames:
+                    del handlers[(id(instance), functionname)]
+                    self._unrank(eventname, (id(instance), functionname))
+                self.invalidateDispatch(eventname)
+                self.invalidateCache(eventname, instance)
+                if not handlers and eventname in self._patterns.patterns:
+                    self.unregisterEvent(eventname)
+                    
+                if self._logger.isEnabledFor(logging.INFO):
+                    self._logger.info("%d %s plugin(s) unregistered from %s.", len(functionnames), instance.uniquename, eventname)
                 return True
+            self._logger.warning("%s failed to unregister to %s.", getattr(instance, "uniquename", plugin), eventname)
+            return False
+    
+    def unregisterPlugin(self, plugin):
+        """ Unregisters a plugin instance from every event it is associated with.
+        Returns the number of registrations removed. """
+        with self._lock:
+            self.invalidateCache(plugin=plugin)
+            subscriptions = self._subscriptions.pop(id(plugin), None)
+            if not subscriptions:
+                return 0
+        
             count = 0
-            for i in xrange(len(self._events[eventname])):
-                if self._events[eventname][i][0] == plugin:
-                    count += 1
-                    self._events[eventname].pop(i)
-                    
-            self._logger.info("%d %s plugin(s) unregistered from %s." % (count, plugin.uniquename, eventname))
-            return True
-        self._logger.warning("%s failed to unregister to %s." % (plugin.uniquename, eventname))
-        return False
+            for eventname, functionnames in subscriptions.items():
+                handlers = self._events[eventname]
+                for functionname in functionnames:
+                    del handlers[(id(plugin), functionname)]
+                    self._unrank(eventname, (id(plugin), functionname))
+                count += len(functionnames)
+                self.invalidateDispatch(eventname)
+                if not handlers and eventname in self._patterns.patterns:
+                    self.unregisterEvent(eventname)
+            return count
+    
+    def _unrank(self, eventname, key):
+        """ Takes a handler out of the dispatch order of an event """
+        rank = self._ranks[eventname].pop(key)
+        order = self._orders[eventname]
+        del order[bisect.bisect_left(order, rank)]
+    
+    def _inOrder(self, eventname):
+        """ Returns the (plugin, functionname) of an event in dispatch order """
+        handlers = self._events[eventname]
+        return [handlers[rank[2]] for rank in self._orders[eventname]]
+    
+    def getSubscriptions(self, plugin):
+        """ Returns a dict of eventname -> list of functionnames a plugin instance is registered with """
+        return dict((eventname, list(functionnames)) for eventname, functionnames in self._subscriptions.get(id(plugin), {}).items())
+    
+    def getPriorities(self, plugin):
+        """ Returns a dict of (eventname, functionname) -> priority of the handlers of a plugin instance """
+        return dict(((eventname, functionname), -self._ranks[eventname][(id(plugin), functionname)][0])
+                    for eventname, functionnames in self._subscriptions.get(id(plugin), {}).items()
+                    for functionname in functionnames)
+    
+    def restoreSubscriptions(self, plugin, subscriptions, priorities={}):
+        """ Registers a plugin to whatever it is missing out of subscriptions, as given by getSubscriptions,
+        with the priorities given by getPriorities. """
+        for eventname, functionnames in subscriptions.items():
+            handlers = self._events.get(eventname)
+            if handlers is None:
+                continue
+            for functionname in functionnames:
+                if (id(plugin), functionname) not in handlers:
+                    self.registerPluginToEvent(plugin, eventname, functionname, priorities.get((eventname, functionname), 0))
+    
+    def _findSubscriber(self, plugin):
+        """ Returns the instance for a plugin name or instance, whether or not it is still active. """
+        if not isinstance(plugin, stringTypes) and id(plugin) in self._subscriptions:
+            return plugin
+        return self.system.plugins.getPlugin(plugin)
+    
+    def _forgetSubscription(self, plugin, eventname):
+        """ Drops eventname from the reverse index of plugin. Returns its functionnames for that event. """
+        subscriptions = self._subscriptions.get(id(plugin))
+        if subscriptions is None:
+            return []
+        functionnames = subscriptions.pop(eventname, [])
+        if not subscriptions:
+            del self._subscriptions[id(plugin)]
+        return functionnames
           
     def getEventPlugins(self, eventname):
-        """ Get the list of plugins associated with the event """
-        return self._events.get(eventname, None)
+        """ Get the list of (plugin, functionname) associated with the event, in dispatch order """
+        if eventname not in self._events:
+            return None
+        return self._inOrder(eventname)
         
-    def fire(self, eventname, signalAll=False, **kwargs):
-        """ Fires an event and all it's plugins. """
-        if eventname in self._events:
-            kwargs["event"] = eventname
-            self._logger.info("Firing event %s. signalAll: %d" % (eventname, int(signalAll)))
-            returnStatus = [True, {}]
-            for plugin, functionname in self._events[eventname]:
-                if self.system.plugins.isInactive(plugin.uniquename):
+    def getTables(self):
+        """ Returns the registration tables as eventname -> [[uniquename, functionname, priority], ...]
+        in dispatch order, plain enough to be pickled. Used by System.snapshot(). """
+        tables = {}
+        for eventname in self._events:
+            tables[eventname] = [[plugin.uniquename, functionname, -self._ranks[eventname][(id(plugin), functionname)][0]]
+                                 for plugin, functionname in self._inOrder(eventname)]
+        return tables
+    
+    def restoreEvents(self, tables):
+        """ Registers every event of tables, as given by getTables """
+        with self._lock:
+            for eventname in tables:
+                self.registerEvent(eventname)
+    
+    def restoreHandlers(self, tables, uniquename):
+        """ Registers the handlers a plugin has in tables, as given by getTables, with their priorities.
+        For a plugin that is active without having run prepare(). """
+        with self._lock:
+            for eventname, entries in tables.items():
+                for entryname, functionname, priority in entries:
+                    if entryname == uniquename:
+                        self.registerPluginToEvent(uniquename, eventname, functionname, priority)
+    
+    def restoreOrder(self, tables):
+        """ Gives the handlers of every event the order they had in tables, as given by getTables.
+        Handlers missing from it go after the ones of equal priority. """
+        with self._lock:
+            for eventname, entries in tables.items():
+                handlers = self._events.get(eventname)
+                if not handlers:
                     continue
-                
-                func = getattr(plugin, functionname)
-                status = func(kwargs)
-                returnStatus[1][plugin.uniquename] = status
+                positions = dict(((uniquename, functionname), i) for i, (uniquename, functionname, priority) in enumerate(entries))
+                ranks = self._ranks[eventname]
+                order = sorted(self._orders[eventname], key=lambda rank: (rank[0], positions.get((handlers[rank[2]][0].uniquename, handlers[rank[2]][1]), len(entries)), rank[1]))
+                # Ranked again in that order, behind every handler registered so far.
+                order = [(rank[0], next(self._sequence), rank[2]) for rank in order]
+                for rank in order:
+                    ranks[rank[2]] = rank
+                self._orders[eventname] = order
+            self.invalidateDispatch()
+    
+    def compileDispatch(self):
+        """ Compiles the dispatch table of every registered event up front. Returns how many there are. """
+        eventnames = [eventname for eventname in self._events if eventname not in self._patterns.patterns]
+        for eventname in eventnames:
+            self._getDispatch(eventname)
+        return len(eventnames)
+    
+    def invalidateDispatch(self, eventname=None):
+        """ Drops the compiled dispatch table of an event, or of every event if eventname is None
+        or a wildcard pattern. The PluginManager calls this whenever a plugin becomes or stops being inactive. """
+        with self._lock:
+            if eventname is None or eventname in self._patterns.patterns:
+                self._dispatch.clear()
+                self._derived = OrderedDict.fromkeys(self._derived)
+            else:
+                self._dispatch.pop(eventname, None)
+                if eventname in self._derived:
+                    self._derived[eventname] = None
+
+    def _getDispatch(self, eventname):
+        """ Returns the dispatch table of an event, compiling it if needed. None if the event doesn't exist. """
+        try:
+            return self._dispatch[eventname]
+        except KeyError:
+            with self._lock:
+                table = self._derived.pop(eventname, None)
+                if table is None:
+                    return self._compileDispatch(eventname)
+                self._derived[eventname] = table
+                return table
+    
+    def _compileDispatch(self, eventname):
+        """ Compiles the dispatch table of an event. Holds the lock. """
+        patterns = self._patterns.match(eventname) if self._patterns else None
+        if patterns:
+            handlers = self._mergeHandlers(eventname, patterns)
+        elif eventname in self._events:
+            handlers = self._inOrder(eventname)
+        else:
+            return None
+        isInactive = self.system.plugins.isInactive
+        table = tuple([(plugin.uniquename, self._cached(eventname, plugin.uniquename, functionname, getattr(plugin, functionname)))
+                       for plugin, functionname in handlers
+                       if not isInactive(plugin.uniquename)])
+        profiler = self.profiler
+        if profiler is not None:
+            table = tuple([(uniquename, profiler.wrapHandler(eventname, uniquename, func)) for uniquename, func in table])
+        tracer = self.tracer
+        if tracer is not None:
+            table = tuple([(uniquename, tracer.wrapHandler(eventname, uniquename, func)) for uniquename, func in table])
+        if [func for uniquename, func in table if isinstance(func, IsolatedCall)]:
+            self._isolatedEvents.add(eventname)
+        else:
+            self._isolatedEvents.discard(eventname)
+        if [func for uniquename, func in table if isCoroutineFunction(func)]:
+            self._coroutineEvents.add(eventname)
+        else:
+            self._coroutineEvents.discard(eventname)
+        
+        if eventname in self._events:
+            self._derived.pop(eventname, None)
+            self._dispatch[eventname] = table
+        else:
+            self._derived[eventname] = table
+            while len(self._derived) > max(self.dispatchCacheSize, 1):
+                self._forgetDerived(self._derived.popitem(last=False)[0])
+        return table
+    
+    def _forgetDerived(self, eventname):
+        """ Drops what is kept for a name only wildcard patterns match, once it is evicted """
+        self._caches.pop(eventname, None)
+        self._traceCounts.pop(eventname, None)
+        self._isolatedEvents.discard(eventname)
+        self._coroutineEvents.discard(eventname)
+    
+    def _runCoroutines(self, eventname, table):
+        """ Returns table with its coroutine handlers run to completion, each on an event loop of
+        its own, for fire(), fireFast() and posted events. Raises RuntimeError within a running
+        event loop, which they would block; fireAsync awaits them there. """
+        import asyncio
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError: # No loop running, as run_until_complete needs.
+            pass
+        except AttributeError: # Python 3.5 and 3.6, where run_until_complete raises within a running loop.
+            pass
+        else:
+            raise RuntimeError("%s has coroutine handlers, fire it with fireAsync from within an event loop." % eventname)
+        
+        def complete(func):
+            def run(kwargs):
+                loop = asyncio.new_event_loop()
+                try:
+                    return loop.run_until_complete(func(kwargs))
+                finally:
+                    loop.close()
+            return run
+        return tuple([(uniquename, complete(func) if isCoroutineFunction(func) else func) for uniquename, func in table])
+
+    def _cached(self, eventname, uniquename, functionname, func):
+        """ Returns func served from its HandlerCache if it was declared cacheable, func otherwise """
+        options = getattr(func, "cacheOptions", None)
+        if options is None or isCoroutineFunction(func):
+            return func
+        caches = self._caches.setdefault(eventname, {})
+        cache = caches.get((uniquename, functionname))
+        if cache is None:
+            cache = caches[(uniquename, functionname)] = HandlerCache(*options)
+        return cache.wrap(func)
+    
+    def invalidateCache(self, eventname=None, plugin=None):
+        """ Empties the caches of the cacheable handlers of an event, of a plugin (instance or
+        uniquename), of a plugin on an event, or of everything if neither is given. """
+        if plugin is not None and not isinstance(plugin, stringTypes):
+            plugin = plugin.uniquename
+        if eventname is None:
+            caches = list(self._caches.values())
+        else:
+            caches = [self._caches.get(eventname, {})]
+        for handlers in caches:
+            for (uniquename, functionname), cache in handlers.items():
+                if plugin is None or uniquename == plugin:
+                    cache.clear()
+    
+    def getCacheStats(self):
+        """ Returns {eventname: {"uniquename.functionname": {"hits", "misses", "size"}}} of the cacheable handlers fired """
+        return dict((eventname, dict(("%s.%s" % key, cache.stats()) for key, cache in handlers.items()))
+                    for eventname, handlers in self._caches.items())
+    
+    def afterFork(self):
+        """ Drops the event queue, whose threads didn't survive the fork, and renews the cache locks """
+        self.queue = None
+        self._lock = threading.RLock()
+        for handlers in self._caches.values():
+            for cache in handlers.values():
+                cache._lock = threading.Lock()
+    
+    def _mergeHandlers(self, eventname, patterns):
+        """ Returns the (plugin, functionname) of an event and of the patterns matching it, by priority.
+        Among equal priorities the event's own handlers go first, then those of the patterns in the
+        order they were added. A handler subscribed more than once is called once, at its highest priority. """
+        merged = []
+        for source in [eventname] + patterns:
+            handlers = self._events.get(source)
+            if handlers is None:
+                continue
+            for rank in self._orders[source]:
+                merged.append((rank[0], len(merged), rank[2], handlers[rank[2]]))
+        merged.sort()
+        
+        result = []
+        seen = set()
+        for priority, order, key, handler in merged:
+            if key not in seen:
+                seen.add(key)
+                result.append(handler)
+        return result
+    
+    def _submitIsolated(self, table, kwargs):
+        """ Sends the calls to isolated plugins off to their worker processes up front, so they
+        run concurrently with each other and with the rest. Returns the table with those
+        entries replaced by callables waiting for the reply. """
+        return [(uniquename, func.submit(kwargs) if isinstance(func, IsolatedCall) else func) for uniquename, func in table]
+
+    def fire(self, eventname, signalAll=False, fireMode=FIRE_ALL, **kwargs):
+        """ Fires an event and all it's plugins.
+        fireMode is one of:
+            FIRE_ALL - calls every handler
+            FIRE_FIRST_TRUTHY - stops at the first handler returning a true status
+            FIRE_UNTIL_FAILURE - stops at the first handler returning a false status
+        Returns a FireResult, [allSucceeded, {uniquename: status}] of the handlers called, or False if the
+        event doesn't exist. With FIRE_FIRST_TRUTHY, allSucceeded tells whether a handler answered, and
+        the uniquename of that handler (or None) is appended to the list. """
+        if self.tracer is not None and self.tracer.owns():
+            return self.tracer.traceFire(self, eventname, signalAll, fireMode, kwargs)
+        table = self._getDispatch(eventname)
+        if table is None:
+            self._logger.info("Event, %s, doesn't exist.", eventname)
+            return False
+        if eventname in self._coroutineEvents:
+            table = self._runCoroutines(eventname, table)
+
+        kwargs["event"] = eventname
+        traced = self.traceEvery and self._sampleTrace(eventname)
+        if traced:
+            began = wallClock()
+        if fireMode == FIRE_ALL:
+            if eventname in self._isolatedEvents:
+                table = self._submitIsolated(table, kwargs)
+            succeeded = True
+            statuses = {}
+            for uniquename, func in table:
+                status = statuses[uniquename] = func(kwargs)
                 if not status:
-                    returnStatus[0] = False
-                
-            if signalAll:
-                signaller = kwargs.get("signaller", None)
-                self.system.plugins.signalAll(event=eventname, system=self.system, signaller=signaller)
-            self._logger.info("%s status: %s" % (eventname, str(returnStatus)))
-            return returnStatus
+                    succeeded = False
+            result = FireResult((succeeded, statuses))
+        elif fireMode == FIRE_FIRST_TRUTHY:
+            statuses = {}
+            answered = None
+            for uniquename, func in table:
+                status = statuses[uniquename] = func(kwargs)
+                if status:
+                    answered = uniquename
+                    break
+            result = FireResult((answered is not None, statuses, answered))
+        elif fireMode == FIRE_UNTIL_FAILURE:
+            succeeded = True
+            statuses = {}
+            for uniquename, func in table:
+                status = statuses[uniquename] = func(kwargs)
+                if not status:
+                    succeeded = False
+                    break
+            result = FireResult((succeeded, statuses))
         else:
-            self._logger.info("Event, %s, doesn't exist." % eventname)
+            raise ValueError("Unknown fire mode %s" % fireMode)
+
+        if signalAll:
+            signaller = kwargs.get("signaller", None)
+            self.system.plugins.signalAll(event=eventname, system=self.system, signaller=signaller)
+        if traced:
+            self._trace(eventname, "fire", began, result.succeeded, result.statuses, signalAll)
+        return result
+
+    def fireFast(self, eventname, signalAll=False, fireMode=FIRE_ALL, **kwargs):
+        """ Fires an event like fire(), without collecting the status of every plugin.
+        Returns True if every plugin returned a true status, False otherwise or if the event doesn't exist.
+        With FIRE_FIRST_TRUTHY, returns whether a plugin answered. """
+        table = self._getDispatch(eventname)
+        if table is None:
             return False
+        if eventname in self._coroutineEvents:
+            table = self._runCoroutines(eventname, table)
+
+        kwargs["event"] = eventname
+        succeeded = True
+        if fireMode == FIRE_ALL:
+            for uniquename, func in table:
+                if not func(kwargs):
+                    succeeded = False
+        elif fireMode == FIRE_FIRST_TRUTHY:
+            succeeded = False
+            for uniquename, func in table:
+                if func(kwargs):
+                    succeeded = True
+                    break
+        elif fireMode == FIRE_UNTIL_FAILURE:
+            for uniquename, func in table:
+                if not func(kwargs):
+                    succeeded = False
+                    break
+        else:
+            raise ValueError("Unknown fire mode %s" % fireMode)
+
+        if signalAll:
+            self.system.plugins.signalAll(event=eventname, system=self.system, signaller=kwargs.get("signaller", None))
+        return succeeded
+
+    def fireAsync(self, eventname, signalAll=False, timeout=None, **kwargs):
+        """ Fires an event on the current asyncio event loop, running all it's plugins concurrently.
+        Coroutine functions are awaited, plain functions run on the loop's default executor.
+        timeout is either seconds for every plugin or a dict of uniquename -> seconds.
+        A plugin that times out gets a False status.
+        Returns a future of a FireResult like fire's, or of False if the event doesn't exist.
+        Must be called from within the running event loop. """
+        try:
+            import asyncio
+        except ImportError: # Python 2
+            raise RuntimeError("fireAsync requires asyncio.")
+
+        if hasattr(asyncio, "get_running_loop"):
+            loop = asyncio.get_running_loop()
+        else: # Python 3.5 and 3.6
+            loop = asyncio.get_event_loop()
+        result = loop.create_future()
+        table = self._getDispatch(eventname)
+        if table is None:
+            self._logger.info("Event, %s, doesn't exist.", eventname)
+            result.set_result(False)
+            return result
+
+        kwargs["event"] = eventname
+        traced = self.traceEvery and self._sampleTrace(eventname)
+        if traced:
+            began = wallClock()
+        calls = []
+        for uniquename, func in table:
+            if isCoroutineFunction(func):
+                call = func(kwargs)
+            else:
+                call = loop.run_in_executor(None, func, kwargs)
+
+            handlerTimeout = timeout.get(uniquename) if isinstance(timeout, dict) else timeout
+            if handlerTimeout is not None:
+                call = asyncio.wait_for(call, handlerTimeout)
+            calls.append(call)
+
+        def finish(gathered):
+            if gathered.cancelled():
+                result.cancel()
+                return
+            if result.cancelled():
+                return
+
+            succeeded = True
+            values = gathered.result()
+            for index, status in enumerate(values):
+                if isinstance(status, asyncio.TimeoutError):
+                    self._logger.warning("%s timed out on %s.", table[index][0], eventname)
+                    status = values[index] = False
+                elif isinstance(status, BaseException):
+                    result.set_exception(status)
+                    return
+                if not status:
+                    succeeded = False
+            fired = FireResult((succeeded, _statusesOf(table, values)))
+
+            if signalAll:
+                self.system.plugins.signalAll(event=eventname, system=self.system, signaller=kwargs.get("signaller", None))
+            if traced:
+                self._trace(eventname, "fireAsync", began, succeeded, fired.statuses, signalAll)
+            result.set_result(fired)
+
+        asyncio.gather(*calls, return_exceptions=True).add_done_callback(finish)
+        return result
+
+    def post(self, eventname, **kwargs):
+        """ Hands an event off to the EventQueue and returns at once. Returns a PostedEvent,
+        the future of what fire() would have returned. Handlers run on the queue's workers. """
+        if self.queue is None:
+            self.startQueue()
+        return self.queue.post(eventname, kwargs)
+    
+    def startQueue(self, workers=None, maxsize=None, backpressure=None):
+        """ Starts the EventQueue used by post(), with queueWorkers worker threads, queueSize
+        events and queueBackpressure (BLOCK, DROP_OLDEST or REJECT) unless given otherwise. """
+        if self.queue is not None:
+            raise RuntimeError("The event queue is already running.")
+        self.queue = EventQueue(self, workers or self.queueWorkers, maxsize or self.queueSize, backpressure or self.queueBackpressure)
+        return self.queue
+    
+    def flush(self, timeout=None):
+        """ Waits until every posted event is handled. Returns False if timeout seconds passed first. """
+        return self.queue is None or self.queue.flush(timeout)
+    
+    def drain(self, timeout=None):
+        """ Stops the EventQueue after handling what was posted, waiting up to timeout seconds.
+        Returns True if every posted event got handled. post() starts a new queue afterwards. """
+        queue, self.queue = self.queue, None
+        return queue is None or queue.drain(timeout)
+    
+    def _sampleTrace(self, eventname):
+        """ Counts a fire of eventname. Returns whether this one is to be traced. """
+        count = self._traceCounts.get(eventname, 0)
+        self._traceCounts[eventname] = count + 1
+        return count % self.traceEvery == 0 and self._traceLogger.isEnabledFor(logging.INFO)
+    
+    def _trace(self, eventname, method, began, succeeded, statuses, signalAll):
+        """ Logs a sampled fire to the "core.trace" logger. The record carries a trace
+        attribute, a dict of event, method, duration, succeeded, statuses, signalAll,
+        fires (of this event so far) and sampling (traceEvery), for structured handlers. """
+        duration = wallClock() - began
+        trace = {"event" : eventname, "method" : method, "duration" : duration, "succeeded" : succeeded,
+                 "statuses" : statuses, "signalAll" : bool(signalAll),
+                 "fires" : self._traceCounts[eventname], "sampling" : self.traceEvery}
+        self._traceLogger.info("%s fired in %.6fs, succeeded: %s", eventname, duration, succeeded, extra={"trace" : trace})
+
+# Backpressure modes of an EventQueue, for when post() finds it full
+BLOCK = "block"
+DROP_OLDEST = "dropOldest"
+REJECT = "reject"
+
+class EventQueueFull(Exception):
+    """ Raised by post() on a full queue with the REJECT backpressure mode, and by
+    PostedEvent.result() for an event dropped to make room or left over by drain(). """
+
+class PostedEvent:
+    """ The future of an event posted to an EventQueue. Resolves to a FireResult
+    like fire() returns, or False if the event didn't exist by the time it was dispatched. """
+    def __init__(self, eventname, kwargs):
+        self.eventname = eventname
+        self.kwargs = kwargs
+        self.table = ()
+        self.values = [] # statuses lined up with table
+        self.remaining = 0 # handler calls not done yet
+        self._finished = threading.Event()
+        self._value = None
+        self._error = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+    
+    def done(self):
+        return self._finished.is_set()
+    
+    def result(self, timeout=None):
+        """ Waits for the event to be handled and returns its status structure.
+        Returns None if timeout seconds pass first. Raises EventQueueFull if the event was dropped,
+        or the error raised while compiling its dispatch table. """
+        if not self._finished.wait(timeout):
+            return None
+        if self._error is not None:
+            raise self._error
+        return self._value
+    
+    def addDoneCallback(self, callback):
+        """ Calls callback(postedEvent) once the event is handled or dropped, at once if it already is. """
+        self._lock.acquire()
+        try:
+            if not self._finished.is_set():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+    
+    def _resolve(self, value=None, error=None):
+        self._lock.acquire()
+        try:
+            self._value = value
+            self._error = error
+            self._finished.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            callback(self)
+
+class EventQueue:
+    """ Hands events off to a pool of worker threads, see EventManager.post.
+    Every handler call of a posted event goes into the mailbox of its plugin, and a
+    mailbox is worked off by one worker at a time, in the order events were posted.
+    A plugin therefore sees posted events in order and never two at once, while
+    different plugins run concurrently.
+    At most maxsize events wait to be dispatched, and at most maxsize more are being
+    handled; beyond that, post() applies the backpressure mode. """
+    def __init__(self, events, workers=4, maxsize=1024, backpressure=BLOCK):
+        if backpressure not in (BLOCK, DROP_OLDEST, REJECT):
+            raise ValueError("Unknown backpressure mode %s" % backpressure)
+        self._logger = logging.getLogger("core.EventQueue")
+        self.events = events
+        self.maxsize = maxsize
+        self.backpressure = backpressure
+        self._condition = threading.Condition()
+        self._pending = deque() # PostedEvents not dispatched yet
+        self._inFlight = 0 # PostedEvents dispatched but not done
+        self._mailboxes = {} # uniquename -> deque of (PostedEvent, index in its table, handler)
+        self._ready = deque() # uniquenames whose mailbox waits for a worker
+        self._busy = set() # uniquenames that are ready or being worked on
+        self._closed = False
+        self._threads = []
+        for number in range(workers):
+            thread = threading.Thread(target=self._work, name="EventQueueWorker-%d" % number)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+    
+    def post(self, eventname, kwargs):
+        posted = PostedEvent(eventname, kwargs)
+        dropped = []
+        condition = self._condition
+        condition.acquire()
+        try:
+            while not self._closed and len(self._pending) >= self.maxsize:
+                if self.backpressure == REJECT:
+                    raise EventQueueFull("The event queue is full, %s was rejected." % eventname)
+                elif self.backpressure == DROP_OLDEST:
+                    dropped.append(self._pending.popleft())
+                else:
+                    condition.wait()
+            if self._closed:
+                raise RuntimeError("The event queue has been drained.")
+            self._pending.append(posted)
+            condition.notify()
+        finally:
+            condition.release()
+        
+        for event in dropped:
+            event._resolve(error=EventQueueFull("%s was dropped to make room for newer events." % event.eventname))
+        return posted
+    
+    def flush(self, timeout=None):
+        """ Waits until every event posted so far is handled. Returns False if timeout seconds passed first. """
+        deadline = None if timeout is None else wallClock() + timeout
+        condition = self._condition
+        condition.acquire()
+        try:
+            while self._pending or self._inFlight:
+                if deadline is None:
+                    condition.wait()
+                else:
+                    left = deadline - wallClock()
+                    if left <= 0:
+                        return False
+                    condition.wait(left)
+            return True
+        finally:
+            condition.release()
+    
+    def drain(self, timeout=None):
+        """ Stops taking events, waits up to timeout seconds for the posted ones to be
+        handled and stops the workers. Events not dispatched by then are dropped.
+        Returns True if every posted event got handled. """
+        began = wallClock()
+        condition = self._condition
+        condition.acquire()
+        try:
+            self._closed = True
+            condition.notify_all()
+        finally:
+            condition.release()
+        
+        drained = self.flush(timeout)
+        condition.acquire()
+        try:
+            dropped = list(self._pending)
+            self._pending.clear()
+            condition.notify_all()
+        finally:
+            condition.release()
+        for event in dropped:
+            event._resolve(error=EventQueueFull("%s was left over when the queue was drained." % event.eventname))
+        
+        for thread in self._threads:
+            thread.join(None if timeout is None else max(0, timeout - (wallClock() - began)))
+        return drained
+    
+    def _dispatch(self, posted):
+        """ Puts the handler calls of a posted event into the mailboxes. Holds the condition.
+        Returns the result of the event if it is done already, having no handlers. """
+        self._inFlight += 1
+        table = self.events._getDispatch(posted.eventname)
+        if table is None:
+            return False
+        elif not table:
+            return FireResult((True, {}))
+        
+        if posted.eventname in self.events._coroutineEvents:
+            table = self.events._runCoroutines(posted.eventname, table)
+        posted.kwargs["event"] = posted.eventname
+        posted.table = table
+        posted.values = [None] * len(table)
+        posted.remaining = len(table)
+        for index, (uniquename, func) in enumerate(table):
+            self._mailboxes.setdefault(uniquename, deque()).append((posted, index, func))
+            if uniquename not in self._busy:
+                self._busy.add(uniquename)
+                self._ready.append(uniquename)
+        return None
+    
+    def _complete(self, posted, value=None, error=None):
+        """ Resolves a dispatched event, then lets flush() know it is done. """
+        posted._resolve(value, error)
+        condition = self._condition
+        condition.acquire()
+        try:
+            self._inFlight -= 1
+            condition.notify_all()
+        finally:
+            condition.release()
+    
+    def _work(self):
+        condition = self._condition
+        while True:
+            finished = None
+            condition.acquire()
+            try:
+                while not self._ready:
+                    if self._pending and self._inFlight < self.maxsize:
+                        posted = self._pending.popleft()
+                        condition.notify_all() # Room for blocked producers
+                        try:
+                            value = self._dispatch(posted)
+                        except Exception as error:
+                            self._logger.exception("Failed to dispatch posted %s.", posted.eventname)
+                            finished = (posted, None, error)
+                            break
+                        if value is not None:
+                            finished = (posted, value)
+                            break
+                    elif self._closed and not self._pending:
+                        return
+                    else:
+                        condition.wait()
+                if self._ready:
+                    uniquename = self._ready.popleft()
+                    posted, index, func = self._mailboxes[uniquename].popleft()
+                else:
+                    posted = None
+            finally:
+                condition.release()
+            
+            if finished is not None:
+                self._complete(*finished)
+            if posted is None:
+                continue
+            
+            try:
+                status = func(posted.kwargs)
+            except Exception:
+                self._logger.exception("%s failed to handle posted %s.", uniquename, posted.eventname)
+                status = False
+            
+            condition.acquire()
+            try:
+                posted.values[index] = status
+                posted.remaining -= 1
+                if self._mailboxes[uniquename]:
+                    self._ready.append(uniquename)
+                    condition.notify()
+                else:
+                    del self._mailboxes[uniquename]
+                    self._busy.discard(uniquename)
+                done = not posted.remaining
+            finally:
+                condition.release()
+            
+            if done:
+                self._complete(posted, FireResult((all(posted.values), _statusesOf(posted.table, posted.values))))
 
 class PluginManager:
     """ Manages plugins """
     def __init__(self, system):
         self._logger = logging.getLogger("core.PluginManager")
         
-        self._activePlugins = {} 
-        self._inactivePlugins = {}
-        self._preloadedPlugins = {}
+        self._registry = PluginRegistry()
+        # Views of the registry, never to be modified directly.
+        self._activePlugins = self._registry.active
+        self._inactivePlugins = self._registry.inactive
+        self._preloadedPlugins = self._registry.preloaded
         self._optimalLoadOrder = []
+        # Nesting depth of beginSignalBatch() calls, and the signals held back meanwhile.
+        self._signalBatchDepth = 0
+        self._batchedSignals = {"loaded" : [], "unloaded" : []}
+        self._dependencyGraph = DependencyGraph(self._preloadedPlugins)
+        # A DiscoveryCache used by importPlugins instead of listing directories, if set.
+        self.discoveryCache = None
+        # Worker processes for plugins with isolation = "process", started with the first one.
+        self.isolationPool = None
+        self.isolationProcesses = None
+        # A Profiler timing imports, load(), prepare() and signal(), if profiling is enabled.
+        self.profiler = None
+        # A Tracer recording spans of signalAll fan-outs, if tracing is enabled.
+        self.tracer = None
         self.system = system
     
+    def _getPluginInState(self, plugin, state):
+        node = self._registry.find(plugin)
+        if node is not None and node.state == state:
+            return node.plugin
+        return None
+    
     def getPluginGivenLocation(self, plugin, location):
-        if isinstance(plugin, str): 
-            if plugin in location:
-                return location[plugin]
-            else:
-                return None
-        else:
-            if plugin in location.values():
-                return plugin
-            else:
-                return None
+        """ Gets a plugin from location, a uniquename -> plugin dict such as the active list.
+        plugin can either be an uniquename or the instance """
+        if isinstance(plugin, stringTypes):
+            return location.get(plugin)
+        node = self._registry.find(plugin)
+        if node is not None and location.get(node.plugin.uniquename) is plugin:
+            return plugin
+        return None
     
     def getPlugin(self, plugin):
         """ Gets a plugin from the active list only. plugin can either be an uniquename or the instance """
-        return self.getPluginGivenLocation(plugin, self._activePlugins)
+        return self._getPluginInState(plugin, ACTIVE)
     
     def getInactivePlugin(self, plugin):
         """ Gets a plugin from the inactive list. plugin can either be an uniquename or the instance """
-        return self.getPluginGivenLocation(plugin, self._inactivePlugins)
+        return self._getPluginInState(plugin, INACTIVE)
     
-    def importPlugins(self, plugindir, byFile=False, byFileStartsWith="plugin_", byDirFileName="main", pluginsAttributeName="plugins"):
+    def importPlugins(self, plugindir, byFile=False, byFileStartsWith="plugin_", byDirFileName="main", pluginsAttributeName="plugins", parallelLoad=0, batchSignals=False, lazyLoad=False, load=True, importThreads=0):
+        """ Imports, preloads and loads every plugin found in plugindir.
+        With lazyLoad, modules declaring lazyPlugins metadata are not imported;
+        a LazyPlugin stands in for each declared plugin until one of its events fires.
+        With load=False, the plugins are only preloaded.
+        Modules are imported as the directory is scanned, and their plugins preloaded as they
+        come in. With importThreads > 1, that many threads import ahead, see streamMap; plugins
+        are still preloaded in directory order, on the calling thread. """
         if os.path.isdir(plugindir):
             if plugindir not in sys.path:
                 sys.path.append(plugindir)
-            for filename in os.listdir(plugindir):
-                path = os.path.join(plugindir, filename)
-                _temp = False
-                if byFile:
-                    if os.path.isfile(path) and filename.startswith(byFileStartsWith) and filename.endswith(".py"):
-                        _temp = __import__(os.path.splitext(filename)[0], fromlist=[pluginsAttributeName])
+            cache = self.discoveryCache
+            cacheLock = threading.Lock()
+            if cache is not None:
+                modules = cache.listModules(plugindir, byFile, byFileStartsWith, byDirFileName)
+            else:
+                modules = iterPluginModules(plugindir, byFile, byFileStartsWith, byDirFileName)
+            
+            def fetch(module):
+                """ Returns (modulename, modulepath, lazy metadata, None) or (modulename, modulepath, None, plugins) """
+                modulename, modulepath = module
+                if lazyLoad:
+                    if cache is not None:
+                        with cacheLock:
+                            metadata = cache.lazyMetadata(modulepath)
+                    else:
+                        metadata = readLazyMetadata(modulepath)
+                    if metadata:
+                        return modulename, modulepath, metadata, None
+                
+                if self.profiler is None:
+                    _temp = __import__(modulename, fromlist=[pluginsAttributeName])
                 else:
-                    if os.path.isdir(path) and ("%s.py" % byDirFileName) in os.listdir(path):
-                        _temp = __import__(filename+"."+byDirFileName, fromlist=[pluginsAttributeName])
-                if _temp:
-                    plugins = getattr(_temp, pluginsAttributeName)
-                    for plugin in plugins:
-                        self.preloadPlugin(plugin)
-                                
-                                
+                    _temp = self.profiler.call("import", modulename, __import__, modulename, {}, {}, [pluginsAttributeName])
+                return modulename, modulepath, None, getattr(_temp, pluginsAttributeName)
+            
+            for modulename, modulepath, metadata, plugins in streamMap(fetch, modules, importThreads):
+                if metadata:
+                    for entry in metadata:
+                        if entry["uniquename"] not in self._preloadedPlugins:
+                            self.preloadPlugin(LazyPlugin(modulename, pluginsAttributeName, entry), (modulename, pluginsAttributeName))
+                    continue
+                
+                for plugin in plugins:
+                    self.preloadPlugin(plugin, (modulename, pluginsAttributeName))
+            
+            if not load:
+                return
             self.buildOptimalLoadOrder()
-            for i in xrange(len(self._optimalLoadOrder)):
-                self.loadPlugin(self._optimalLoadOrder[i])
+            if batchSignals:
+                self.beginSignalBatch()
+            try:
+                if parallelLoad > 1:
+                    self.loadPluginsParallel(self._optimalLoadOrder, parallelLoad)
+                else:
+                    for plugin in self._optimalLoadOrder:
+                        self.loadPlugin(plugin)
+            finally:
+                if batchSignals:
+                    self.endSignalBatch()
         else:
             raise TypeError("%s is not a directory." % plugindir)
                 
-    def preloadPlugin(self, plugin):
-        """ Preloads the plugin, put it into a node with dependency mappings """
+    def preloadPlugin(self, plugin, source=None):
+        """ Preloads the plugin, put it into a node with dependency mappings.
+        source is the (modulename, attribute name) the instance was found under, used by reloadPlugin.
+        Returns the preloaded instance. """
         try:
             _temp = __import__(plugin, fromlist=["plugin"])
+            source = (plugin, "plugin")
             plugin = _temp.plugin
         except TypeError: # Occurs if plugin is actually a plugin instance
             pass
         
-        if hasattr(plugin, "dependency"):
-            self._preloadedPlugins[plugin.uniquename] = PluginNode(plugin, plugin.dependency)
+        if getattr(plugin, "isolation", None) == "process" and not isinstance(plugin, LazyPlugin):
+            if source is None:
+                self._logger.warning("%s asks for process isolation but wasn't imported from a module, running it in process.", plugin.uniquename)
+            else:
+                node = self._preloadedPlugins.get(plugin.uniquename)
+                if node is not None and isinstance(node.plugin, IsolatedPlugin) and node.plugin.source == source:
+                    plugin = node.plugin # Preloaded again, keep its worker.
+                else:
+                    plugin = self._isolate(plugin, source)
+        
+        previous = self._preloadedPlugins.get(plugin.uniquename)
+        before = previous.dependency if previous is not None else None
+        node = self._registry.preload(plugin, source)
+        if previous is not None and node.dependency != before and plugin.uniquename in self._dependencyGraph.known:
+            # Known to the graph under other dependencies, resolve it again on the next build.
+            self._dependencyGraph.invalidate([plugin.uniquename])
+        return node.plugin
+    
+    def _isolate(self, plugin, source, generation=0):
+        """ Returns the IsolatedPlugin standing in for plugin, starting the pool if needed """
+        if self.isolationPool is None:
+            self.isolationPool = ProcessPluginPool(self.isolationProcesses)
+        return IsolatedPlugin(plugin, source, self.isolationPool, generation)
+    
+    def addPlugin(self, plugin, source=None):
+        """ Preloads a plugin at runtime and loads it, along with any preloaded plugin that was
+        waiting on it, without resolving the other plugins again. Loaded plugins that move to an
+        earlier alternative it satisfies are unloaded and loaded again, with their dependents.
+        Returns the uniquenames of the plugins it let into the load order. """
+        self.preloadPlugin(plugin, source)
+        graph = self._dependencyGraph
+        if not graph.resolved:
+            self.buildOptimalLoadOrder()
+            appended = list(graph.order)
         else:
-            self._preloadedPlugins[plugin.uniquename] = PluginNode(plugin)
-            
+            removed, appended = graph.update()
+            self._refreshLoadOrder()
+            for name in reversed(removed):
+                if self.isRegistered(name):
+                    self.unloadPlugin(name)
+        
+        for name in appended:
+            self.loadPlugin(self._preloadedPlugins[name].plugin)
+        return appended
+    
+    def removePlugin(self, plugin):
+        """ Unloads a plugin after the plugins depending on it and forgets it, taking it out of the
+        load order. Its dependents stay preloaded; those with an alternative left are resolved
+        again and, if they were loaded, loaded again, as are loaded plugins moving to an
+        earlier alternative.
+        Returns False if the plugin or one of its dependents refused to unload. """
+        node = self._registry.find(plugin)
+        if node is None:
+            return False
+        name = node.plugin.uniquename
+        loaded = set([dependent for dependent in self._withDependents([name]) if self.isRegistered(dependent)])
+        if node.state != PRELOADED and not self.unloadPlugin(name, cascade=True):
+            return False
+        
+        self._registry.forget(node)
+        removed, appended = self._dependencyGraph.invalidate([name])
+        self._refreshLoadOrder()
+        for dependent in reversed(removed):
+            if self.isRegistered(dependent) and self.unloadPlugin(dependent):
+                loaded.add(dependent)
+        for dependent in appended:
+            if dependent in loaded:
+                self.loadPlugin(self._preloadedPlugins[dependent].plugin)
+        return True
+    
     def buildOptimalLoadOrder(self):
-        # Comments needed.
-        self._optimalLoadOrder = []
-        for pluginname in self._preloadedPlugins:
-            plugin = self._preloadedPlugins[pluginname]
-            _tempplugins = self.findLowestPlugin(plugin)
-            for p in _tempplugins:
-                if p not in self._optimalLoadOrder:
-                    self._optimalLoadOrder.append(p)
-    
-    def findLowestPlugin(self, plugin):
-        # Comments needed.
-        satisfiedDependency = False
-        # Initializes an empty list for the dependencies
-        dep = []
-        # Initializes an empty list for plugins that's not available
-        naPlugin = []
-        
-        # Loop through the different dependencies.
-        for dep in plugin.dependency:
-            # Assumes that this dependency satisfies.
-            thisSatisfies = True
-            
-            # Loop through the unique names in each dependencies
-            for name in dep:
-                # Check if they are in the preloadedPlugins.
-                if name not in self._preloadedPlugins:
-                    thisSatisfies = False
-                    naPlugin.append(name)
+        """ Resolves the dependencies of every preloaded plugin into self._optimalLoadOrder.
+        Plugins that cannot be satisfied are left out with a warning, unless they are
+        critical, in which case the DependencyNotSatisfiedError is raised.
+        After the first call, only the plugins preloaded or forgotten since are resolved. """
+        graph = self._dependencyGraph
+        if graph.resolved:
+            graph.update()
+        else:
+            graph.resolve()
+        self._refreshLoadOrder()
+    
+    def _refreshLoadOrder(self):
+        """ Derives self._optimalLoadOrder from the graph, warning of or raising its errors. """
+        graph = self._dependencyGraph
+        for name, error in graph.errors.items():
+            if getattr(self._preloadedPlugins[name].plugin, "critical", False):
+                raise error
+            self._logger.warning("%s", error)
+        
+        self._optimalLoadOrder = [self._preloadedPlugins[name].plugin for name in graph.order]
+    
+    def snapshot(self):
+        """ Returns the resolved load order, the plugin states and the state of the active
+        snapshottable plugins, as part of System.snapshot(). """
+        graph = self._dependencyGraph
+        plugins = {}
+        for name in graph.order:
+            plugin = self._preloadedPlugins[name].plugin
+            if name in self._activePlugins and getattr(plugin, "snapshottable", False):
+                plugins[name] = plugin.snapshot(self.system)
+        return {"order" : list(graph.order),
+                "chosen" : dict((name, list(chosen)) for name, chosen in graph.chosen.items()),
+                "unresolved" : sorted(graph.unresolved),
+                "dependencies" : self._normalizedDependencies(),
+                "states" : self.getPluginStates(),
+                "plugins" : plugins}
+    
+    def restoreSnapshot(self, snapshot):
+        """ Loads the preloaded plugins the way snapshot, as returned by System.snapshot(), found them,
+        without resolving the dependencies again. Snapshottable plugins active in it are handed their
+        state through restore() instead of being loaded and prepared; the others are loaded as usual.
+        If the plugins preloaded don't match the snapshot, falls back on resolving and loading.
+        Returns the uniquenames of the restored plugins. """
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot["dependencies"] != self._normalizedDependencies():
+            self._logger.warning("The snapshot doesn't match the plugins preloaded, loading them from scratch.")
+            self.buildOptimalLoadOrder()
+            for plugin in self._optimalLoadOrder:
+                self.loadPlugin(plugin)
+            return []
+        
+        self._dependencyGraph.restore(snapshot["order"], snapshot["chosen"], snapshot["unresolved"])
+        self._refreshLoadOrder()
+        
+        events = self.system.events
+        tables = snapshot["events"]
+        events.restoreEvents(tables)
+        states = snapshot["states"]
+        restored = []
+        for plugin in self._optimalLoadOrder:
+            name = plugin.uniquename
+            if states.get(name) == ACTIVE and name in snapshot["plugins"] and getattr(plugin, "snapshottable", False):
+                if self.profiler is None:
+                    loaded = plugin.restore(snapshot["plugins"][name], self.system)
+                else:
+                    loaded = self.profiler.call("load", name, plugin.restore, snapshot["plugins"][name], self.system)
+                if loaded:
+                    self._markLoaded(plugin, True)
+                    events.restoreHandlers(tables, name)
+                    restored.append(name)
+                    continue
+                self._logger.warning("%s failed to restore its state, loading it from scratch.", name)
+            self.loadPlugin(plugin)
+        
+        events.restoreOrder(tables)
+        return restored
+    
+    def _normalizedDependencies(self):
+        """ Returns uniquename -> list of alternatives of every preloaded plugin, as lists """
+        return dict((name, [list(alternative) for alternative in node.dependency or [[]]])
+                    for name, node in self._preloadedPlugins.items())
+    
+    def getPluginStates(self):
+        """ Returns a dict of uniquename -> ACTIVE or INACTIVE """
+        states = dict.fromkeys(self._activePlugins, ACTIVE)
+        states.update(dict.fromkeys(self._inactivePlugins, INACTIVE))
+        return states
+    
+    def deactivatePlugin(self, plugin):
+        """ Puts an active plugin to inactive without unloading it, e.g. when it can no longer run.
+        plugin is a plugin instance or plugin uniquename. Returns True if it was active. """
+        node = self._registry.find(plugin)
+        if node is None or node.state != ACTIVE:
+            return False
+        self._registry.setState(node, INACTIVE)
+        self.system.events.invalidateDispatch()
+        self.system.events.invalidateCache(plugin=node.plugin.uniquename)
+        self._logger.warning("%s put to inactive", node.plugin.uniquename)
+        return True
+    
+    def analyzeStartup(self, profiler=None):
+        """ Returns a StartupAnalysis of the resolved load order, weighed with the timings of
+        profiler, or of the profiler in use if there is one. """
+        from startupAnalysis import StartupAnalysis
+        return StartupAnalysis(self, profiler or self.profiler)
+    
+    def getUnresolvedPlugins(self):
+        """ Returns a dict of uniquename -> DependencyNotSatisfiedError for the plugins left out of the load order """
+        return dict(self._dependencyGraph.errors)
+    
+    def activateLazyPlugin(self, plugin):
+        """ Imports the real plugin behind a LazyPlugin and loads it in its place,
+        after doing the same for any LazyPlugin it depends on.
+        Returns the plugin now active under that uniquename, or None. """
+        for name in self._lazyDependencies(plugin.uniquename) + [plugin.uniquename]:
+            lazy = self._activePlugins.get(name)
+            if not isinstance(lazy, LazyPlugin):
+                continue
             
-            # If this dependencies, than this whole dependencies is satisfied for this plugin.
-            # Break
-            if thisSatisfies:
-                satisfiedDependency = True
-                break
+            real = lazy.resolve()
+            self.system.events.unregisterPlugin(lazy)
+            real = self.preloadPlugin(real, (lazy.modulename, lazy.pluginsAttributeName))
+            self._logger.debug("Activating lazy plugin %s", name)
+            self.loadPlugin(real)
         
-        # If this satisfies and the dependencies is not an empty list.
-        if satisfiedDependency and dep:
-            plugins = []
-            # Find the dependencies for each plugin in the dependencies
-            for name in dep:
-                _tempplugins = self.findLowestPlugin(self._preloadedPlugins[name])
-                for p in _tempplugins:
-                    if p not in plugins:
-                        plugins.append(p)
-                        
-            # Add the plugin itself to the end of the list.
-            if plugin.plugin not in plugins:
-                plugins.append(plugin.plugin)
-                
-            return plugins
-        elif not dep: # If there's no dependencies needed for this plugin
-            return [plugin.plugin]
-        else: # Other wise. Dependencies is not satisfied.
-            critical = getattr(plugin.plugin, "critical", False)
-            if critical:
-                raise DependencyNotSatisfiedError("Critical plugin, %s, cannot be loaded due to the a not satisfied dependency. Missing plugins: %s" % (plugin.plugin.uniquename, str(naPlugin)))
-            self._logger.warning("%s cannot be loaded due to %s not being available." % (plugin.plugin.uniquename, str(naPlugin)))
-            return []
+        return self._activePlugins.get(plugin.uniquename)
+    
+    def _lazyDependencies(self, uniquename):
+        """ Uniquenames of the active LazyPlugins uniquename depends on, dependencies first. """
+        chosen = self._dependencyGraph.chosen
+        order = []
+        seen = set([uniquename])
+        stack = [(uniquename, iter(chosen.get(uniquename, ())))]
+        while stack:
+            name, deps = stack[-1]
+            for dep in deps:
+                if dep not in seen and isinstance(self._activePlugins.get(dep), LazyPlugin):
+                    seen.add(dep)
+                    stack.append((dep, iter(chosen.get(dep, ()))))
+                    break
+            else:
+                stack.pop()
+                if name != uniquename:
+                    order.append(name)
+        return order
     
     def isInactive(self, pluginname):
         return pluginname in self._inactivePlugins
@@ -277,73 +2128,290 @@ class PluginManager:
     
     def loadPlugin(self, plugin):
         """ Loads a plugin.
-        plugin is the instance of a plugin"""        
+        plugin is the instance of a plugin
+        LazyPlugins it depends on are activated first, so it never gets hold of one."""        
         if plugin.uniquename in self._activePlugins:
             return True
-        
-        if plugin.load(self.system): # If loading returned False, puts to inactive.
+        if not isinstance(plugin, LazyPlugin):
+            for name in self._lazyDependencies(plugin.uniquename):
+                self.activateLazyPlugin(self._activePlugins[name])
+
+        profiler = self.profiler
+        if profiler is None:
+            if self._markLoaded(plugin, plugin.load(self.system)):
+                return plugin.prepare(self.system)
+        elif self._markLoaded(plugin, profiler.call("load", plugin.uniquename, plugin.load, self.system)):
+            return profiler.call("prepare", plugin.uniquename, plugin.prepare, self.system)
+        return False
+
+    def _markLoaded(self, plugin, loaded):
+        """ Records the outcome of plugin.load(). If loading returned False, puts to inactive. """
+        if loaded:
             if plugin.uniquename in self._inactivePlugins:
-                del self._inactivePlugins[plugin.uniquename]
-            
-            self._activePlugins[plugin.uniquename] = plugin
-            self.signalAll(loaded=plugin.uniquename, signaller=self, system=self.system)
-            self._logger.debug("Loaded: %s" % plugin.uniquename)
-            return plugin.prepare(self.system)
+                self.system.events.invalidateDispatch()
+
+            self._registry.setState(plugin, ACTIVE)
+            self._notify("loaded", plugin.uniquename)
+            if self._logger.isEnabledFor(logging.DEBUG):
+                self._logger.debug("Loaded: %s", plugin.uniquename)
+            return True
         else:
             if plugin.uniquename not in self._inactivePlugins:
-                self._inactivePlugins[plugin.uniquename] = plugin
-                self._logger.debug("%s put to inactive" % plugin.uniquename)
-                return False
-    
-    def unloadPlugin(self, plugin):
-        """ Unloads a plugin
-        plugin is a plugin instance or plugin uniquename """
-        if plugin in self._activePlugins:
-            if not self._activePlugins[plugin].unload(self.system): # If unloading fails, don't unload
-                return False
-            
-            del self._activePlugins[plugin]
-            return True
-        elif plugin in self._activePlugins:
-            del self._activePlugins[plugin]
-            return True
+                self._registry.setState(plugin, INACTIVE)
+                self.system.events.invalidateDispatch()
+                self.system.events.invalidateCache(plugin=plugin.uniquename)
+                if self._logger.isEnabledFor(logging.DEBUG):
+                    self._logger.debug("%s put to inactive", plugin.uniquename)
+            return False
+
+    def loadPluginsParallel(self, plugins, processes):
+        """ Loads plugins along the dependency graph on a pool of processes threads.
+        The load() of a plugin starts as soon as the plugins it depends on are prepared,
+        while prepare() runs on the calling thread in the order of plugins, so handlers
+        register in the same order as when loading them one by one. Plugins with
+        threadSafe = False opt out and are loaded with loadPlugin on the calling thread
+        when their turn comes.
+        Ends in the same active/inactive state as calling loadPlugin in order. """
+        plugins = [plugin for plugin in plugins if plugin.uniquename not in self._activePlugins]
+        batch = set([plugin.uniquename for plugin in plugins])
+        chosen = self._dependencyGraph.chosen
+        waiting = {} # uniquename -> how many of its dependencies are still to be prepared
+        dependents = {}
+        for plugin in plugins:
+            deps = [dep for dep in chosen.get(plugin.uniquename, ()) if dep in batch]
+            waiting[plugin.uniquename] = len(deps)
+            for dep in deps:
+                dependents.setdefault(dep, []).append(plugin)
+
+        system = self.system
+        profiler = self.profiler
+        if profiler is None:
+            load = lambda plugin: plugin.load(system)
+            prepare = lambda plugin: plugin.prepare(system)
         else:
-            if plugin.uniquename in self._inactivePlugins:
-                del self._inactivePlugins[plugin.uniquename]
-                return True
-            
-            if plugin.uniquename in self._activePlugins:           
-                if self._activePlugins[plugin.uniquename].unload(self.system):
-                    del self._activePlugins[plugin.uniquename]
-                    return True
-                else:
+            load = lambda plugin: profiler.call("load", plugin.uniquename, plugin.load, system)
+            prepare = lambda plugin: profiler.call("prepare", plugin.uniquename, plugin.prepare, system)
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(processes)
+        results = {}
+        def start(plugin):
+            if getattr(plugin, "threadSafe", True):
+                for name in self._lazyDependencies(plugin.uniquename):
+                    self.activateLazyPlugin(self._activePlugins[name])
+                results[plugin.uniquename] = pool.apply_async(load, (plugin,))
+        try:
+            for plugin in plugins:
+                if not waiting[plugin.uniquename]:
+                    start(plugin)
+            # State changes, prepare() and signals stay on this thread, in load order.
+            for plugin in plugins:
+                name = plugin.uniquename
+                if name not in results:
+                    self.loadPlugin(plugin)
+                elif self._markLoaded(plugin, results.pop(name).get()):
+                    prepare(plugin)
+                for dependent in dependents.get(name, ()):
+                    waiting[dependent.uniquename] -= 1
+                    if not waiting[dependent.uniquename]:
+                        start(dependent)
+        finally:
+            pool.close()
+            pool.join()
+
+    def unloadPlugin(self, plugin, cascade=False):
+        """ Unloads a plugin
+        plugin is a plugin instance or plugin uniquename
+        With cascade, the plugins depending on it are unloaded first, dependents before their
+        dependencies. Stops at the first one refusing to unload, returning False. """
+        node = self._registry.find(plugin)
+        if node is None or node.state == PRELOADED:
+            return False
+        
+        if cascade:
+            name = node.plugin.uniquename
+            for dependent in reversed(self._withDependents([name])):
+                if dependent != name and self.isRegistered(dependent) and not self.unloadPlugin(dependent):
                     return False
-            else:
+        
+        if node.state == ACTIVE:
+            if not node.plugin.unload(self.system): # If unloading fails, don't unload
                 return False
+        else:
+            self.system.events.invalidateDispatch()
+        
+        self._registry.release(node)
+        self.system.events.unregisterPlugin(node.plugin)
+        self._notify("unloaded", node.plugin.uniquename)
+        return True
              
+    def beginSignalBatch(self):
+        """ Holds back loaded/unloaded signals until the matching endSignalBatch(). Batches nest. """
+        self._signalBatchDepth += 1
+    
+    def endSignalBatch(self):
+        """ Ends a signal batch. The outermost one signals all plugins once, with
+        loaded and unloaded as lists of the uniquenames, or None if there were none. """
+        self._signalBatchDepth -= 1
+        if self._signalBatchDepth:
+            return
+        
+        loaded = self._batchedSignals["loaded"]
+        unloaded = self._batchedSignals["unloaded"]
+        if loaded or unloaded:
+            self._batchedSignals = {"loaded" : [], "unloaded" : []}
+            self.signalAll(loaded=loaded or None, unloaded=unloaded or None, signaller=self, system=self.system)
+    
+    def _notify(self, key, uniquename):
+        """ Signals all plugins that uniquename got loaded or unloaded, unless a batch is holding signals back. """
+        if self._signalBatchDepth:
+            self._batchedSignals[key].append(uniquename)
+        else:
+            kwargs = {key : uniquename}
+            self.signalAll(signaller=self, system=self.system, **kwargs)
+    
     def signalAll(self, inactive=True, **kwargs):
-        """ Signals all plugins """
-        for plugin in self._activePlugins.values():
-            self.signal(plugin, **kwargs)
-            
+        """ Signals all plugins. Every plugin receives the same Signal. """
+        args = Signal(**kwargs)
+        plugins = list(self._activePlugins.values())
         if inactive:
-            for plugin in self._inactivePlugins.values():
-                self.signal(plugin, **kwargs)
+            plugins.extend(self._inactivePlugins.values())
+        
+        profiler = self.profiler
+        if self.tracer is not None:
+            if profiler is None:
+                self.tracer.traceSignalAll(plugins, args, lambda plugin: plugin.signal(args))
+            else:
+                self.tracer.traceSignalAll(plugins, args, lambda plugin: profiler.call("signal", plugin.uniquename, plugin.signal, args))
+        elif profiler is None:
+            for plugin in plugins:
+                plugin.signal(args)
+        else:
+            for plugin in plugins:
+                profiler.call("signal", plugin.uniquename, plugin.signal, args)
         
-        self._logger.info("Signalled all plugins with data: " + str(kwargs))
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info("Signalled all plugins with data: %s", kwargs)
 
     def signal(self, plugin, **kwargs):
         """ Sends a signal to a plugin.
         plugin can either be an unique name or a plugin instance"""
-        if plugin in self._activePlugins:
-            plugin = self._activePlugins[plugin]
-        elif plugin in self._inactivePlugins:
-            plugin = self._inactivePlugins[plugin]
+        node = self._registry.find(plugin)
+        if node is not None:
+            plugin = node.plugin
         
-        plugin.signal(constructSignalArguments(**kwargs))
+        if self.profiler is None:
+            plugin.signal(Signal(**kwargs))
+        else:
+            self.profiler.call("signal", plugin.uniquename, plugin.signal, Signal(**kwargs))
         
     def getOptimalLoadOrder(self):
-        return tuple(self._optimalLoadOrder)
+        return tuple([self._preloadedPlugins[name].plugin for name in self._dependencyGraph.order])
+    
+    def getPluginModules(self):
+        """ Returns a dict of modulename -> list of the uniquenames of the plugins imported from it """
+        return dict((modulename, sorted(names)) for modulename, names in self._registry.modules.items())
+    
+    def reloadPlugin(self, uniquename):
+        """ Reloads the module of a plugin and swaps the new instances in, without restarting the system.
+        Only the plugins of that module and everything depending on them, transitively,
+        are unloaded (dependents first) and loaded again afterwards in dependency order,
+        with their event registrations restored. If the module fails to reload, one of the
+        plugins no longer resolves or one of its plugins fails to load again, the previous
+        module and instances are put back.
+        Returns True if the plugin was reloaded. """
+        node = self._registry.find(uniquename)
+        if node is None or uniquename not in self._preloadedPlugins or isinstance(node.plugin, LazyPlugin):
+            return False
+        
+        modulename, attributeName = node.source or (node.plugin.__class__.__module__, "plugins")
+        module = sys.modules.get(modulename)
+        if module is None:
+            return False
+        reloaded = sorted(self._registry.modules.get(modulename, [uniquename]))
+        affected = self._withDependents(reloaded)
+        
+        events = self.system.events
+        previous = {} # uniquename -> (plugin, state, subscriptions, priorities)
+        for name in affected:
+            plugin = self._preloadedPlugins[name].plugin
+            previous[name] = (plugin, self._preloadedPlugins[name].state, events.getSubscriptions(plugin), events.getPriorities(plugin))
+        
+        for i, name in enumerate(reversed(affected)):
+            if previous[name][1] != PRELOADED and not self.unloadPlugin(name):
+                self._logger.warning("Cannot reload %s: %s refused to unload.", modulename, name)
+                self._loadAgain(affected[len(affected) - i:], previous)
+                return False
+        
+        saved = dict(module.__dict__)
+        try:
+            reloadModule(module)
+            fresh = getattr(module, attributeName)
+            if not isinstance(fresh, (list, tuple)):
+                fresh = [fresh]
+            fresh = dict((plugin.uniquename, plugin) for plugin in fresh)
+            for name in reloaded:
+                self._swapPreloaded(name, fresh[name])
+            
+            order = set(self._dependencyGraph.order)
+            unresolved = [name for name in affected if previous[name][1] != PRELOADED and name not in order]
+            if unresolved:
+                raise DependencyNotSatisfiedError("%s no longer resolved after reloading." % ", ".join(unresolved), unresolved[0])
+            self._loadAgain(affected, previous)
+            for name in reloaded:
+                if previous[name][1] == ACTIVE and not self.isActive(name):
+                    raise RuntimeError("%s failed to load after reloading." % name)
+        except Exception:
+            self._logger.exception("Reloading %s failed, rolling back to the previous module.", modulename)
+            for name in reversed(affected):
+                if self.isRegistered(name):
+                    self.unloadPlugin(name)
+            module.__dict__.clear()
+            module.__dict__.update(saved)
+            for name in reloaded:
+                self._swapPreloaded(name, previous[name][0])
+            self._loadAgain(affected, previous)
+            return False
+        
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info("Reloaded %s: %s", modulename, ", ".join(affected))
+        return True
+    
+    def _withDependents(self, names):
+        """ names and all the plugins depending on them, transitively, in dependency order. """
+        dependents = self._dependencyGraph.dependents
+        found = set(names)
+        pending = list(names)
+        while pending:
+            for dependent in dependents.get(pending.pop(), ()):
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        levels = self._dependencyGraph.levels
+        return sorted(found, key=lambda name: (levels.get(name, 0), name))
+    
+    def _swapPreloaded(self, name, plugin):
+        """ Preloads plugin in place of the previous instance, re-resolving if its dependencies changed.
+        A fresh plugin asking for process isolation is wrapped again, so its workers reload its module. """
+        node = self._preloadedPlugins[name]
+        before = node.dependency
+        if getattr(plugin, "isolation", None) == "process" and node.source is not None:
+            generation = node.plugin.generation + 1 if isinstance(node.plugin, IsolatedPlugin) else 0
+            plugin = self._isolate(plugin, node.source, generation)
+        self._registry.preload(plugin)
+        if getattr(plugin, "dependency", [[]]) != before:
+            self._dependencyGraph.invalidate([name])
+            self._refreshLoadOrder()
+    
+    def _loadAgain(self, names, previous):
+        """ Loads names again, in order, restoring the event registrations they had. """
+        events = self.system.events
+        for name in names:
+            if previous[name][1] == PRELOADED:
+                continue
+            plugin = self._preloadedPlugins[name].plugin
+            self.loadPlugin(plugin)
+            if self.isActive(name):
+                events.restoreSubscriptions(plugin, previous[name][2], previous[name][3])
     
 class Plugin:
     """ This is an empty class for now. Other features may be developed in the future.
@@ -356,7 +2424,16 @@ class Plugin:
         .signal(args) - This is used to signal plugins of events.
         .prepare(system) - This is performed right after loading. Hook into the system Events here.
     Plugin file format: Python file with whatever you want in it. However, only instance will be imported.
-    Make sure it has a .plugin attribute at the module level with an instance of your plugin setup to go."""
+    Make sure it has a .plugin attribute at the module level with an instance of your plugin setup to go.
+    A module-level lazyPlugins literal lets System(lazyLoad=True) skip importing the file until
+    one of the declared events fires. See readLazyMetadata.
+    Optional, for System.snapshot() and forking workers:
+        .snapshottable - True if the plugin implements snapshot and restore.
+        .snapshot(system) - Returns the picklable state of the loaded and prepared plugin.
+        .restore(state, system) - Takes the place of load and prepare when starting from a snapshot.
+            Event registrations come back on their own. Returns True like load.
+        .beforeFork(system) - One-time setup in the parent, see System.prepareFork.
+        .afterFork(system) - Reopens per-process resources in a forked child."""
 
     def __init__(self):
         self.name = "Plugin Base"
@@ -377,6 +2454,607 @@ class Plugin:
     def __repr__(self):
         return "<Plugin:" + self.uniquename + ">"
 
+def readLazyMetadata(path, attributeName="lazyPlugins"):
+    """ Reads the module-level lazyPlugins literal out of a plugin file without importing it.
+    lazyPlugins is a list with a dict per plugin of the module:
+        {"uniquename" : ..., "name" : ..., "dependency" : [[...]], "events" : {eventname : functionname}}
+    and optionally the "critical", "threadSafe" and "isolation" attributes of the plugin.
+    Returns None if the file doesn't declare it. """
+    import ast
+    f = open(path)
+    try:
+        tree = ast.parse(f.read(), path)
+    finally:
+        f.close()
+    
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id == attributeName:
+                    return ast.literal_eval(node.value)
+    return None
+
+def scanDirectory(directory):
+    """ Yields (filename, path, isFile, isDir) for the entries of a directory as they are read,
+    with os.scandir where it exists, which spares a stat per entry. """
+    if hasattr(os, "scandir"): # Python 3.5+
+        for entry in os.scandir(directory):
+            yield entry.name, entry.path, entry.is_file(), entry.is_dir()
+    else:
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            yield filename, path, os.path.isfile(path), os.path.isdir(path)
+
+def iterPluginModules(plugindir, byFile=False, byFileStartsWith="plugin_", byDirFileName="main"):
+    """ Yields the (modulename, modulepath) of the plugin modules of a directory as they are found """
+    for filename, path, isFile, isDir in scanDirectory(plugindir):
+        if byFile:
+            if isFile and filename.startswith(byFileStartsWith) and filename.endswith(".py"):
+                yield os.path.splitext(filename)[0], path
+        elif isDir:
+            modulepath = os.path.join(path, "%s.py" % byDirFileName)
+            if os.path.isfile(modulepath):
+                yield filename+"."+byDirFileName, modulepath
+
+def listPluginModules(plugindir, byFile=False, byFileStartsWith="plugin_", byDirFileName="main"):
+    """ Lists the plugin modules of a directory.
+    Returns a list of (modulename, modulepath) """
+    return list(iterPluginModules(plugindir, byFile, byFileStartsWith, byDirFileName))
+
+def importInProgress():
+    """ True if a module is being imported. Python 2 holds the global import lock meanwhile;
+    Python 3 has per-module locks instead, and marks the spec of a module it is executing. """
+    if importLockHeld():
+        return True
+    for module in list(sys.modules.values()):
+        if getattr(getattr(module, "__spec__", None), "_initializing", False):
+            return True
+    return False
+
+def streamMap(func, items, threads=0):
+    """ Yields func(item) for every item of the iterable items, in order, as soon as each is ready.
+    With threads > 1, the items are consumed and func is called on a pool of that many threads,
+    running ahead of the caller, unless a module is being imported: func is meant to import modules,
+    and the threads would deadlock on one that imports the module the caller is importing. """
+    if threads <= 1 or importInProgress():
+        for item in items:
+            yield func(item)
+        return
+    
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(threads)
+    try:
+        for result in pool.imap(func, items):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+class DiscoveryCache:
+    """ A manifest of plugin directories, kept as JSON between runs.
+    A directory listing is reused for as long as the mtime of the directory is
+    unchanged (and, for the byDirFileName layout, of each of its subdirectories).
+    What is read statically out of a module file, its lazyPlugins metadata or
+    the names its imports provide, is reused for as long as the file keeps its
+    mtime and size, or failing that, its sha1. Anything that changed is
+    rescanned on its own.
+    An mtime no older than the manifest itself proves nothing, as a change made
+    within the same tick of the clock leaves it as it was: such entries are
+    checked again, as git does with racily clean files. """
+    def __init__(self, path):
+        import json
+        self.path = path
+        self.directories = {}
+        self.files = {}
+        self.changed = False
+        self.written = None # mtime of the manifest, None until there is one
+        
+        if os.path.isfile(path):
+            try:
+                f = open(path)
+                try:
+                    manifest = json.load(f)
+                finally:
+                    f.close()
+                self.directories = manifest["directories"]
+                self.files = manifest["files"]
+                self.written = os.stat(path).st_mtime
+            except (ValueError, KeyError, TypeError, IOError): # A broken manifest is just rebuilt.
+                logging.getLogger("core.DiscoveryCache").warning("Ignoring unreadable discovery cache %s", path)
+    
+    def save(self):
+        """ Writes the manifest back to disk if anything changed """
+        import json
+        if self.changed:
+            f = open(self.path, "w")
+            try:
+                json.dump({"directories" : self.directories, "files" : self.files}, f)
+            finally:
+                f.close()
+            self.changed = False
+            self.written = os.stat(self.path).st_mtime
+    
+    def _racy(self, mtime):
+        """ Whether something with that mtime may have changed unnoticed since it was recorded """
+        return self.written is None or mtime >= self.written
+    
+    def listModules(self, plugindir, byFile=False, byFileStartsWith="plugin_", byDirFileName="main"):
+        """ Same as listPluginModules, from the manifest where it is still valid """
+        key = os.path.abspath(plugindir)
+        layout = [byFile, byFileStartsWith, byDirFileName]
+        mtime = os.stat(plugindir).st_mtime
+        directory = self.directories.get(key)
+        if directory is None or directory["layout"] != layout:
+            directory = {"layout" : layout, "mtime" : None, "entries" : []}
+        
+        if directory["mtime"] != mtime or self._racy(mtime):
+            previous = dict((entry[0], entry) for entry in directory["entries"])
+            entries = []
+            for filename, path, isFile, isDir in scanDirectory(plugindir):
+                if byFile:
+                    if isFile and filename.startswith(byFileStartsWith) and filename.endswith(".py"):
+                        entries.append([filename])
+                elif isDir:
+                    # Subdirectories are kept with their mtime and whether they hold the module.
+                    entries.append(previous.get(filename, [filename, None, False]))
+            directory["mtime"] = mtime
+            directory["entries"] = entries
+            self.directories[key] = directory
+            self.changed = True
+        
+        modules = []
+        for entry in directory["entries"]:
+            path = os.path.join(plugindir, entry[0])
+            if byFile:
+                modules.append((os.path.splitext(entry[0])[0], path))
+                continue
+            
+            subdirmtime = os.stat(path).st_mtime
+            if entry[1] != subdirmtime or self._racy(subdirmtime):
+                entry[1] = subdirmtime
+                entry[2] = ("%s.py" % byDirFileName) in os.listdir(path)
+                self.changed = True
+            if entry[2]:
+                modules.append((entry[0]+"."+byDirFileName, os.path.join(path, "%s.py" % byDirFileName)))
+        return modules
+    
+    def fileInfo(self, path):
+        """ Returns the manifest entry of a module file, emptied first if the file changed """
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        info = self.files.get(key)
+        if info is not None and info["mtime"] == stat.st_mtime and info["size"] == stat.st_size and not self._racy(stat.st_mtime):
+            return info
+        
+        import hashlib
+        f = open(path, "rb")
+        try:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        finally:
+            f.close()
+        if info is None or info["sha1"] != digest:
+            info = {"sha1" : digest}
+        info["mtime"] = stat.st_mtime
+        info["size"] = stat.st_size
+        self.files[key] = info
+        self.changed = True
+        return info
+    
+    def lazyMetadata(self, path):
+        """ Same as readLazyMetadata, from the manifest where it is still valid """
+        info = self.fileInfo(path)
+        if "lazyPlugins" not in info:
+            info["lazyPlugins"] = readLazyMetadata(path)
+            self.changed = True
+        return info["lazyPlugins"]
+    
+    def importNames(self, path, importsAttributeName="imports"):
+        """ Same as scanImportNames, from the manifest where it is still valid """
+        info = self.fileInfo(path)
+        key = "importNames:" + importsAttributeName
+        if key not in info:
+            info[key] = scanImportNames(path, importsAttributeName)
+            self.changed = True
+        return info[key]
+
+class LazyPlugin(Plugin):
+    """ Stands in for a plugin declared through lazyPlugins metadata.
+    It registers to the declared events in its place, and the first time one
+    of them fires, the PluginManager imports, loads and prepares the real
+    plugin (and its lazy dependencies) and hands the event over to it.
+    A plugin that isn't lazy and depends on it activates it before being loaded.
+    Signals sent before that are not delivered to the real plugin. """
+    def __init__(self, modulename, pluginsAttributeName, metadata):
+        self.uniquename = metadata["uniquename"]
+        self.name = metadata.get("name", self.uniquename)
+        self.dependency = metadata.get("dependency", [[]])
+        self.events = dict(metadata.get("events", {}))
+        self.critical = metadata.get("critical", False)
+        self.threadSafe = metadata.get("threadSafe", True)
+        # Only the real plugin runs isolated, once activated.
+        self.isolation = metadata.get("isolation", None)
+        self.modulename = modulename
+        self.pluginsAttributeName = pluginsAttributeName
+        self.system = None
+    
+    def load(self, system):
+        self.system = system
+        return True
+    
+    def prepare(self, system):
+        for eventname, functionname in self.events.items():
+            system.events.registerEvent(eventname)
+            if not system.events.registerPluginToEvent(self, eventname, functionname):
+                return False
+        return True
+    
+    def resolve(self):
+        """ Imports the module and returns the real plugin instance """
+        module = __import__(self.modulename, fromlist=[self.pluginsAttributeName])
+        for plugin in getattr(module, self.pluginsAttributeName):
+            if plugin.uniquename == self.uniquename:
+                return plugin
+        raise ImportError("%s doesn't provide the lazy plugin %s." % (self.modulename, self.uniquename))
+    
+    def __getattr__(self, name):
+        # Handlers of the declared events, all bound to the activating trampoline.
+        if name in self.__dict__.get("events", {}).values():
+            return lambda args: self._activateAndCall(name, args)
+        raise AttributeError(name)
+    
+    def _activateAndCall(self, functionname, args):
+        plugin = self.system.plugins.activateLazyPlugin(self)
+        if plugin is None or isinstance(plugin, LazyPlugin):
+            return False
+        return getattr(plugin, functionname)(args)
+    
+    def __repr__(self):
+        return "<LazyPlugin:" + self.uniquename + ">"
+
+class PluginWatcher:
+    """ Watches the module files of the imported plugins and reloads a plugin
+    through PluginManager.reloadPlugin when its file changes.
+    Either call poll() from your own loop, or start() to poll every interval
+    seconds on a daemon thread. In the latter case the reloads happen on that thread. """
+    def __init__(self, plugins, interval=1.0):
+        self.plugins = plugins
+        self.interval = interval
+        self._mtimes = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        self.poll() # Records where things stand.
+    
+    def poll(self):
+        """ Reloads the plugins of every module file changed since the last poll. Returns those modulenames. """
+        changed = []
+        for modulename, names in self.plugins.getPluginModules().items():
+            path = getattr(sys.modules.get(modulename), "__file__", None)
+            if not path:
+                continue
+            if path.endswith(".pyc") or path.endswith(".pyo"):
+                path = path[:-1]
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            
+            previous = self._mtimes.get(modulename)
+            self._mtimes[modulename] = mtime
+            if previous is not None and previous != mtime:
+                self.plugins.reloadPlugin(names[0])
+                changed.append(modulename)
+        return changed
+    
+    def start(self):
+        """ Starts polling on a daemon thread """
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="PluginWatcher")
+            self._thread.daemon = True
+            self._thread.start()
+    
+    def stop(self):
+        """ Stops the polling thread """
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+class IsolatedPluginError(Exception):
+    """ Raised on the host when an isolated plugin raised inside its worker process.
+    The message carries the traceback from the worker. """
+
+def _portableSignal(args):
+    """ A copy of signal arguments that can be pickled over to a worker process.
+    system is dropped and signaller is replaced by its uniquename. """
+    portable = dict(args)
+    portable["system"] = None
+    if portable.get("signaller", None) is not None:
+        portable["signaller"] = getattr(portable["signaller"], "uniquename", None)
+    return portable
+
+class _RemoteSystem:
+    """ The system as an isolated plugin sees it inside its worker process.
+    Event (un)registrations are recorded and replayed on the host; plugin
+    states are a snapshot taken when the request was sent. """
+    def __init__(self, states):
+        self.events = self
+        self.plugins = self
+        self.calls = []
+        self._states = states
+    
+    def registerEvent(self, eventname):
+        self.calls.append(("registerEvent", eventname))
+        return True
+    
+    def registerPluginToEvent(self, plugin, eventname, functionname, priority=0):
+        self.calls.append(("registerPluginToEvent", eventname, functionname, priority))
+        return True
+    
+    def unregisterPluginFromEvent(self, plugin, eventname):
+        self.calls.append(("unregisterPluginFromEvent", eventname))
+        return True
+    
+    def isActive(self, pluginname):
+        return self._states.get(pluginname) == ACTIVE
+    
+    def isInactive(self, pluginname):
+        return self._states.get(pluginname) == INACTIVE
+    
+    def isRegistered(self, pluginname):
+        return pluginname in self._states
+
+def _isolatedWorker(connection, path):
+    """ Main loop of a worker process hosting isolated plugins.
+    Requests are (operation, uniquename, payload); replies are (True, result) or (False, traceback). """
+    sys.path[:] = path
+    plugins = {}
+    # modulename -> generation of the module imported, see IsolatedPlugin.generation.
+    generations = {}
+    while True:
+        try:
+            operation, uniquename, payload = connection.recv()
+        except (EOFError, IOError, OSError):
+            break
+        if operation == "stop":
+            break
+        
+        try:
+            if operation == "load":
+                modulename, attributeName, states, generation = payload
+                if generations.get(modulename, 0) < generation and modulename in sys.modules:
+                    reloadModule(sys.modules[modulename])
+                generations[modulename] = max(generation, generations.get(modulename, 0))
+                candidates = getattr(__import__(modulename, fromlist=[attributeName]), attributeName)
+                if not isinstance(candidates, (list, tuple)):
+                    candidates = [candidates]
+                plugins[uniquename] = [plugin for plugin in candidates if plugin.uniquename == uniquename][0]
+                system = _RemoteSystem(states)
+                result = (plugins[uniquename].load(system), system.calls)
+            elif operation in ("prepare", "unload"):
+                system = _RemoteSystem(payload)
+                result = (getattr(plugins[uniquename], operation)(system), system.calls)
+                if operation == "unload" and result[0]:
+                    del plugins[uniquename]
+            elif operation == "signal":
+                result = plugins[uniquename].signal(payload)
+            else: # call
+                functionname, args = payload
+                result = getattr(plugins[uniquename], functionname)(args)
+            reply = (True, result)
+        except Exception:
+            reply = (False, traceback.format_exc())
+        
+        try:
+            connection.send(reply)
+        except Exception: # The result couldn't be pickled.
+            connection.send((False, traceback.format_exc()))
+
+class _Reply:
+    """ The pending reply to a request sent to a worker process """
+    def __init__(self, worker):
+        self.worker = worker
+        self.done = False
+        self.crashed = False
+        self.value = None
+    
+    def wait(self):
+        """ Blocks until the reply arrived. Returns (succeeded, value), or None if the worker died. """
+        if not self.done:
+            self.worker.receive(self)
+        if self.crashed:
+            return None
+        return self.value
+
+class _Worker:
+    """ One worker process of a ProcessPluginPool, talked to over a pipe.
+    Replies come back in the order requests were sent, so whoever waits first
+    reads every reply queued before its own. """
+    def __init__(self):
+        import multiprocessing
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_isolatedWorker, args=(child, list(sys.path)), name="IsolatedPluginWorker")
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.plugins = set()
+        self.alive = True
+    
+    def submit(self, operation, uniquename, payload=None):
+        """ Sends a request, returns its _Reply """
+        reply = _Reply(self)
+        self.lock.acquire()
+        try:
+            if self.alive:
+                try:
+                    self.connection.send((operation, uniquename, payload))
+                    self.pending.append(reply)
+                    return reply
+                except (EOFError, IOError, OSError):
+                    self._died()
+            reply.done = reply.crashed = True
+            return reply
+        finally:
+            self.lock.release()
+    
+    def receive(self, reply):
+        self.lock.acquire()
+        try:
+            while not reply.done:
+                oldest = self.pending.popleft()
+                try:
+                    oldest.value = self.connection.recv()
+                    oldest.done = True
+                except (EOFError, IOError, OSError):
+                    oldest.done = oldest.crashed = True
+                    self._died()
+        finally:
+            self.lock.release()
+    
+    def _died(self):
+        self.alive = False
+        while self.pending:
+            reply = self.pending.popleft()
+            reply.done = reply.crashed = True
+    
+    def stop(self):
+        self.lock.acquire()
+        try:
+            if self.alive:
+                try:
+                    self.connection.send(("stop", None, None))
+                except (EOFError, IOError, OSError):
+                    pass
+                self.alive = False
+        finally:
+            self.lock.release()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+class ProcessPluginPool:
+    """ A pool of worker processes hosting plugins that declare isolation = "process".
+    Each plugin lives in one worker; plugins are spread over the workers still alive. """
+    def __init__(self, processes=None):
+        import multiprocessing
+        self.processes = processes or multiprocessing.cpu_count()
+        self.workers = []
+    
+    def assign(self, uniquename):
+        """ Returns the worker uniquename is to be loaded into """
+        alive = [worker for worker in self.workers if worker.alive]
+        if len(alive) < self.processes:
+            worker = _Worker()
+            self.workers.append(worker)
+        else:
+            worker = min(alive, key=lambda worker: len(worker.plugins))
+        worker.plugins.add(uniquename)
+        return worker
+    
+    def close(self):
+        """ Stops every worker process """
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+class IsolatedCall:
+    """ An event handler of an IsolatedPlugin. Calling it runs the handler in the worker
+    process and waits; submit() only sends it off and returns a callable that waits. """
+    def __init__(self, plugin, functionname):
+        self.plugin = plugin
+        self.functionname = functionname
+    
+    def __call__(self, args):
+        return self.submit(args)(args)
+    
+    def submit(self, args):
+        reply = self.plugin.worker.submit("call", self.plugin.uniquename, (self.functionname, _portableSignal(args)))
+        return lambda args: self.plugin._result(reply, self.functionname, False)
+
+class IsolatedPlugin(Plugin):
+    """ Stands in on the host for a plugin declaring isolation = "process".
+    The real plugin is imported and run inside a worker process of a
+    ProcessPluginPool; load, prepare, unload, signal and its event handlers are
+    forwarded there with pickled arguments (see _RemoteSystem for what the
+    plugin can do with the system it is given). If the worker dies, every
+    plugin it hosted is put to inactive and their calls return False.
+    generation counts the reloads of the module; a worker importing it at an
+    older generation reloads it first. """
+    def __init__(self, plugin, source, pool, generation=0):
+        self.name = plugin.name
+        self.uniquename = plugin.uniquename
+        self.dependency = getattr(plugin, "dependency", [[]])
+        self.critical = getattr(plugin, "critical", False)
+        self.source = source
+        self.pool = pool
+        self.generation = generation
+        self.worker = None
+        self.system = None
+        self.handlers = set()
+    
+    def load(self, system):
+        self.system = system
+        if self.worker is None or not self.worker.alive:
+            self.worker = self.pool.assign(self.uniquename)
+        payload = (self.source[0], self.source[1], system.plugins.getPluginStates(), self.generation)
+        return self._replay(self._result(self.worker.submit("load", self.uniquename, payload), "load", (False, [])))
+    
+    def prepare(self, system):
+        reply = self.worker.submit("prepare", self.uniquename, system.plugins.getPluginStates())
+        return self._replay(self._result(reply, "prepare", (False, [])))
+    
+    def unload(self, system):
+        reply = self.worker.submit("unload", self.uniquename, system.plugins.getPluginStates())
+        result = self._replay(self._result(reply, "unload", (True, [])))
+        if result:
+            self.worker.plugins.discard(self.uniquename)
+        return result
+    
+    def signal(self, args):
+        if self.worker is not None:
+            self._result(self.worker.submit("signal", self.uniquename, _portableSignal(args)), "signal", None)
+    
+    def _replay(self, result):
+        """ Applies the (un)registrations the plugin made in its worker to the host. """
+        status, calls = result
+        events = self.system.events
+        for call in calls:
+            if call[0] == "registerEvent":
+                events.registerEvent(call[1])
+            elif call[0] == "registerPluginToEvent":
+                self.handlers.add(call[2])
+                events.registerPluginToEvent(self, call[1], call[2], call[3])
+            else:
+                events.unregisterPluginFromEvent(self, call[1])
+        return status
+    
+    def _result(self, reply, operation, crashed):
+        """ Waits for reply. Returns crashed if the worker died, raises IsolatedPluginError if the plugin raised. """
+        value = reply.wait()
+        if value is None:
+            for uniquename in list(self.worker.plugins):
+                self.system.plugins.deactivatePlugin(uniquename)
+            return crashed
+        succeeded, result = value
+        if not succeeded:
+            raise IsolatedPluginError("%s.%s() failed in its worker process:\n%s" % (self.uniquename, operation, result))
+        return result
+    
+    def __getattr__(self, name):
+        # Handlers the plugin registered from its worker.
+        if name in self.__dict__.get("handlers", ()):
+            return IsolatedCall(self, name)
+        raise AttributeError(name)
+    
+    def __repr__(self):
+        return "<IsolatedPlugin:" + self.uniquename + ">"
+
 class System(Plugin):
     """ The system itself. It's also a plugin, technically, only it regulates everything """
     def __init__(self, plugindirs=[], defaultsetdirs=[], autoStart=True, **kwargs):
@@ -394,31 +3072,265 @@ class System(Plugin):
         
         self.pluginsAttributeName = kwargs.get("pluginsAttributeName", "plugins")
         
+        # Send one coalesced loaded signal at the end of start() instead of one per plugin.
+        self.batchSignals = kwargs.get("batchSignals", False)
+        
+        # Keep modules declaring lazyPlugins unimported until one of their events fires.
+        self.lazyLoad = kwargs.get("lazyLoad", False)
+        
+        # Number of worker processes for plugins with isolation = "process". Defaults to the cpu count.
+        self.plugins.isolationProcesses = kwargs.get("isolationProcesses", None)
+        
+        # Path of a DiscoveryCache manifest that spares directory scans on the next start.
+        if kwargs.get("discoveryCache", None):
+            self.plugins.discoveryCache = DiscoveryCache(kwargs["discoveryCache"])
+        
+        # Number of threads used to load plugins of the same dependency level. 0 or 1 loads serially.
+        self.parallelLoad = kwargs.get("parallelLoad", 0)
+        
+        # Number of threads importing plugin modules ahead of preloading. 0 or 1 imports serially,
+        # and so does a System started while a module is being imported, see streamMap.
+        self.importThreads = kwargs.get("importThreads", 0)
+        
+        # Worker threads, size and backpressure mode (BLOCK, DROP_OLDEST or REJECT) of the queue behind events.post().
+        self.events.queueWorkers = kwargs.get("queueWorkers", 4)
+        self.events.queueSize = kwargs.get("queueSize", 1024)
+        self.events.queueBackpressure = kwargs.get("queueBackpressure", BLOCK)
+        
+        # How many names only wildcard patterns match keep a compiled dispatch table.
+        self.events.dispatchCacheSize = kwargs.get("dispatchCacheSize", 1024)
+        
+        # Trace one in every traceEvery fires of each event to the "core.trace" logger. 0 traces none.
+        self.events.traceEvery = kwargs.get("traceEvery", 0)
+        
+        # Time imports, load(), prepare(), signal() and handlers from the start. See stats().
+        if kwargs.get("profile", False):
+            self.enableProfiling()
+        
+        # Record spans of one in every tracingSampleEvery call trees of fires. See enableTracing().
+        if kwargs.get("tracing", False):
+            from tracer import Tracer
+            self.enableTracing(Tracer(kwargs.get("tracingSampleEvery", 1), kwargs.get("tracingCapacity", 65536)))
+        
+        # Whether prepareFork() ran already.
+        self.forkPrepared = False
+        
         self.started = False
         if autoStart:
-            self.start()
+            self.start(kwargs.get("snapshot", None))
         
-    def start(self):
-        """ System starts. Loads plugins and etc. Fires SystemInit event """
+    def start(self, snapshot=None):
+        """ System starts. Loads plugins and etc. Fires SystemInit event
+        snapshot is a dict returned by snapshot() on a system started from the same directories.
+        The plugins are still imported, but the load order is taken from it, and snapshottable
+        plugins get their state back instead of being loaded and prepared. """
         if not self.started:
             self.started = True
             self.events.registerEvent("SystemInit")
-            self.plugins.loadPlugin(self)
-            
-            for defaultsetdir in self.plugindirs:
-                self.plugins.importPlugins(defaultsetdir, self.byFile[0], self.byFile[1], self.byDirFileName, self.pluginsAttributeName)
+            load = snapshot is None
+            if self.batchSignals:
+                self.plugins.beginSignalBatch()
+            try:
+                self.plugins.loadPlugin(self)
+                
+                for defaultsetdir in self.plugindirs:
+                    self.plugins.importPlugins(defaultsetdir, self.byFile[0], self.byFile[1], self.byDirFileName, self.pluginsAttributeName, parallelLoad=self.parallelLoad, lazyLoad=self.lazyLoad, load=load, importThreads=self.importThreads)
+                
+                for plugindir in self.plugindirs:
+                    self.plugins.importPlugins(plugindir, self.byFile[0], self.byFile[1], self.byDirFileName, self.pluginsAttributeName, parallelLoad=self.parallelLoad, lazyLoad=self.lazyLoad, load=load, importThreads=self.importThreads)
+                
+                if snapshot is not None:
+                    self.plugins.restoreSnapshot(snapshot)
+            finally:
+                if self.batchSignals:
+                    self.plugins.endSignalBatch()
             
-            for plugindir in self.plugindirs:
-                self.plugins.importPlugins(plugindir, self.byFile[0], self.byFile[1], self.byDirFileName, self.pluginsAttributeName)
+            if self.plugins.discoveryCache is not None:
+                self.plugins.discoveryCache.save()
             
             self.events.fire("SystemInit")
         else:
             raise RuntimeError("System has already been started.")
     
+    def snapshot(self):
+        """ Returns the state of the started system as a picklable dict: the resolved load order,
+        the plugin states, the event registration tables, and whatever the active plugins declaring
+        snapshottable = True return from their snapshot(system). Pass it to System(snapshot=...)
+        or start(snapshot) to boot the same plugin directories without resolving and loading. """
+        snapshot = self.plugins.snapshot()
+        snapshot["version"] = SNAPSHOT_VERSION
+        snapshot["events"] = self.events.getTables()
+        return snapshot
+    
+    def prepareFork(self):
+        """ One-time setup in the parent before forking workers: calls beforeFork(system) on the
+        active plugins having one, in load order, compiles every dispatch table, then collects and
+        freezes the garbage collected objects where gc.freeze exists, so the children share them
+        copy-on-write. Runs once; fork() calls it. """
+        if self.forkPrepared:
+            return
+        self.forkPrepared = True
+        for plugin in self._activeInOrder():
+            if hasattr(plugin, "beforeFork"):
+                plugin.beforeFork(self)
+        self.events.compileDispatch()
+        gc.collect()
+        if hasattr(gc, "freeze"): # Python 3.7+
+            gc.freeze()
+    
+    def afterFork(self):
+        """ To be called in a forked child. Drops what cannot be shared with the parent, then calls
+        afterFork(system) on the active plugins having one, in load order, to reopen per-process
+        resources. Isolated plugins are put to inactive, since their workers belong to the parent.
+        The event queue is started again on the next post(). """
+        self.events.afterFork()
+        if self.plugins.profiler is not None:
+            self.plugins.profiler.afterFork()
+        if self.plugins.isolationPool is not None:
+            self.plugins.isolationPool = None
+            for plugin in list(self.plugins._activePlugins.values()):
+                if isinstance(plugin, IsolatedPlugin):
+                    plugin.worker = None
+                    self.plugins.deactivatePlugin(plugin)
+        for plugin in self._activeInOrder():
+            if hasattr(plugin, "afterFork"):
+                plugin.afterFork(self)
+    
+    def fork(self):
+        """ Forks a worker sharing the started system. Returns the pid in the parent and 0 in the child,
+        after prepareFork() and afterFork() respectively. """
+        self.prepareFork()
+        pid = os.fork()
+        if pid == 0:
+            self.afterFork()
+        return pid
+    
+    def _activeInOrder(self):
+        """ Returns the active plugins in load order """
+        active = self.plugins._activePlugins
+        return [plugin for plugin in self.plugins.getOptimalLoadOrder() if plugin.uniquename in active]
+    
+    def enableProfiling(self, profiler=None):
+        """ Starts timing plugin operations and event handlers. Returns the Profiler in use. """
+        if profiler is None:
+            profiler = self.plugins.profiler
+        if profiler is None:
+            from profiler import Profiler
+            profiler = Profiler()
+        self.plugins.profiler = self.events.profiler = profiler
+        self.events.invalidateDispatch()
+        return profiler
+    
+    def disableProfiling(self):
+        """ Stops timing. The Profiler, and the timings it collected, are returned. """
+        profiler = self.plugins.profiler
+        self.plugins.profiler = self.events.profiler = None
+        self.events.invalidateDispatch()
+        return profiler
+    
+    def enableTracing(self, tracer=None):
+        """ Starts recording spans of fires, handlers and signalAll fan-outs. Returns the Tracer in use. """
+        if tracer is None:
+            tracer = self.events.tracer
+        if tracer is None:
+            from tracer import Tracer
+            tracer = Tracer()
+        self.plugins.tracer = self.events.tracer = tracer
+        self.events.invalidateDispatch()
+        return tracer
+    
+    def disableTracing(self):
+        """ Stops recording spans. The Tracer, and the spans it holds, are returned. """
+        tracer = self.events.tracer
+        self.plugins.tracer = self.events.tracer = None
+        self.events.invalidateDispatch()
+        return tracer
+    
+    def stats(self, format=None):
+        """ Returns the timings collected since profiling got enabled, as a dict (see Profiler.stats),
+        or as text if format is "json" or "prometheus". Empty if profiling was never enabled. """
+        profiler = self.plugins.profiler
+        if profiler is None:
+            from profiler import Profiler
+            profiler = Profiler()
+        if format == "json":
+            return profiler.dumpJSON()
+        elif format == "prometheus":
+            return profiler.dumpPrometheus()
+        return profiler.stats()
+    
     def unload(self, system):
         return False
 
+def scanImportNames(path, importsAttributeName="imports"):
+    """ Reads the names a pluggable imports file provides without importing it.
+    Only works for literal flags and an imports list of plain names (list based)
+    or a dict with literal keys. Returns a list of names, or None if the file has
+    to be imported to know them. """
+    import ast
+    f = open(path)
+    try:
+        tree = ast.parse(f.read(), path)
+    except SyntaxError: # Left for the import to report.
+        return None
+    finally:
+        f.close()
+    
+    imports = flags = None
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id == importsAttributeName:
+                    imports = node.value
+                elif isinstance(target, ast.Name) and target.id == "flags":
+                    flags = node.value
+    if imports is None:
+        return None
+    
+    try:
+        flags = ast.literal_eval(flags) if flags is not None else False
+        if flags and (flags.get("autoGenerateNames", False) or flags.get("listBased")):
+            if not isinstance(imports, (ast.List, ast.Tuple)) or [item for item in imports.elts if not isinstance(item, ast.Name)]:
+                return None
+            names = [item.id for item in imports.elts]
+        else:
+            if not isinstance(imports, ast.Dict):
+                return None
+            names = [ast.literal_eval(key) for key in imports.keys]
+    except (ValueError, AttributeError):
+        return None
+    
+    if not [name for name in names if not isinstance(name, stringTypes)]:
+        prefix = flags and flags.get("prefix", False)
+        if prefix:
+            names = [prefix+name for name in names]
+        return names
+    return None
+
+class _PluggableModule(types.ModuleType):
+    """ A module of the PluggableImports meta path hook, its attributes resolved through get(). """
+    def __init__(self, name, imports, prefix):
+        types.ModuleType.__init__(self, name)
+        self.__path__ = []
+        self.__pluggable__ = (imports, prefix)
+    
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        imports, prefix = self.__dict__["__pluggable__"]
+        try:
+            return imports.get(prefix+name)
+        except ImportError:
+            raise AttributeError(name)
+
 class PluggableImports:
+    """ Imports classes and functions out of the imports_* files of plugin directories,
+    made available by name through get().
+    With lazy=True, importAll() only reads the names each file provides (see
+    scanImportNames, or the DiscoveryCache passed as discoveryCache) and a file is
+    imported the first time get() asks for one of its names. install() hooks the
+    names into the import system, so "from pluggable.i import SomeClass" resolves
+    to get("i.SomeClass"). """
     def __init__(self, plugindirs=[], defaultsetdirs=[], autoStart=True, **kwargs):
         self._plugindirs = plugindirs
         self._defaultsetdirs = defaultsetdirs
@@ -430,58 +3342,100 @@ class PluggableImports:
         
         self._importsAttributeName = kwargs.get("importsAttributeName", "imports")
         
+        self._lazy = kwargs.get("lazy", False)
+        # Number of threads importing the files of a directory ahead of importDir, see streamMap.
+        self._importThreads = kwargs.get("importThreads", 0)
+        self._discoveryCache = kwargs.get("discoveryCache", None)
+        if isinstance(self._discoveryCache, stringTypes):
+            self._discoveryCache = DiscoveryCache(self._discoveryCache)
+        
         self._imports = {}
+        # name -> modulename providing it, for every name known so far.
+        self._owners = {}
+        # name -> modulename, for names of modules not imported yet.
+        self._lazyIndex = {}
+        self._rootName = None
         if autoStart:
             self.importAll()
     
+    def _listModules(self, directory):
+        if self._discoveryCache is not None:
+            return self._discoveryCache.listModules(directory, self._byFile[0], self._byFile[1], self._byDirFileName)
+        return iterPluginModules(directory, self._byFile[0], self._byFile[1], self._byDirFileName)
+    
+    def _moduleImports(self, modulename):
+        """ Imports a module and returns the dict of names it provides, prefixed as its flags ask. """
+        _temp = __import__(modulename, fromlist=[self._importsAttributeName, "flags"])
+        newRawImports = getattr(_temp, self._importsAttributeName)
+        newImports = {}
+        
+        flags = getattr(_temp, "flags", False)
+        if flags:
+            if flags.get("autoGenerateNames", False) or flags.get("listBased"):
+                for item in newRawImports:
+                    try:
+                        newImports[item.__name__] = item
+                    except AttributeError:
+                        raise AttributeError("%s (under %s) doesn't have an __name__ attribute for list based imports" % (item, modulename))
+            else:
+                newImports = newRawImports
+            
+            prefix = flags.get("prefix", False)
+            
+            if prefix:
+                tempDict = {}
+                for key in newImports:
+                    tempDict[prefix+key] = newImports[key]
+                newImports = tempDict
+        else:
+            newImports = newRawImports
+        return newImports
+    
     def importDir(self, directory):
         if os.path.isdir(directory):
-            self._logger.info("Importing directory %s" % directory)
+            self._logger.info("Importing directory %s", directory)
             if directory not in sys.path:
                 sys.path.append(directory)
             imports = {}
-            for filename in os.listdir(directory):
-                path = os.path.join(directory, filename)
-                _temp = False
-                if self._byFile[0]:
-                    if os.path.isfile(path) and filename.startswith(self._byFile[1]) and filename.endswith(".py"):
-                        _temp = __import__(os.path.splitext(filename)[0], fromlist=[self._importsAttributeName, "flags"])
-                else:
-                    if os.path.isdir(path) and ("%s.py" % self._byDirFileName) in os.listdir(path):
-                        _temp = __import__(filename+"."+self._byDirFileName, fromlist=[self._importsAttributeName, "flags"])
-                
-                if _temp:
-                    newRawImports = getattr(_temp, self._importsAttributeName)
-                    newImports = {}
-                    
-                    flags = getattr(_temp, "flags", False)
-                    if flags:
-                        if flags.get("autoGenerateNames", False) or flags.get("listBased"):
-                            for item in newRawImports:
-                                try:
-                                    newImports[item.__name__] = item
-                                except AttributeError:
-                                    raise AttributeError("%s (under %s) doesn't have an __name__ attribute for list based imports" % (item, filename))
-                        else:
-                            newImports = newRawImports
-                        
-                        prefix = flags.get("prefix", False)
-                        
-                        if prefix:
-                            tempDict = {}
-                            for key in newImports:
-                                tempDict[prefix+key] = newImports[key]
-                            newImports = tempDict
-                    else:
-                        newImports = newRawImports
-                        
-                    imports.update(newImports)
+            fetch = lambda module: (module[0], self._moduleImports(module[0]))
+            for modulename, newImports in streamMap(fetch, self._listModules(directory), self._importThreads):
+                for name in newImports:
+                    self._owners[name] = modulename
+                imports.update(newImports)
                     
-            self._logger.info("Imported: " + str(imports))
+            if self._logger.isEnabledFor(logging.INFO):
+                self._logger.info("Imported: %s", imports)
+            if self._discoveryCache is not None:
+                self._discoveryCache.save()
             return imports
         else:
             raise TypeError("%s is not a directory." % directory)
     
+    def _indexDir(self, directory):
+        """ The lazy counterpart of importDir. Returns a dict of name -> modulename, and a dict
+        of the names of the modules that had to be imported because they can't be read statically. """
+        if os.path.isdir(directory):
+            self._logger.info("Indexing directory %s", directory)
+            if directory not in sys.path:
+                sys.path.append(directory)
+            index = {}
+            imports = {}
+            for modulename, modulepath in self._listModules(directory):
+                if self._discoveryCache is not None:
+                    names = self._discoveryCache.importNames(modulepath, self._importsAttributeName)
+                else:
+                    names = scanImportNames(modulepath, self._importsAttributeName)
+                if names is None:
+                    names = self._moduleImports(modulename)
+                    imports.update(names)
+                for name in names:
+                    index[name] = modulename
+            if self._discoveryCache is not None:
+                self._discoveryCache.save()
+            return index, imports
+        else:
+            raise TypeError("%s is not a directory." % directory)
+    
     def updateImports(self, d):
         self._imports.update(d)
         
@@ -490,17 +3444,100 @@ class PluggableImports:
     
     def importAll(self):
         self._imports = {}
-        for defaultsetdir in self._defaultsetdirs:
-            self._imports.update(self.importDir(defaultsetdir))
-            
-        for plugindir in self._plugindirs:
-            self._imports.update(self.importDir(plugindir))
+        self._owners = {}
+        for directory in list(self._defaultsetdirs) + list(self._plugindirs):
+            if self._lazy:
+                index, imports = self._indexDir(directory)
+                for name in index:
+                    self._imports.pop(name, None) # Overridden by this directory.
+                self._owners.update(index)
+                self._imports.update(imports)
+            else:
+                self._imports.update(self.importDir(directory))
+        
+        self._lazyIndex = dict((name, modulename) for name, modulename in self._owners.items() if name not in self._imports)
         
     def get(self, name, default=placeholder):
         try:
             return self._imports[name]
         except KeyError:
+            modulename = self._lazyIndex.get(name)
+            if modulename is not None:
+                self._importLazily(modulename)
+                if name in self._imports:
+                    return self._imports[name]
             if default == placeholder:
                 raise ImportError("%s is not imported." % name)
             return default
+    
+    def _importLazily(self, modulename):
+        """ Imports a module of the lazy index. Names it provides that a later directory overrides are left alone. """
+        self._logger.debug("Lazily importing %s", modulename)
+        for name, value in self._moduleImports(modulename).items():
+            if self._owners.setdefault(name, modulename) == modulename:
+                self._imports[name] = value
+                self._lazyIndex.pop(name, None)
+    
+    def install(self, rootName="pluggable"):
+        """ Adds a meta path hook so that "import rootName.x.y" gives a module whose attributes
+        are resolved with get("x.y." + attribute), and rootName's own with get(attribute). """
+        self.uninstall()
+        self._rootName = rootName
+        sys.meta_path.append(self)
+    
+    def uninstall(self):
+        """ Removes the hook added by install() and the modules it created """
+        if self._rootName is not None:
+            if self in sys.meta_path:
+                sys.meta_path.remove(self)
+            for modulename in list(sys.modules):
+                if modulename == self._rootName or modulename.startswith(self._rootName + "."):
+                    del sys.modules[modulename]
+            self._rootName = None
+    
+    def _handles(self, fullname):
+        if self._rootName is None:
+            return False
+        if fullname == self._rootName:
+            return True
+        if fullname.startswith(self._rootName + "."):
+            # Only namespaces some name lives in, so missing attributes aren't taken for modules.
+            prefix = fullname[len(self._rootName) + 1:] + "."
+            for name in self._owners:
+                if name.startswith(prefix):
+                    return True
+            for name in self._imports:
+                if name.startswith(prefix):
+                    return True
+        return False
+    
+    def _newModule(self, fullname):
+        prefix = fullname[len(self._rootName) + 1:]
+        return _PluggableModule(fullname, self, prefix + "." if prefix else "")
+    
+    # PEP 451 finder and loader
+    def find_spec(self, fullname, path=None, target=None):
+        if self._handles(fullname):
+            import importlib.util
+            return importlib.util.spec_from_loader(fullname, self, is_package=True)
+        return None
+    
+    def create_module(self, spec):
+        return self._newModule(spec.name)
+    
+    def exec_module(self, module):
+        pass
+    
+    # PEP 302 finder and loader, for Python 2
+    def find_module(self, fullname, path=None):
+        if self._handles(fullname):
+            return self
+        return None
+    
+    def load_module(self, fullname):
+        if fullname not in sys.modules:
+            module = self._newModule(fullname)
+            module.__loader__ = self
+            sys.modules[fullname] = module
+        return sys.modules[fullname]
         
\ No newline at end of file
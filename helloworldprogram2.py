@@ -1,5 +1,7 @@
 import os.path
+import logging
 import core
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.DEBUG)
 scriptpath = os.path.dirname(os.path.realpath( __file__ ))
 kwargs = {"byFile": True, "pluginsAttributeName" : "yayPlugins"}
 system = core.System([os.path.join(scriptpath, "pluginbyfile")], **kwargs)
\ No newline at end of file
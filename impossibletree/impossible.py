@@ -1,7 +1,9 @@
 import os.path
+import logging
 import sys
 sys.path.append("..")
 import core
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.DEBUG)
 scriptpath = os.path.dirname(os.path.realpath( __file__ ))
 system = core.System([os.path.join(scriptpath, "plugins")], byFile=True)
 print system.plugins.getOptimalLoadOrder()
\ No newline at end of file
@@ -0,0 +1,185 @@
+""" Profiling of plugins and event handlers: the Profiler behind System.enableProfiling()
+and the Timing and LatencyHistogram it keeps. """
+
+import threading
+import time
+from core import wallClock, isCoroutineFunction, IsolatedCall
+
+# thread_time only counts the calling thread, which matters under parallelLoad.
+cpuClock = getattr(time, "thread_time", None) or getattr(time, "process_time", None) or time.clock
+
+class LatencyHistogram:
+    """ A log-linear histogram of durations, after HdrHistogram. Values are counted in
+    microseconds; every power of two is split in 2**precision buckets, so a recorded
+    value is known to within 1/2**precision of itself, whatever its magnitude. """
+    def __init__(self, precision=4):
+        self.precision = precision
+        self._subBuckets = 1 << precision
+        self.counts = {} # bucket index -> count
+        self.count = 0
+        self.max = 0.0
+    
+    def record(self, seconds):
+        value = int(seconds * 1000000)
+        if value < self._subBuckets << 1:
+            index = value
+        else:
+            shift = value.bit_length() - self.precision - 1
+            index = shift * self._subBuckets + (value >> shift)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+    
+    def upperBound(self, index):
+        """ Returns the exclusive upper bound of a bucket, in seconds """
+        if index < self._subBuckets << 1:
+            return (index + 1) / 1000000.0
+        shift = index // self._subBuckets - 1
+        return ((index - shift * self._subBuckets + 1) << shift) / 1000000.0
+    
+    def buckets(self):
+        """ Returns a list of (upper bound in seconds, cumulative count) for the buckets holding values """
+        result = []
+        total = 0
+        for index in sorted(self.counts):
+            total += self.counts[index]
+            result.append((self.upperBound(index), total))
+        return result
+    
+    def percentile(self, percent):
+        """ Returns the upper bound of the bucket holding the given percentile, in seconds """
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        for bound, total in self.buckets():
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Timing:
+    """ The call count, total wall and cpu time and wall time histogram of one measured operation """
+    def __init__(self, lock):
+        self._lock = lock
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.histogram = LatencyHistogram()
+    
+    def add(self, wall, cpu):
+        with self._lock:
+            self.count += 1
+            self.wall += wall
+            self.cpu += cpu
+            self.histogram.record(wall)
+    
+    def summary(self):
+        histogram = self.histogram
+        return {"count" : self.count, "wall" : self.wall, "cpu" : self.cpu,
+                "mean" : self.wall / self.count if self.count else 0.0,
+                "p50" : histogram.percentile(50), "p90" : histogram.percentile(90),
+                "p99" : histogram.percentile(99), "max" : histogram.max}
+
+class Profiler:
+    """ Collects timings of plugin imports, load(), prepare(), signal() and event handlers.
+    The PluginManager and EventManager only consult it when their profiler attribute is set,
+    so a system without one pays a single attribute check per call. Handlers are timed by
+    wrapping them in the compiled dispatch tables, which costs nothing at fire time when
+    profiling is off. Use System.enableProfiling() rather than setting it up by hand. """
+    
+    # Kinds of measurements kept per plugin (or per module for imports)
+    KINDS = ("import", "load", "prepare", "signal")
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (kind, name) or ("handler", eventname, uniquename) -> Timing
+        self._timings = {}
+    
+    def timing(self, key):
+        try:
+            return self._timings[key]
+        except KeyError:
+            with self._lock:
+                return self._timings.setdefault(key, Timing(self._lock))
+    
+    def call(self, kind, name, func, *args):
+        """ Calls func(*args) and records its duration under (kind, name) """
+        timing = self.timing((kind, name))
+        wall = wallClock()
+        cpu = cpuClock()
+        try:
+            return func(*args)
+        finally:
+            timing.add(wallClock() - wall, cpuClock() - cpu)
+    
+    def wrapHandler(self, eventname, uniquename, func):
+        """ Returns func wrapped to record its duration under (eventname, uniquename).
+        Coroutine functions and calls into isolated plugins are returned as they are, so
+        fireAsync and fire keep recognizing them. """
+        if isinstance(func, IsolatedCall) or isCoroutineFunction(func):
+            return func
+        timing = self.timing(("handler", eventname, uniquename))
+        def timed(kwargs):
+            wall = wallClock()
+            cpu = cpuClock()
+            try:
+                return func(kwargs)
+            finally:
+                timing.add(wallClock() - wall, cpuClock() - cpu)
+        return timed
+    
+    def reset(self):
+        with self._lock:
+            self._timings = {}
+    
+    def afterFork(self):
+        """ Gives the timings new locks in a forked child, in case a thread of the parent held one. """
+        self._lock = threading.Lock()
+        for timing in self._timings.values():
+            timing._lock = self._lock
+    
+    def stats(self):
+        """ Returns {"imports": {modulename: summary}, "plugins": {uniquename: {kind: summary}},
+        "events": {eventname: {uniquename: summary}}}. A summary holds count, total wall and
+        cpu seconds, the mean and the p50, p90, p99 and max wall seconds. """
+        stats = {"imports" : {}, "plugins" : {}, "events" : {}}
+        for key, timing in list(self._timings.items()):
+            if key[0] == "handler":
+                stats["events"].setdefault(key[1], {})[key[2]] = timing.summary()
+            elif key[0] == "import":
+                stats["imports"][key[1]] = timing.summary()
+            else:
+                stats["plugins"].setdefault(key[1], {})[key[0]] = timing.summary()
+        return stats
+    
+    def dumpJSON(self, indent=None):
+        import json
+        return json.dumps(self.stats(), indent=indent, sort_keys=True)
+    
+    def dumpPrometheus(self, prefix="plugincore"):
+        """ Returns the timings in the Prometheus text exposition format, as one
+        histogram of wall seconds and one counter of cpu seconds. """
+        def labels(key, extra=""):
+            if key[0] == "handler":
+                pairs = [("kind", "handler"), ("event", key[1]), ("plugin", key[2])]
+            elif key[0] == "import":
+                pairs = [("kind", "import"), ("module", key[1])]
+            else:
+                pairs = [("kind", key[0]), ("plugin", key[1])]
+            text = ",".join(['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs])
+            return "{" + text + extra + "}"
+        
+        timings = sorted(self._timings.items())
+        lines = ["# HELP %s_duration_seconds Wall time of plugin operations and event handlers." % prefix,
+                 "# TYPE %s_duration_seconds histogram" % prefix]
+        for key, timing in timings:
+            for bound, total in timing.histogram.buckets():
+                lines.append('%s_duration_seconds_bucket%s %d' % (prefix, labels(key, ',le="%r"' % bound), total))
+            lines.append('%s_duration_seconds_bucket%s %d' % (prefix, labels(key, ',le="+Inf"'), timing.count))
+            lines.append("%s_duration_seconds_sum%s %r" % (prefix, labels(key), timing.wall))
+            lines.append("%s_duration_seconds_count%s %d" % (prefix, labels(key), timing.count))
+        lines.append("# HELP %s_cpu_seconds_total CPU time of plugin operations and event handlers." % prefix)
+        lines.append("# TYPE %s_cpu_seconds_total counter" % prefix)
+        for key, timing in timings:
+            lines.append("%s_cpu_seconds_total%s %r" % (prefix, labels(key), timing.cpu))
+        return "\n".join(lines) + "\n"
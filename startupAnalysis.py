@@ -0,0 +1,159 @@
+""" Analysis of the dependency graph of the preloaded plugins: the StartupAnalysis
+behind PluginManager.analyzeStartup(). """
+
+class StartupAnalysis:
+    """ The dependency graph of the preloaded plugins of a PluginManager, weighed with the load()
+    and prepare() wall times a Profiler measured (every plugin weighs 1 without one, making the
+    critical path the longest chain of dependencies). Plugins are scheduled as early as their
+    chosen alternative allows, with unlimited threads:
+        parallelTime - the best startup time any parallel loading can reach, the critical path's
+        serialTime - loading everything in order on one thread
+        waveTime - what loadPluginsParallel reaches, preparing plugins in order on one thread
+    serializing() ranks the plugins forcing that time. Export with toJSON() and toDOT();
+    PluginManager.analyzeStartup() builds one. """
+    def __init__(self, plugins, profiler=None):
+        graph = plugins._dependencyGraph
+        self.nodes = plugins._preloadedPlugins
+        self.order = list(graph.order)
+        self.chosen = dict(graph.chosen)
+        self.levels = dict(graph.levels)
+        self.dependents = graph.dependents
+        self.errors = dict(graph.errors)
+        self.measured = profiler is not None
+        self.costs = self._costs(profiler)
+        self.start, self.finish = self._schedule(self.costs)
+        self.parallelTime = max(list(self.finish.values()) or [0.0])
+        self.serialTime = sum(self.costs.values())
+        self.waveTime = self._waveTime(profiler)
+    
+    def _costs(self, profiler, measured=("load", "prepare")):
+        """ uniquename -> wall seconds of load() and prepare(), or 1.0 each without a profiler """
+        if profiler is None:
+            return dict.fromkeys(self.order, 1.0)
+        timings = profiler.stats()["plugins"]
+        costs = {}
+        for name in self.order:
+            kinds = timings.get(name, {})
+            costs[name] = sum([kinds[kind]["mean"] for kind in measured if kind in kinds])
+        return costs
+    
+    def _schedule(self, costs):
+        """ Returns the earliest start and finish time of every plugin in the order """
+        start = {}
+        finish = {}
+        for name in self.order:
+            start[name] = max([finish[dep] for dep in self.chosen[name]] or [0.0])
+            finish[name] = start[name] + costs[name]
+        return start, finish
+    
+    def _waveTime(self, profiler):
+        """ Plays loadPluginsParallel with unlimited threads: load() starts once the plugins depended
+        on are prepared, prepare() and threadSafe = False plugins take turns on one thread.
+        Without a profiler, prepare() is taken to cost nothing. """
+        prepares = self._costs(profiler, ("prepare",)) if profiler is not None else dict.fromkeys(self.order, 0.0)
+        prepared = {}
+        clock = 0.0
+        for name in self.order:
+            load = self.costs[name] - prepares[name]
+            if getattr(self.nodes[name].plugin, "threadSafe", True):
+                clock = max([clock, max([prepared[dep] for dep in self.chosen[name]] or [0.0]) + load])
+            else:
+                clock += load
+            clock += prepares[name]
+            prepared[name] = clock
+        return clock
+    
+    def slack(self):
+        """ Returns uniquename -> how much later the plugin could finish without delaying startup """
+        latest = {}
+        for name in reversed(self.order):
+            latest[name] = min([latest[dependent] - self.costs[dependent] for dependent in self.dependents.get(name, ()) if dependent in latest] or [self.parallelTime])
+        return dict((name, latest[name] - self.finish[name]) for name in self.order)
+    
+    def criticalPath(self):
+        """ Returns the uniquenames of the longest weighted chain of dependencies, first loaded first """
+        if not self.order:
+            return []
+        name = max(self.order, key=lambda name: self.finish[name])
+        path = [name]
+        while self.chosen[name]:
+            name = max(self.chosen[name], key=lambda dep: self.finish[dep])
+            path.append(name)
+        path.reverse()
+        return path
+    
+    def serializing(self, limit=10):
+        """ Returns the plugins to optimize first, as dicts of uniquename, cost, reason and gain, by
+        decreasing gain. gain is how much parallelTime would drop if the plugin took no time at all.
+        The reason is "critical path" for the costliest plugins of the critical path, at most limit
+        of them, and "not thread safe" for threadSafe = False plugins, which loadPluginsParallel
+        loads on the calling thread; their gain is measured on waveTime instead. """
+        found = []
+        for name in sorted(self.criticalPath(), key=lambda name: -self.costs[name])[:limit]:
+            costs = dict(self.costs)
+            costs[name] = 0.0
+            fastest = max(list(self._schedule(costs)[1].values()) or [0.0])
+            found.append({"uniquename" : name, "cost" : self.costs[name], "reason" : "critical path", "gain" : self.parallelTime - fastest})
+        for name in self.order:
+            if not getattr(self.nodes[name].plugin, "threadSafe", True):
+                found.append({"uniquename" : name, "cost" : self.costs[name], "reason" : "not thread safe", "gain" : self.costs[name]})
+        found.sort(key=lambda entry: -entry["gain"])
+        return found
+    
+    def report(self):
+        """ Returns the whole analysis as a dict of plain values """
+        slack = self.slack()
+        plugins = {}
+        for name, node in self.nodes.items():
+            alternatives = [list(alternative) for alternative in node.dependency or [[]]]
+            entry = {"dependency" : alternatives, "resolved" : name in self.chosen}
+            if name in self.chosen:
+                chosen = list(self.chosen[name])
+                # Index of the alternative chosen, the first one with exactly those names.
+                index = [i for i, alternative in enumerate(alternatives) if set(alternative) == set(chosen)]
+                entry.update({"chosen" : chosen, "alternative" : index[0] if index else None,
+                              "cost" : self.costs[name], "start" : self.start[name], "finish" : self.finish[name],
+                              "slack" : slack[name], "level" : self.levels.get(name, 0)})
+            else:
+                entry["error"] = str(self.errors.get(name, "not resolved yet"))
+            plugins[name] = entry
+        return {"measured" : self.measured, "order" : self.order, "plugins" : plugins,
+                "criticalPath" : self.criticalPath(), "parallelTime" : self.parallelTime,
+                "serialTime" : self.serialTime, "waveTime" : self.waveTime, "serializing" : self.serializing()}
+    
+    def toJSON(self, indent=None):
+        import json
+        return json.dumps(self.report(), indent=indent, sort_keys=True)
+    
+    def toDOT(self, name="plugins"):
+        """ Returns the graph in Graphviz DOT. Edges of the chosen alternatives are solid, those of the
+        alternatives passed over dotted; the critical path is bold red and unresolved plugins are dashed. """
+        quote = lambda text: '"%s"' % str(text).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        critical = self.criticalPath()
+        onPath = set(critical)
+        criticalEdges = set(zip(critical, critical[1:]))
+        unit = "s" if self.measured else ""
+        lines = ["digraph %s {" % quote(name), "    rankdir=BT;"]
+        for uniquename in sorted(self.nodes):
+            if uniquename in self.chosen:
+                label = "%s\n%.6g%s" % (uniquename, self.costs[uniquename], unit)
+                style = ', color=red, penwidth=2' if uniquename in onPath else ""
+            else:
+                label = uniquename
+                style = ", style=dashed"
+            lines.append("    %s [label=%s%s];" % (quote(uniquename), quote(label), style))
+        for uniquename in sorted(self.nodes):
+            chosen = self.chosen.get(uniquename, ())
+            drawn = set()
+            for alternative in self.nodes[uniquename].dependency or [[]]:
+                for dep in alternative:
+                    if dep in drawn:
+                        continue
+                    drawn.add(dep)
+                    if dep in chosen:
+                        style = " [color=red, penwidth=2]" if (dep, uniquename) in criticalEdges else ""
+                    else:
+                        style = " [style=dotted, color=grey]"
+                    lines.append("    %s -> %s%s;" % (quote(uniquename), quote(dep), style))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,59 @@
+""" Tests of coroutine handlers and of what importing the core pulls in. """
+
+import os, sys
+import logging
+import subprocess
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+CORE = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Kept out of the module's own source, Python 2 cannot parse async def.
+HANDLER = """
+class Handler(core.Plugin):
+    def __init__(self):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = "coroutine"
+    async def handle(self, args):
+        return args["value"]
+
+async def fireAsync(system, eventname, **kwargs):
+    return await system.events.fireAsync(eventname, **kwargs)
+"""
+
+class AsyncTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def testImportLeavesOptionalModules(self):
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = CORE
+        process = subprocess.Popen([sys.executable, "-c", "import sys, core; print(sorted(set(['asyncio', 'ast', 'hashlib', 'json', 'multiprocessing']) & set(sys.modules)))"],
+                                   stdout=subprocess.PIPE, env=environment)
+        self.assertEqual(process.communicate()[0].strip(), b"[]")
+
+    @unittest.skipIf(sys.version_info < (3, 5), "async def needs Python 3.5")
+    def testCoroutineHandlers(self):
+        namespace = {"core" : core}
+        exec(HANDLER, namespace)
+        handler = namespace["Handler"]()
+        self.assertTrue(core.isCoroutineFunction(handler.handle))
+        system = core.System(autoStart=False)
+        system.events.registerEvent("Async")
+        system.plugins.loadPlugin(handler)
+        system.events.registerPluginToEvent(handler, "Async", "handle")
+        self.assertEqual(system.events.fire("Async", value=3), [True, {"coroutine" : 3}])
+
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(namespace["fireAsync"](system, "Async", value=4)), [True, {"coroutine" : 4}])
+        finally:
+            loop.close()
+
+if __name__ == "__main__":
+    unittest.main()
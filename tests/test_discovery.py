@@ -0,0 +1,111 @@
+""" Tests of plugin discovery: importPlugins, streamMap and DiscoveryCache. """
+
+import os, sys
+import logging
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+CORE = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+PLUGIN = """
+class Plugin:
+    name = uniquename = %(name)r
+    def load(self, system): return True
+    def prepare(self, system): return True
+    def signal(self, args): pass
+    def unload(self, system): return True
+plugins = [Plugin()]
+"""
+
+def write(path, text):
+    f = open(path, "w")
+    try:
+        f.write(text)
+    finally:
+        f.close()
+
+class DiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = tempfile.mkdtemp()
+        self.modules = []
+
+    def tearDown(self):
+        for modulename in self.modules:
+            sys.modules.pop(modulename, None)
+        sys.path[:] = [path for path in sys.path if path != self.directory]
+        shutil.rmtree(self.directory)
+        logging.disable(logging.NOTSET)
+
+    def plugin(self, name):
+        modulename = "plugin_" + name
+        self.modules.append(modulename)
+        write(os.path.join(self.directory, modulename + ".py"), PLUGIN % {"name" : name})
+
+    def testStreamMapKeepsOrder(self):
+        self.assertEqual(list(core.streamMap(lambda number: number * 2, range(20), 4)), [number * 2 for number in range(20)])
+
+    def testImportThreads(self):
+        for number in range(8):
+            self.plugin("threaded%d" % number)
+        system = core.System([self.directory], byFile=True, importThreads=4)
+        self.assertEqual(len(system.plugins.getOptimalLoadOrder()), 8)
+
+    def testCacheInvalidation(self):
+        manifest = self.directory + ".manifest.json"
+        self.addCleanup(lambda: os.path.exists(manifest) and os.remove(manifest))
+        path = os.path.join(self.directory, "plugin_cached.py")
+        write(path, 'lazyPlugins = [{"uniquename" : "one", "events" : {}}]\n')
+        cache = core.DiscoveryCache(manifest)
+        self.assertEqual(cache.listModules(self.directory, byFile=True), [("plugin_cached", path)])
+        self.assertEqual(cache.lazyMetadata(path)[0]["uniquename"], "one")
+        cache.save()
+
+        # Rewritten within the tick the manifest was written in: same size, same mtime.
+        mtime = os.stat(path).st_mtime
+        write(path, 'lazyPlugins = [{"uniquename" : "two", "events" : {}}]\n')
+        os.utime(path, (mtime, mtime))
+        os.utime(manifest, (mtime, mtime))
+        self.plugin("added")
+        cache = core.DiscoveryCache(manifest)
+        self.assertEqual(cache.lazyMetadata(path)[0]["uniquename"], "two")
+        self.assertEqual(len(cache.listModules(self.directory, byFile=True)), 2)
+
+        # Clean entries are served from the manifest.
+        cache.save()
+        os.utime(manifest, (mtime + 10, mtime + 10))
+        cache = core.DiscoveryCache(manifest)
+        self.assertEqual(cache.lazyMetadata(path)[0]["uniquename"], "two")
+        self.assertFalse(cache.changed)
+
+    def testImportThreadsWithinImport(self):
+        # A package starting a System while it is imported, with a plugin importing that package.
+        package = os.path.join(self.directory, "discoveryapp")
+        plugins = os.path.join(self.directory, "discoveryplugins")
+        os.mkdir(package)
+        os.mkdir(plugins)
+        write(os.path.join(package, "__init__.py"),
+              "import core\nsystem = core.System([%r], byFile=True, importThreads=2)\n" % plugins)
+        for number in range(4):
+            write(os.path.join(plugins, "plugin_within%d.py" % number),
+                  "import discoveryapp\n" + PLUGIN % {"name" : "within%d" % number})
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = os.pathsep.join([CORE, self.directory])
+        process = subprocess.Popen([sys.executable, "-c", "import discoveryapp; print(len(discoveryapp.system.plugins.getOptimalLoadOrder()))"],
+                                   stdout=subprocess.PIPE, env=environment)
+        deadline = time.time() + 30
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+            self.fail("Starting a System with importThreads from within an import deadlocked.")
+        self.assertEqual(process.communicate()[0].strip(), b"4")
+
+if __name__ == "__main__":
+    unittest.main()
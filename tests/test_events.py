@@ -0,0 +1,99 @@
+""" Tests of the EventManager registration tables and dispatch order. """
+
+import os, sys
+import json
+import logging
+import random
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+class Handler(core.Plugin):
+    def __init__(self, uniquename):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = uniquename
+
+    def handle(self, args):
+        args["calls"].append(self.uniquename)
+        return True
+
+class EventManagerTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.system = core.System(autoStart=False)
+        self.system.events.registerEvent("Order")
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def fire(self):
+        calls = []
+        self.system.events.fire("Order", calls=calls)
+        return calls
+
+    def testPriorityThenRegistrationOrder(self):
+        rnd = random.Random(0)
+        expected = []
+        for number in range(200):
+            handler = Handler("h%d" % number)
+            priority = rnd.randint(-3, 3)
+            self.system.plugins.loadPlugin(handler)
+            self.system.events.registerPluginToEvent(handler, "Order", "handle", priority)
+            expected.append((-priority, number, handler.uniquename))
+        for number in rnd.sample(range(200), 50):
+            self.system.events.unregisterPluginFromEvent("h%d" % number, "Order")
+            expected = [entry for entry in expected if entry[1] != number]
+        expected.sort()
+        self.assertEqual(self.fire(), [uniquename for priority, number, uniquename in expected])
+        self.assertEqual([plugin.uniquename for plugin, functionname in self.system.events.getEventPlugins("Order")],
+                         [uniquename for priority, number, uniquename in expected])
+
+    def testRestoreOrder(self):
+        for uniquename in ("a", "b", "c"):
+            self.system.plugins.loadPlugin(Handler(uniquename))
+            self.system.events.registerPluginToEvent(uniquename, "Order", "handle", 1 if uniquename == "c" else 0)
+        tables = {"Order" : [["c", "handle", 1], ["b", "handle", 0], ["a", "handle", 0]]}
+        self.system.events.restoreOrder(tables)
+        self.assertEqual(self.fire(), ["c", "b", "a"])
+        self.assertEqual(self.system.events.getTables(), tables)
+        self.system.plugins.loadPlugin(Handler("d"))
+        self.system.events.registerPluginToEvent("d", "Order", "handle")
+        self.assertEqual(self.fire(), ["c", "b", "a", "d"])
+
+    def testFireResultIsAList(self):
+        for uniquename in ("a", "b"):
+            self.system.plugins.loadPlugin(Handler(uniquename))
+            self.system.events.registerPluginToEvent(uniquename, "Order", "handle")
+        result = self.system.events.fire("Order", calls=[])
+        self.assertTrue(isinstance(result, list))
+        self.assertEqual(json.loads(json.dumps(result)), [True, {"a" : True, "b" : True}])
+        self.assertEqual((result.succeeded, result.statuses), (True, {"a" : True, "b" : True}))
+        result.append("extra")
+        self.assertEqual(result[2], "extra")
+        answered = self.system.events.fire("Order", fireMode=core.FIRE_FIRST_TRUTHY, calls=[])
+        self.assertEqual(answered, [True, {"a" : True}, "a"])
+        self.assertEqual(answered.answered, "a")
+
+    def testWildcardDispatchIsBounded(self):
+        handler = Handler("wild")
+        self.system.plugins.loadPlugin(handler)
+        self.system.events.registerPluginToEvent(handler, "request.*", "handle")
+        self.system.events.dispatchCacheSize = 8
+        self.system.events.traceEvery = 1
+        for number in range(100):
+            calls = []
+            self.assertEqual(self.system.events.fire("request.%d" % number, calls=calls)[0], True)
+            self.assertEqual(calls, ["wild"])
+        self.assertEqual(len(self.system.events._derived), 8)
+        self.assertTrue(len(self.system.events._traceCounts) <= 8)
+        # Registering a matching name makes it an event of its own.
+        self.system.events.registerEvent("request.99")
+        self.system.plugins.loadPlugin(Handler("own"))
+        self.system.events.registerPluginToEvent("own", "request.99", "handle")
+        calls = []
+        self.system.events.fire("request.99", calls=calls)
+        self.assertEqual(calls, ["own", "wild"])
+        self.assertFalse("request.99" in self.system.events._derived)
+
+if __name__ == "__main__":
+    unittest.main()
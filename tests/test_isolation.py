@@ -0,0 +1,81 @@
+""" Tests of plugins declaring isolation = "process". """
+
+import os, sys
+import logging
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+MODULES = {
+    "plugin_isolatedeager" : """
+import os
+class Eager:
+    name = uniquename = "isolatedeager"
+    isolation = "process"
+    def load(self, system): return True
+    def prepare(self, system):
+        system.events.registerEvent("Pid")
+        system.events.registerEvent("Crash")
+        system.events.registerPluginToEvent(self, "Crash", "crash")
+        return system.events.registerPluginToEvent(self, "Pid", "pid")
+    def pid(self, args): return os.getpid()
+    def crash(self, args): os._exit(1)
+    def signal(self, args): pass
+    def unload(self, system): return True
+plugins = [Eager()]
+""",
+    "plugin_isolatedlazy" : """
+import os
+lazyPlugins = [{"uniquename" : "isolatedlazy", "isolation" : "process", "events" : {"LazyPid" : "pid"}}]
+class Lazy:
+    name = uniquename = "isolatedlazy"
+    isolation = "process"
+    def load(self, system): return True
+    def prepare(self, system):
+        system.events.registerEvent("LazyPid")
+        return system.events.registerPluginToEvent(self, "LazyPid", "pid")
+    def pid(self, args): return os.getpid()
+    def signal(self, args): pass
+    def unload(self, system): return True
+plugins = [Lazy()]
+""",
+}
+
+class IsolationTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = tempfile.mkdtemp()
+        for modulename, source in MODULES.items():
+            f = open(os.path.join(self.directory, modulename + ".py"), "w")
+            try:
+                f.write(source)
+            finally:
+                f.close()
+        self.system = core.System([self.directory], byFile=True, lazyLoad=True, isolationProcesses=2)
+
+    def tearDown(self):
+        self.system.plugins.isolationPool.close()
+        for modulename in MODULES:
+            sys.modules.pop(modulename, None)
+        sys.path[:] = [path for path in sys.path if path != self.directory]
+        shutil.rmtree(self.directory)
+        logging.disable(logging.NOTSET)
+
+    def testEagerPluginRunsInWorker(self):
+        self.assertTrue(isinstance(self.system.plugins.getPlugin("isolatedeager"), core.IsolatedPlugin))
+        pid = self.system.events.fire("Pid")[1]["isolatedeager"]
+        self.assertNotEqual(pid, os.getpid())
+
+    def testLazyPluginRunsInWorker(self):
+        pid = self.system.events.fire("LazyPid")[1]["isolatedlazy"]
+        self.assertNotEqual(pid, os.getpid())
+        self.assertTrue(isinstance(self.system.plugins.getPlugin("isolatedlazy"), core.IsolatedPlugin))
+
+    def testCrashPutsPluginToInactive(self):
+        self.assertEqual(self.system.events.fire("Crash")[0], False)
+        self.assertTrue(self.system.plugins.isInactive("isolatedeager"))
+
+if __name__ == "__main__":
+    unittest.main()
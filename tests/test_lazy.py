@@ -0,0 +1,87 @@
+""" Tests of System(lazyLoad=True) and LazyPlugin. """
+
+import os, sys
+import logging
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+DATABASE = """
+lazyPlugins = [{"uniquename" : "lazydb", "events" : {"Query" : "handle"}}]
+class Database:
+    name = uniquename = "lazydb"
+    def load(self, system): return True
+    def prepare(self, system):
+        system.events.registerEvent("Query")
+        return system.events.registerPluginToEvent(self, "Query", "handle")
+    def query(self):
+        return "rows"
+    def handle(self, args):
+        return self.query()
+    def signal(self, args): pass
+    def unload(self, system): return True
+plugins = [Database()]
+"""
+
+APPLICATION = """
+class Application:
+    name = uniquename = "lazyapp"
+    dependency = [["lazydb"]]
+    def load(self, system):
+        self.rows = system.plugins.getPlugin("lazydb").query()
+        return True
+    def prepare(self, system): return True
+    def signal(self, args): pass
+    def unload(self, system): return True
+plugins = [Application()]
+"""
+
+CRITICAL = """
+lazyPlugins = [{"uniquename" : "lazycritical", "dependency" : [["missing"]], "critical" : True, "events" : {}}]
+raise ImportError("Lazy plugins are not imported to be preloaded.")
+"""
+
+class LazyLoadTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = tempfile.mkdtemp()
+        self.modules = []
+
+    def tearDown(self):
+        for modulename in self.modules:
+            sys.modules.pop(modulename, None)
+        sys.path[:] = [path for path in sys.path if path != self.directory]
+        shutil.rmtree(self.directory)
+        logging.disable(logging.NOTSET)
+
+    def write(self, modulename, source):
+        self.modules.append(modulename)
+        f = open(os.path.join(self.directory, modulename + ".py"), "w")
+        try:
+            f.write(source)
+        finally:
+            f.close()
+
+    def testActivatedByEvent(self):
+        self.write("plugin_lazydb", DATABASE)
+        system = core.System([self.directory], byFile=True, lazyLoad=True)
+        self.assertTrue(isinstance(system.plugins.getPlugin("lazydb"), core.LazyPlugin))
+        self.assertFalse("plugin_lazydb" in sys.modules)
+        self.assertEqual(system.events.fire("Query"), [True, {"lazydb" : "rows"}])
+        self.assertFalse(isinstance(system.plugins.getPlugin("lazydb"), core.LazyPlugin))
+
+    def testActivatedByDependent(self):
+        self.write("plugin_lazydb", DATABASE)
+        self.write("plugin_lazyapp", APPLICATION)
+        system = core.System([self.directory], byFile=True, lazyLoad=True)
+        self.assertTrue(system.plugins.isActive("lazyapp"))
+        self.assertEqual(system.plugins.getPlugin("lazyapp").rows, "rows")
+
+    def testCriticalMetadata(self):
+        self.write("plugin_lazycritical", CRITICAL)
+        self.assertRaises(core.DependencyNotSatisfiedError, core.System, [self.directory], byFile=True, lazyLoad=True)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+""" Tests of PluginManager.loadPluginsParallel. """
+
+import os, sys
+import logging
+import random
+import time
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+class Handler(core.Plugin):
+    def __init__(self, uniquename, dependency, calls, threadSafe=True):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = uniquename
+        self.dependency = dependency
+        self.calls = calls
+        self.threadSafe = threadSafe
+
+    def load(self, system):
+        time.sleep(random.random() * 0.005)
+        return self.uniquename != "p3"
+
+    def prepare(self, system):
+        system.events.registerEvent("Order")
+        return system.events.registerPluginToEvent(self, "Order", "handle")
+
+    def handle(self, args):
+        self.calls.append(self.uniquename)
+        return True
+
+class ParallelLoadTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def start(self, seed, parallel):
+        rnd = random.Random(seed)
+        calls = []
+        system = core.System(autoStart=False)
+        names = ["p%d" % i for i in range(20)]
+        for i, name in enumerate(names):
+            dependency = [rnd.sample(names[:i], min(i, rnd.randint(0, 2)))]
+            system.plugins.preloadPlugin(Handler(name, dependency, calls, i % 7 != 5))
+        system.plugins.buildOptimalLoadOrder()
+        if parallel:
+            system.plugins.loadPluginsParallel(system.plugins.getOptimalLoadOrder(), 4)
+        else:
+            for plugin in system.plugins.getOptimalLoadOrder():
+                system.plugins.loadPlugin(plugin)
+        system.events.fire("Order")
+        return calls, [name for name in names if system.plugins.isActive(name)], [name for name in names if system.plugins.isInactive(name)]
+
+    def testMatchesSerialLoading(self):
+        for seed in range(10):
+            self.assertEqual(self.start(seed, True), self.start(seed, False))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+""" Tests of the instrumentation plugged into the core: Profiler, Tracer and StartupAnalysis. """
+
+import os, sys
+import logging
+import random
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+import profiler
+import tracer
+import startupAnalysis
+
+class Echo(core.Plugin):
+    def __init__(self, uniquename, dependency=[[]]):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = uniquename
+        self.dependency = dependency
+
+    def prepare(self, system):
+        system.events.registerEvent("Echo")
+        return system.events.registerPluginToEvent(self, "Echo", "handle")
+
+    def handle(self, args):
+        return args.get("value")
+
+def started(*plugins, **kwargs):
+    system = core.System(autoStart=False, **kwargs)
+    for plugin in plugins:
+        system.plugins.preloadPlugin(plugin)
+    system.plugins.buildOptimalLoadOrder()
+    for plugin in system.plugins.getOptimalLoadOrder():
+        system.plugins.loadPlugin(plugin)
+    return system
+
+class LatencyHistogramTest(unittest.TestCase):
+    def testSmallValuesAreExact(self):
+        histogram = profiler.LatencyHistogram()
+        for microseconds in range(32):
+            histogram.record(microseconds / 1000000.0)
+        self.assertEqual(len(histogram.counts), 32)
+        self.assertEqual(histogram.buckets()[-1], (32 / 1000000.0, 32))
+
+    def testBucketBounds(self):
+        histogram = profiler.LatencyHistogram()
+        histogram.record(0.001)
+        index = list(histogram.counts)[0]
+        self.assertEqual(histogram.upperBound(index), 0.001024)
+        rnd = random.Random(0)
+        for i in range(2000):
+            value = rnd.randint(32, 10 ** 8)
+            histogram = profiler.LatencyHistogram()
+            histogram.record(value / 1000000.0)
+            upper = histogram.upperBound(list(histogram.counts)[0]) * 1000000.0
+            # Within 1/2**precision of the value recorded.
+            self.assertTrue(value < round(upper) <= value + value / 16.0 + 1, "%d in a bucket up to %r" % (value, upper))
+
+    def testPercentiles(self):
+        histogram = profiler.LatencyHistogram()
+        self.assertEqual(histogram.percentile(50), 0.0)
+        for i in range(99):
+            histogram.record(0.00001)
+        histogram.record(0.5)
+        self.assertEqual(histogram.percentile(50), 0.000011)
+        self.assertEqual(histogram.percentile(99), 0.000011)
+        self.assertEqual(histogram.percentile(100), 0.5)
+        self.assertEqual(histogram.count, 100)
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def testProfiling(self):
+        system = started(Echo("echo"), profile=True)
+        self.assertTrue(isinstance(system.plugins.profiler, profiler.Profiler))
+        for i in range(3):
+            system.events.fire("Echo", value=i)
+        stats = system.stats()
+        self.assertEqual(stats["plugins"]["echo"]["load"]["count"], 1)
+        self.assertEqual(stats["events"]["Echo"]["echo"]["count"], 3)
+        self.assertTrue("plugincore" in system.stats("prometheus"))
+        self.assertTrue(system.disableProfiling() is not None)
+        self.assertEqual(system.events.fire("Echo", value=1), [True, {"echo" : 1}])
+
+    def testStatsWithoutProfiling(self):
+        self.assertEqual(started(Echo("echo")).stats(), {"imports" : {}, "plugins" : {}, "events" : {}})
+
+    def testTracing(self):
+        system = started(Echo("echo"), tracing=True)
+        self.assertTrue(isinstance(system.events.tracer, tracer.Tracer))
+        system.events.fire("Echo", value=1)
+        names = [span["name"] for span in system.events.tracer.toChromeTrace()["traceEvents"]]
+        self.assertTrue("Echo" in names)
+        system.disableTracing()
+        self.assertEqual(system.events.tracer, None)
+
+    def testStartupAnalysis(self):
+        system = started(Echo("a"), Echo("b", [["a"]]), Echo("c", [["a"]]))
+        analysis = system.plugins.analyzeStartup()
+        self.assertTrue(isinstance(analysis, startupAnalysis.StartupAnalysis))
+        self.assertEqual(analysis.serialTime, 3.0)
+        self.assertEqual(analysis.parallelTime, 2.0)
+        self.assertEqual(analysis.criticalPath()[0], "a")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+""" Tests of the EventQueue behind EventManager.post. """
+
+import os, sys
+import logging
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+class Handler(core.Plugin):
+    def __init__(self, uniquename, status=True):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = uniquename
+        self.status = status
+        self.seen = []
+
+    def handle(self, args):
+        self.seen.append(args.get("number"))
+        return self.status
+
+class EventQueueTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.system = core.System(autoStart=False, queueWorkers=2)
+        self.system.events.registerEvent("Work")
+        self.handlers = [Handler("a"), Handler("b", False)]
+        for handler in self.handlers:
+            self.system.plugins.loadPlugin(handler)
+            self.system.events.registerPluginToEvent(handler, "Work", "handle")
+
+    def tearDown(self):
+        self.system.events.drain(5)
+        logging.disable(logging.NOTSET)
+
+    def testResultMatchesFire(self):
+        posted = self.system.events.post("Work", number=1)
+        self.assertEqual(posted.result(5), [False, {"a" : True, "b" : False}])
+        self.assertEqual(self.system.events.post("Missing").result(5), False)
+
+    def testHandlersSeeEventsInOrder(self):
+        for number in range(50):
+            self.system.events.post("Work", number=number)
+        self.assertTrue(self.system.events.flush(5))
+        for handler in self.handlers:
+            self.assertEqual(handler.seen, list(range(50)))
+
+    def testDispatchErrorResolvesEvent(self):
+        self.system.events.registerEvent("Broken")
+        self.system.events.registerPluginToEvent(self.handlers[0], "Broken", "noSuchFunction")
+        posted = self.system.events.post("Broken")
+        self.assertRaises(AttributeError, posted.result, 5)
+        self.assertTrue(self.system.events.flush(5))
+        # The workers survive the error.
+        self.assertEqual(self.system.events.post("Work", number=2).result(5)[0], False)
+
+    def testRejectWhenFull(self):
+        self.system.events.drain(5)
+        queue = core.EventQueue(self.system.events, workers=0, maxsize=1, backpressure=core.REJECT)
+        queue.post("Work", {})
+        self.assertRaises(core.EventQueueFull, queue.post, "Work", {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+""" Tests of PluginManager.reloadPlugin. """
+
+import os, sys
+import logging
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+PLUGIN = """
+import core
+class Plugin(core.Plugin):
+    def __init__(self):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = %(name)r
+        self.dependency = %(dependency)r
+        self.version = %(version)r
+    def prepare(self, system):
+        system.events.registerEvent("Version")
+        return system.events.registerPluginToEvent(self, "Version", "handle")
+    def handle(self, args):
+        return self.version
+plugins = [Plugin()]
+"""
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.dontWriteBytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = True
+        self.directory = tempfile.mkdtemp()
+        self.write("reloadr", [[]], 1)
+        self.write("reloads", [["reloadr"]], 1)
+        self.system = core.System([self.directory], byFile=True, byFileStartsWith="plugin_")
+
+    def tearDown(self):
+        for name in ("plugin_reloadr", "plugin_reloads"):
+            sys.modules.pop(name, None)
+        sys.path[:] = [path for path in sys.path if path != self.directory]
+        shutil.rmtree(self.directory)
+        sys.dont_write_bytecode = self.dontWriteBytecode
+        logging.disable(logging.NOTSET)
+
+    def write(self, name, dependency, version):
+        f = open(os.path.join(self.directory, "plugin_%s.py" % name), "w")
+        try:
+            f.write(PLUGIN % {"name" : name, "dependency" : dependency, "version" : version})
+        finally:
+            f.close()
+
+    def testReload(self):
+        self.write("reloadr", [[]], 2)
+        self.assertTrue(self.system.plugins.reloadPlugin("reloadr"))
+        self.assertEqual(self.system.events.fire("Version")[1], {"reloadr" : 2, "reloads" : 1})
+        self.assertTrue(self.system.plugins.isActive("reloads"))
+
+    def testUnresolvableReloadRollsBack(self):
+        order = [plugin.uniquename for plugin in self.system.plugins.getOptimalLoadOrder()]
+        self.write("reloadr", [["missing"]], 2)
+        self.assertFalse(self.system.plugins.reloadPlugin("reloadr"))
+        self.assertEqual([plugin.uniquename for plugin in self.system.plugins.getOptimalLoadOrder()], order)
+        self.assertTrue(self.system.plugins.isActive("reloadr"))
+        self.assertTrue(self.system.plugins.isActive("reloads"))
+        self.assertEqual(self.system.events.fire("Version")[1], {"reloadr" : 1, "reloads" : 1})
+
+    def testFailedLoadRollsBack(self):
+        f = open(os.path.join(self.directory, "plugin_reloadr.py"), "w")
+        try:
+            f.write("raise ImportError('broken')\n")
+        finally:
+            f.close()
+        self.assertFalse(self.system.plugins.reloadPlugin("reloadr"))
+        self.assertEqual(self.system.events.fire("Version")[1], {"reloadr" : 1, "reloads" : 1})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+""" Tests of DependencyGraph, the resolver behind PluginManager.buildOptimalLoadOrder. """
+
+import os, sys
+import random
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+class Counting(core.Plugin):
+    def __init__(self, uniquename, dependency):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = uniquename
+        self.dependency = dependency
+        self.loads = 0
+
+    def load(self, system):
+        self.loads += 1
+        return True
+
+def graph(dependencies):
+    nodes = dict((name, core.PluginNode(None, dependency)) for name, dependency in dependencies.items())
+    return core.DependencyGraph(nodes)
+
+def reachable(nodes):
+    """ The plugins one of whose alternatives can be satisfied, as a fixpoint """
+    found = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, node in nodes.items():
+            if name not in found and [alternative for alternative in node.dependency if not [dep for dep in alternative if dep not in found]]:
+                found.add(name)
+                changed = True
+    return found
+
+def randomDependencies(rnd, names):
+    return [rnd.sample(names + ["missing"], rnd.randint(0, 2)) for i in range(rnd.randint(1, 3))]
+
+class DependencyGraphTest(unittest.TestCase):
+    def assertValidOrder(self, resolved):
+        position = dict((name, i) for i, name in enumerate(resolved.order))
+        self.assertEqual(set(resolved.order), set(resolved.chosen))
+        for name in resolved.order:
+            for dep in resolved.chosen[name]:
+                self.assertTrue(position[dep] < position[name], "%s loads before %s" % (name, dep))
+
+    def testFirstSatisfiableAlternative(self):
+        resolved = graph({"x" : [["a"], ["b"]], "a" : [["d"]], "d" : [["c"]], "b" : [[]], "c" : [[]]})
+        resolved.resolve()
+        self.assertEqual(resolved.chosen["x"], ("a",))
+        self.assertValidOrder(resolved)
+
+    def testCycleFallsBack(self):
+        resolved = graph({"a" : [["b"], []], "b" : [["a"]]})
+        self.assertEqual(resolved.resolve(), ["a", "b"])
+        self.assertEqual(resolved.chosen, {"a" : (), "b" : ("a",)})
+
+    def testErrors(self):
+        resolved = graph({"a" : [["missing"]], "b" : [["c"]], "c" : [["b"]]})
+        resolved.resolve()
+        self.assertEqual(resolved.order, [])
+        self.assertTrue(isinstance(resolved.errors["a"], core.DependencyNotSatisfiedError))
+        self.assertTrue(isinstance(resolved.errors["b"], core.DependencyCycleError))
+
+    def testResolvesEverythingResolvable(self):
+        for seed in range(300):
+            rnd = random.Random(seed)
+            names = ["p%d" % i for i in range(12)]
+            resolved = graph(dict((name, randomDependencies(rnd, names)) for name in names))
+            resolved.resolve()
+            self.assertEqual(set(resolved.order), reachable(resolved.nodes))
+            self.assertValidOrder(resolved)
+
+    def testAddMovesToEarlierAlternative(self):
+        resolved = graph({"x" : [["q"], ["a"]], "a" : [[]]})
+        resolved.resolve()
+        self.assertEqual(resolved.chosen["x"], ("a",))
+        resolved.nodes["q"] = core.PluginNode(None, [[]])
+        self.assertEqual(resolved.add(["q"]), ["q", "x"])
+        self.assertEqual(resolved.chosen["x"], ("q",))
+        self.assertValidOrder(resolved)
+
+    def testAddPluginReloadsMovedPlugins(self):
+        system = core.System(autoStart=False)
+        x = Counting("x", [["q"], ["a"]])
+        for plugin in (x, Counting("a", [[]])):
+            system.plugins.preloadPlugin(plugin)
+        system.plugins.buildOptimalLoadOrder()
+        for plugin in system.plugins.getOptimalLoadOrder():
+            system.plugins.loadPlugin(plugin)
+        self.assertEqual(system.plugins.addPlugin(Counting("q", [[]])), ["q", "x"])
+        self.assertEqual(x.loads, 2)
+        self.assertTrue(system.plugins.isActive("x"))
+
+    def testIncrementalMatchesFullResolve(self):
+        for seed in range(200):
+            rnd = random.Random(seed)
+            names = ["n%d" % i for i in range(10)]
+            dependencies = dict((name, randomDependencies(rnd, names)) for name in names)
+            nodes = {}
+            incremental = core.DependencyGraph(nodes)
+            incremental.resolve()
+            for step in range(40):
+                if rnd.random() < 0.2:
+                    # Picks up from a snapshot now and then.
+                    restored = core.DependencyGraph(nodes)
+                    restored.restore(list(incremental.order), dict(incremental.chosen), set(incremental.unresolved))
+                    incremental = restored
+                name = rnd.choice(names)
+                if name in nodes:
+                    del nodes[name]
+                else:
+                    nodes[name] = core.PluginNode(None, dependencies[name])
+                incremental.update()
+
+                full = core.DependencyGraph(dict(nodes))
+                full.resolve()
+                self.assertEqual(incremental.chosen, full.chosen, "seed %d, step %d" % (seed, step))
+                self.assertEqual(incremental.unresolved, full.unresolved, "seed %d, step %d" % (seed, step))
+                self.assertValidOrder(incremental)
+
+if __name__ == "__main__":
+    unittest.main()
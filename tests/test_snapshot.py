@@ -0,0 +1,94 @@
+""" Tests of System.snapshot() and starting a System from a snapshot. """
+
+import os, sys
+import logging
+import pickle
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import core
+
+PLUGIN = """
+import core
+class Plugin(core.Plugin):
+    snapshottable = %(snapshottable)r
+    def __init__(self):
+        core.Plugin.__init__(self)
+        self.name = self.uniquename = %(name)r
+        self.dependency = %(dependency)r
+        self.loads = self.restores = 0
+    def load(self, system):
+        self.loads += 1
+        self.state = "loaded"
+        return True
+    def prepare(self, system):
+        system.events.registerEvent("State")
+        return system.events.registerPluginToEvent(self, "State", "handle", %(priority)r)
+    def snapshot(self, system):
+        return {"state" : self.state}
+    def restore(self, state, system):
+        self.restores += 1
+        self.state = state["state"] + " and restored"
+        return True
+    def handle(self, args):
+        return self.state
+plugins = [Plugin()]
+"""
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.directory = tempfile.mkdtemp()
+        self.modules = []
+        self.write("snapbase", [[]], True, 0)
+        self.write("snapuser", [["snapbase"]], False, 5)
+
+    def tearDown(self):
+        for modulename in self.modules:
+            sys.modules.pop(modulename, None)
+        sys.path[:] = [path for path in sys.path if path != self.directory]
+        shutil.rmtree(self.directory)
+        logging.disable(logging.NOTSET)
+
+    def write(self, name, dependency, snapshottable, priority):
+        modulename = "plugin_" + name
+        if modulename not in self.modules:
+            self.modules.append(modulename)
+        sys.modules.pop(modulename, None)
+        f = open(os.path.join(self.directory, modulename + ".py"), "w")
+        try:
+            f.write(PLUGIN % {"name" : name, "dependency" : dependency, "snapshottable" : snapshottable, "priority" : priority})
+        finally:
+            f.close()
+
+    def boot(self, snapshot=None):
+        for modulename in self.modules:
+            sys.modules.pop(modulename, None)
+        return core.System([self.directory], byFile=True, byFileStartsWith="plugin_", snapshot=snapshot)
+
+    def testRestore(self):
+        system = self.boot()
+        system.plugins.getPlugin("snapbase").state = "changed"
+        snapshot = pickle.loads(pickle.dumps(system.snapshot()))
+
+        restored = self.boot(snapshot)
+        base = restored.plugins.getPlugin("snapbase")
+        self.assertEqual((base.loads, base.restores), (0, 1))
+        self.assertEqual(restored.plugins.getPlugin("snapuser").loads, 1)
+        self.assertEqual(restored.plugins.getPluginStates(), system.plugins.getPluginStates())
+        self.assertEqual([plugin.uniquename for plugin in restored.plugins.getOptimalLoadOrder()],
+                         [plugin.uniquename for plugin in system.plugins.getOptimalLoadOrder()])
+        self.assertEqual(restored.events.fire("State")[1], {"snapbase" : "changed and restored", "snapuser" : "loaded"})
+        self.assertEqual(restored.events.getTables(), system.events.getTables())
+
+    def testMismatchLoadsFromScratch(self):
+        snapshot = self.boot().snapshot()
+        self.write("snapuser", [[]], False, 5)
+        restored = self.boot(snapshot)
+        base = restored.plugins.getPlugin("snapbase")
+        self.assertEqual((base.loads, base.restores), (1, 0))
+        self.assertEqual(restored.events.fire("State")[1], {"snapbase" : "loaded", "snapuser" : "loaded"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+""" Tracing of fires, handler calls and signalAll fan-outs: the Tracer behind
+System.enableTracing(). """
+
+import os
+import threading
+from collections import deque
+from core import wallClock, isCoroutineFunction, IsolatedCall
+
+class Tracer:
+    """ Records spans of fires, of the handler calls they make, of the fires those make in
+    turn and of signalAll fan-outs, into a ring buffer of the last capacity spans. Export
+    them with toChromeTrace() and load the file in chrome://tracing or Perfetto.
+    Sampling is per call tree: one in every sampleEvery fires (or signalAll) made outside
+    any other is recorded, along with everything it calls on the same thread. Handlers
+    running on other threads, as under post() or fireAsync(), and fireFast() calls are
+    only recorded as part of a sampled tree of their own thread.
+    Use System.enableTracing() rather than setting it up by hand. """
+    def __init__(self, sampleEvery=1, capacity=65536):
+        self.sampleEvery = sampleEvery
+        # (name, category, start, duration, thread ident, args), oldest first.
+        self._spans = deque(maxlen=capacity)
+        self._roots = 0
+        # depth of the fires the thread is in, whether its tree is sampled, and whether
+        # the next fire() is the one traceFire() makes, not to be traced again.
+        self._local = threading.local()
+    
+    def owns(self):
+        """ Whether EventManager.fire is to hand the call over to traceFire() """
+        local = self._local
+        if getattr(local, "reentering", False):
+            local.reentering = False
+            return False
+        return True
+    
+    def _enter(self):
+        """ Opens a level of the call tree of this thread. Returns the depth it was at. """
+        local = self._local
+        depth = getattr(local, "depth", 0)
+        if not depth:
+            self._roots += 1
+            local.sampled = (self._roots - 1) % self.sampleEvery == 0
+        local.depth = depth + 1
+        return depth
+    
+    def _sampled(self):
+        local = self._local
+        return getattr(local, "depth", 0) and local.sampled
+    
+    def record(self, name, category, began, duration, args=None):
+        self._spans.append((name, category, began, duration, threading.current_thread().ident, args))
+    
+    def traceFire(self, events, eventname, signalAll, fireMode, kwargs):
+        """ Fires the event through events.fire, recording its span if its tree is sampled """
+        depth = self._enter()
+        try:
+            self._local.reentering = True
+            if not self._local.sampled:
+                return events.fire(eventname, signalAll, fireMode, **kwargs)
+            began = wallClock()
+            result = events.fire(eventname, signalAll, fireMode, **kwargs)
+            self.record(eventname, "fire", began, wallClock() - began,
+                        {"fireMode" : fireMode, "signalAll" : bool(signalAll), "succeeded" : bool(result and result[0])})
+            return result
+        finally:
+            self._local.reentering = False
+            self._local.depth = depth
+    
+    def traceSignalAll(self, plugins, args, signal):
+        """ Calls signal(plugin) for every plugin, recording a span for the fan-out and one per
+        plugin if the tree is sampled """
+        depth = self._enter()
+        try:
+            if not self._local.sampled:
+                for plugin in plugins:
+                    signal(plugin)
+                return
+            began = wallClock()
+            for plugin in plugins:
+                called = wallClock()
+                signal(plugin)
+                self.record(plugin.uniquename, "signal", called, wallClock() - called)
+            self.record("signalAll", "signal", began, wallClock() - began, {"plugins" : len(plugins), "event" : args.get("event")})
+        finally:
+            self._local.depth = depth
+    
+    def wrapHandler(self, eventname, uniquename, func):
+        """ Returns func wrapped to record its span when called within a sampled tree.
+        Coroutine functions and calls into isolated plugins are returned as they are. """
+        if isinstance(func, IsolatedCall) or isCoroutineFunction(func):
+            return func
+        sampled = self._sampled
+        record = self.record
+        arguments = {"event" : eventname}
+        def traced(kwargs):
+            if not sampled():
+                return func(kwargs)
+            began = wallClock()
+            try:
+                return func(kwargs)
+            finally:
+                record(uniquename, "handler", began, wallClock() - began, arguments)
+        return traced
+    
+    def spans(self):
+        """ Returns the spans held, oldest first, as (name, category, start, duration, thread ident, args) """
+        return list(self._spans)
+    
+    def clear(self):
+        self._spans.clear()
+    
+    def toChromeTrace(self):
+        """ Returns the spans held in the Chrome trace event format, as a dict """
+        pid = os.getpid()
+        events = []
+        threads = set()
+        for name, category, began, duration, thread, args in list(self._spans):
+            event = {"name" : name, "cat" : category, "ph" : "X", "pid" : pid, "tid" : thread,
+                     "ts" : began * 1e6, "dur" : duration * 1e6}
+            if args:
+                event["args"] = args
+            events.append(event)
+            threads.add(thread)
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        for thread in threads:
+            events.append({"name" : "thread_name", "ph" : "M", "pid" : pid, "tid" : thread,
+                           "args" : {"name" : names.get(thread, str(thread))}})
+        return {"traceEvents" : events, "displayTimeUnit" : "ms"}
+    
+    def dumpChromeTrace(self, path=None, indent=None):
+        """ Returns the Chrome trace as JSON text, also writing it to path if given """
+        import json
+        text = json.dumps(self.toChromeTrace(), indent=indent)
+        if path is not None:
+            f = open(path, "w")
+            try:
+                f.write(text)
+            finally:
+                f.close()
+        return text